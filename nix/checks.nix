@@ -383,7 +383,10 @@ in
 
   pytest =
     let
-      pytestPython = pkgs.python3.withPackages (ps: [ ps.pytest ]);
+      pytestPython = pkgs.python3.withPackages (ps: [
+        ps.aiohttp
+        ps.pytest
+      ]);
     in
     pkgs.runCommand "pytest"
       {
@@ -400,6 +403,27 @@ in
         touch $out
       '';
 
+  # Offline download benchmark against a local origin; the budgets are loose
+  # enough for shared CI runners and catch gross hot-loop regressions.
+  model-downloader-bench =
+    let
+      benchPython = pkgs.python3.withPackages (ps: [ ps.aiohttp ]);
+    in
+    pkgs.runCommand "model-downloader-bench"
+      {
+        nativeBuildInputs = [ benchPython ];
+        src = source;
+      }
+      ''
+        cp -r $src source
+        chmod -R u+w source
+        cd source
+        ${benchPython}/bin/python \
+          src/custom_nodes/model_downloader/bench_model_downloader.py \
+          --count 4 --size 128 --max-cpu-per-gb 10 --max-loop-lag-ms 250
+        touch $out
+      '';
+
   ruff-check =
     pkgs.runCommand "ruff-check"
       {
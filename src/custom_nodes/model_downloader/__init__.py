@@ -3,7 +3,7 @@
 
 from __future__ import annotations
 
-import importlib.util
+import importlib
 import logging
 import os
 import sys
@@ -11,6 +11,8 @@ from collections.abc import Awaitable, Callable
 from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
+    from types import ModuleType
+
     from aiohttp import web
 
 # Setup logging
@@ -20,94 +22,188 @@ logger = logging.getLogger("model_downloader")
 NODE_CLASS_MAPPINGS: dict[str, type[Any]] = {}
 NODE_DISPLAY_NAME_MAPPINGS: dict[str, str] = {}
 
-# Register the web extension directory for ComfyUI to find the JavaScript files
-WEB_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "js")
-
-# Make sure WEB_DIRECTORY exists
-if not os.path.exists(WEB_DIRECTORY):
-    os.makedirs(WEB_DIRECTORY, exist_ok=True)
-
-# Add the current directory to the path to ensure we can import our modules
 current_dir = os.path.dirname(os.path.realpath(__file__))
-if current_dir not in sys.path:
-    sys.path.insert(0, current_dir)
+
+# Register the web extension directory (shipped with the node) for ComfyUI to
+# find the JavaScript files
+WEB_DIRECTORY = os.path.join(current_dir, "js")
 
 # Type aliases for handler functions
 DownloadHandler = Callable[["web.Request"], Awaitable["web.Response"]]
 
-# Import the model_downloader_patch module and get handler functions
-_download_model_handler: DownloadHandler | None = None
-_get_download_progress_handler: DownloadHandler | None = None
-_list_downloads_handler: DownloadHandler | None = None
-_resolve_folder_handler: DownloadHandler | None = None
-_list_folders_handler: DownloadHandler | None = None
+# The downloader itself (model_downloader_patch, its sibling modules and
+# aiohttp's client) is only imported when first needed, by a request or by
+# interrupted downloads waiting to resume, so loading this node at ComfyUI
+# startup costs little more than registering its routes.
+_patch: ModuleType | None = None
+_patch_unavailable = False
 
-try:
-    spec = importlib.util.spec_from_file_location(
-        "model_downloader_patch", os.path.join(current_dir, "model_downloader_patch.py")
-    )
-    if spec is None or spec.loader is None:
-        msg = "Failed to load model_downloader_patch module"
-        raise ImportError(msg)
-
-    model_downloader_patch = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(model_downloader_patch)
-
-    # Get the handler functions
-    _download_model_handler = model_downloader_patch.download_model
-    _get_download_progress_handler = model_downloader_patch.get_download_progress
-    _list_downloads_handler = model_downloader_patch.list_downloads
-    _resolve_folder_handler = model_downloader_patch.resolve_folder
-    _list_folders_handler = model_downloader_patch.list_folders
 
+def _load_patch() -> ModuleType | None:
+    """Import model_downloader_patch on first use and start its background tasks.
+
+    Returns None if it cannot be imported; the error is logged once.
+    """
+    global _patch, _patch_unavailable  # noqa: PLW0603
+    if _patch is not None or _patch_unavailable:
+        return _patch
+
+    try:
+        _patch = _import_sibling("model_downloader_patch")
+    except ImportError:
+        _patch_unavailable = True
+        logger.exception("Error importing model_downloader_patch")
+        return None
     logger.info("Successfully imported model downloader module")
-except ImportError:
-    logger.exception("Error importing model_downloader_patch")
+
+    # Pick up downloads that were still running when ComfyUI last stopped, and
+    # start indexing model files for folder resolution and watching the
+    # event loop for stalls
+    try:
+        _patch.resume_interrupted_downloads()
+        _patch.start_filename_index()
+        _patch.start_loop_monitor()
+    except AttributeError:
+        logger.debug("PromptServer loop not available, not starting background tasks")
+    return _patch
+
+
+def _import_sibling(name: str) -> ModuleType:
+    """Import one of this node's modules; they import each other by name."""
+    if current_dir not in sys.path:
+        sys.path.insert(0, current_dir)
+    return importlib.import_module(name)
+
+
+async def _delegate(name: str, request: Any) -> Any:
+    """Call model_downloader_patch's handler *name*, or report it unavailable."""
+    patch = _load_patch()
+    if patch is None:
+        from aiohttp import web
+
+        return web.json_response({"success": False, "error": "Model downloader not available"})
+    return await getattr(patch, name)(request)
+
+
+async def _on_cleanup(app: Any) -> None:
+    """Close the downloader's shared HTTP session, if it was ever loaded."""
+    if _patch is not None:
+        await _patch.on_cleanup(app)
+
+
+def _has_running_journals() -> bool:
+    """Whether a resume journal shows a download running at the last shutdown.
+
+    Looks where model_downloader_patch keeps them (``_journal_dir``) without
+    importing it. Journals of failed downloads do not count: those only
+    resume when the file is requested again.
+    """
+    state_dir = os.getenv("MODEL_DOWNLOADER_STATE_DIR")
+    if not state_dir:
+        try:
+            import folder_paths  # type: ignore[import-not-found]
+
+            state_dir = os.path.join(folder_paths.get_user_directory(), "model_downloader")
+        except (ImportError, AttributeError):
+            return False
+    journal_dir = os.path.join(state_dir, "journal")
+    if not os.path.isdir(journal_dir):
+        return False
+    journal = _import_sibling("model_downloader_journal")
+    try:
+        entries = journal.list_journals(journal_dir)
+    except OSError:
+        return False
+    return any(entry.get("state") == journal.STATE_RUNNING for entry in entries)
 
 
 async def download_model(request: Any) -> Any:
     """Download model handler - delegates to loaded module or returns error."""
-    if _download_model_handler is not None:
-        return await _download_model_handler(request)
-    from aiohttp import web
-
-    return web.json_response({"success": False, "error": "Model downloader not available"})
+    return await _delegate("download_model", request)
 
 
 async def get_download_progress(request: Any) -> Any:
     """Get download progress handler - delegates to loaded module or returns error."""
-    if _get_download_progress_handler is not None:
-        return await _get_download_progress_handler(request)
-    from aiohttp import web
-
-    return web.json_response({"success": False, "error": "Model downloader not available"})
+    return await _delegate("get_download_progress", request)
 
 
 async def list_downloads(request: Any) -> Any:
     """List downloads handler - delegates to loaded module or returns error."""
-    if _list_downloads_handler is not None:
-        return await _list_downloads_handler(request)
-    from aiohttp import web
+    return await _delegate("list_downloads", request)
+
 
-    return web.json_response({"success": False, "error": "Model downloader not available"})
+async def get_download_history(request: Any) -> Any:
+    """Download history handler - delegates to loaded module or returns error."""
+    return await _delegate("get_download_history", request)
 
 
 async def resolve_folder(request: Any) -> Any:
     """Resolve folder handler - delegates to loaded module or returns error."""
-    if _resolve_folder_handler is not None:
-        return await _resolve_folder_handler(request)
-    from aiohttp import web
+    return await _delegate("resolve_folder", request)
+
+
+async def resolve_folders(request: Any) -> Any:
+    """Batch resolve folder handler - delegates to loaded module or returns error."""
+    return await _delegate("resolve_folders", request)
+
+
+async def prefetch_workflow(request: Any) -> Any:
+    """Workflow prefetch handler - delegates to loaded module or returns error."""
+    return await _delegate("prefetch_workflow", request)
+
+
+async def probe_urls(request: Any) -> Any:
+    """Remote file probe handler - delegates to loaded module or returns error."""
+    return await _delegate("probe_urls", request)
+
+
+async def subscribe_progress(request: Any) -> Any:
+    """Progress subscription handler - delegates to loaded module or returns error."""
+    return await _delegate("subscribe_progress", request)
+
+
+async def get_metrics(request: Any) -> Any:
+    """Metrics handler - delegates to loaded module or returns error."""
+    return await _delegate("get_metrics", request)
+
+
+async def get_loop_lag(request: Any) -> Any:
+    """Event-loop lag handler - delegates to loaded module or returns error."""
+    return await _delegate("get_loop_lag", request)
 
-    return web.json_response({"success": False, "error": "Model downloader not available"})
+
+async def get_bandwidth_limits(request: Any) -> Any:
+    """Bandwidth limits handler - delegates to loaded module or returns error."""
+    return await _delegate("get_bandwidth_limits", request)
+
+
+async def set_bandwidth_limits(request: Any) -> Any:
+    """Bandwidth limits update handler - delegates to loaded module or returns error."""
+    return await _delegate("set_bandwidth_limits", request)
 
 
 async def list_folders(request: Any) -> Any:
     """List model folders handler - delegates to loaded module or returns error."""
-    if _list_folders_handler is not None:
-        return await _list_folders_handler(request)
-    from aiohttp import web
-
-    return web.json_response({"success": False, "error": "Model downloader not available"})
+    return await _delegate("list_folders", request)
+
+
+# Endpoints served by this node: (router method, path, handler)
+_ROUTES: list[tuple[str, str, DownloadHandler]] = [
+    ("add_post", "/model-downloader/download", download_model),
+    ("add_get", "/model-downloader/progress/{download_id}", get_download_progress),
+    ("add_get", "/model-downloader/downloads", list_downloads),
+    ("add_get", "/model-downloader/history", get_download_history),
+    ("add_get", "/model-downloader/resolve-folder/{filename}", resolve_folder),
+    ("add_post", "/model-downloader/resolve-folders", resolve_folders),
+    ("add_post", "/model-downloader/prefetch", prefetch_workflow),
+    ("add_post", "/model-downloader/probe", probe_urls),
+    ("add_post", "/model-downloader/subscribe", subscribe_progress),
+    ("add_get", "/model-downloader/metrics", get_metrics),
+    ("add_get", "/model-downloader/loop-lag", get_loop_lag),
+    ("add_get", "/model-downloader/bandwidth", get_bandwidth_limits),
+    ("add_post", "/model-downloader/bandwidth", set_bandwidth_limits),
+    ("add_get", "/model-downloader/folders", list_folders),
+]
 
 
 def setup_js_api(app: Any, *args: Any, **kwargs: Any) -> Any:
@@ -122,52 +218,31 @@ def setup_js_api(app: Any, *args: Any, **kwargs: Any) -> Any:
     Returns:
         The modified app instance.
     """
-    try:
-        from aiohttp import web
-    except ImportError:
-        logger.exception("Error importing web from aiohttp")
-        return app
-
     logger.info("Registering model downloader API endpoints")
 
-    # Define route patterns to check for
-    route_patterns = [
-        "/model-downloader/download",
-        "/model-downloader/progress/",
-        "/model-downloader/downloads",
-        "/model-downloader/resolve-folder/",
-        "/model-downloader/folders",
-    ]
-
-    # Check if any of our routes already exist
+    # Check if any of our routes already exist; a route's pattern is its path
+    # up to the first parameter
     existing_routes: set[str] = set()
     for route in app.router.routes():
         route_str = str(route)
-        for pattern in route_patterns:
+        for _adder, path, _handler in _ROUTES:
+            pattern = path.split("{", 1)[0]
             if pattern in route_str:
                 existing_routes.add(pattern)
                 logger.info("Found existing route matching %s", pattern)
 
     # Register each endpoint if it doesn't already exist
-    if "/model-downloader/download" not in existing_routes:
-        app.router.add_post("/model-downloader/download", download_model)
-        logger.info("Registered /model-downloader/download endpoint")
-
-    if "/model-downloader/progress/" not in existing_routes:
-        app.router.add_get("/model-downloader/progress/{download_id}", get_download_progress)
-        logger.info("Registered /model-downloader/progress endpoint")
-
-    if "/model-downloader/downloads" not in existing_routes:
-        app.router.add_get("/model-downloader/downloads", list_downloads)
-        logger.info("Registered /model-downloader/downloads endpoint")
-
-    if "/model-downloader/resolve-folder/" not in existing_routes:
-        app.router.add_get("/model-downloader/resolve-folder/{filename}", resolve_folder)
-        logger.info("Registered /model-downloader/resolve-folder endpoint")
-
-    if "/model-downloader/folders" not in existing_routes:
-        app.router.add_get("/model-downloader/folders", list_folders)
-        logger.info("Registered /model-downloader/folders endpoint")
+    for adder, path, handler in _ROUTES:
+        if path.split("{", 1)[0] not in existing_routes:
+            getattr(app.router, adder)(path, handler)
+            logger.info("Registered %s endpoint", path.split("/{", 1)[0])
+
+    # Close the downloader's shared HTTP session when the server shuts down
+    if _on_cleanup not in app.on_cleanup:
+        try:
+            app.on_cleanup.append(_on_cleanup)
+        except RuntimeError:
+            logger.debug("Application already started, cannot register cleanup handler")
 
     logger.info("Model downloader API endpoints registered successfully")
     return app
@@ -185,5 +260,9 @@ try:
         and hasattr(PromptServer.instance, "app")
     ):
         setup_js_api(PromptServer.instance.app)
+        # Downloads interrupted by the last shutdown resume once the server's
+        # loop runs, which needs the downloader loaded before any request
+        if _has_running_journals():
+            PromptServer.instance.loop.call_soon(_load_patch)
 except (ImportError, AttributeError):
     logger.debug("PromptServer not available, will register via setup_js_api")
@@ -0,0 +1,338 @@
+"""Offline throughput benchmark for the model downloader.
+
+Starts a local aiohttp origin in a child process that serves generated files,
+then queues downloads of them through the downloader's own scheduler, so
+``download_file`` runs end to end: first GET, segmenting, the chunk writer,
+SHA-256, journaling and websocket events. Reports throughput, CPU time per
+GB, peak RSS, event-loop lag and the websocket event rate. Nothing leaves the
+machine, so CI can run it to catch regressions in the download hot loop::
+
+    python bench_model_downloader.py --count 10 --size 256
+    python bench_model_downloader.py --redirect --latency 50 --no-ranges
+    python bench_model_downloader.py --max-cpu-per-gb 8 --max-loop-lag-ms 250
+
+The budget options make the run fail when a figure is out of bounds. ComfyUI's
+``folder_paths`` and ``server`` modules are replaced by minimal stand-ins;
+aiohttp must be installed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import types
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from multiprocessing.connection import Connection
+
+# File contents repeat this block, so any byte range can be generated cheaply
+# and the expected SHA-256 of a file is known without storing it.
+_BLOCK = random.Random(0).randbytes(1024 * 1024)
+_DOUBLE_BLOCK = memoryview(_BLOCK * 2)
+_WRITE_BYTES = 256 * 1024
+_ETAG = '"bench-v1"'
+
+_TERMINAL = frozenset({"completed", "skipped", "error"})
+_MB = 1024 * 1024
+
+
+def _generate(start: int, end: int) -> Iterator[memoryview]:
+    """Bytes ``start..end`` (exclusive) of a generated file, in pieces."""
+    position = start
+    while position < end:
+        offset = position % len(_BLOCK)
+        size = min(_WRITE_BYTES, end - position, len(_BLOCK))
+        yield _DOUBLE_BLOCK[offset : offset + size]
+        position += size
+
+
+def _expected_sha256(size: int) -> str:
+    sha = hashlib.sha256()
+    for piece in _generate(0, size):
+        sha.update(piece)
+    return sha.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Origin (child process)
+# ---------------------------------------------------------------------------
+
+
+def _run_origin(conn: Connection, options: dict[str, Any]) -> None:
+    """Serve ``/files/<name>`` (and ``/redirect/<name>``) until terminated."""
+    from aiohttp import web  # noqa: PLC0415 - the child only needs aiohttp
+
+    size = options["size"]
+    latency = options["latency"]
+
+    async def serve_file(request: web.Request) -> web.StreamResponse:
+        if latency:
+            await asyncio.sleep(latency)
+        headers = {"ETag": _ETAG, "Content-Type": "application/octet-stream"}
+        start, end, status = 0, size, 200
+        if options["ranges"]:
+            headers["Accept-Ranges"] = "bytes"
+            requested = request.http_range
+            if request.headers.get("Range") and request.headers.get("If-Range") in {None, _ETAG}:
+                start = requested.start or 0
+                end = size if requested.stop is None else min(requested.stop, size)
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        headers["Content-Length"] = str(end - start)
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+        if request.method == "HEAD":
+            return response
+        # The downloader drops its first GET once that segment is done
+        with contextlib.suppress(ConnectionError):
+            for piece in _generate(start, end):
+                await response.write(piece)
+            await response.write_eof()
+        return response
+
+    async def redirect(request: web.Request) -> web.StreamResponse:
+        if latency:
+            await asyncio.sleep(latency)
+        raise web.HTTPFound(f"/files/{request.match_info['name']}")
+
+    async def main() -> None:
+        app = web.Application()
+        app.router.add_get("/files/{name}", serve_file)
+        app.router.add_get("/redirect/{name}", redirect)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        conn.send(runner.addresses[0][1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+# ---------------------------------------------------------------------------
+# Downloader (this process)
+# ---------------------------------------------------------------------------
+
+
+class _BenchServer:
+    """Stand-in for ``PromptServer.instance`` that counts websocket events.
+
+    ``sent`` is set whenever an event goes out, status changes included.
+    """
+
+    def __init__(self) -> None:
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.sockets = {"bench": None}
+        self.events: dict[str, int] = {}
+        self.sent = asyncio.Event()
+
+    def send_sync(self, event: str, _data: Any, _sid: str | None = None) -> None:
+        self.events[event] = self.events.get(event, 0) + 1
+        self.sent.set()
+
+
+def _load_downloader(args: argparse.Namespace, work_dir: str) -> tuple[Any, _BenchServer]:
+    """Import the downloader with ComfyUI stand-ins and benchmark settings."""
+    model_dir = os.path.join(work_dir, "models")
+    os.makedirs(model_dir)
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.get_folder_paths = lambda _folder: [model_dir]  # type: ignore[attr-defined]
+    server = _BenchServer()
+    server_module = types.ModuleType("server")
+    server_module.PromptServer = types.SimpleNamespace(instance=server)  # type: ignore[attr-defined]
+    sys.modules["folder_paths"] = folder_paths
+    sys.modules["server"] = server_module
+
+    os.environ["MODEL_DOWNLOADER_STATE_DIR"] = os.path.join(work_dir, "state")
+    os.environ["MODEL_DOWNLOADER_MAX_ACTIVE"] = str(args.count)
+    os.environ["MODEL_DOWNLOADER_HOST_LIMITS"] = f"127.0.0.1={args.count}"
+    os.environ["MODEL_DOWNLOADER_MIN_FREE_MB"] = "0"
+    if args.segments is not None:
+        os.environ["MODEL_DOWNLOADER_SEGMENTS"] = str(args.segments)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import model_downloader_patch  # noqa: PLC0415 - needs the stand-ins above
+
+    if not args.verbose:
+        logging.getLogger("model_downloader").setLevel(logging.WARNING)
+    return model_downloader_patch, server
+
+
+async def _sample_loop_lag(samples: list[float], interval: float = 0.01) -> None:
+    """Record how late the loop wakes a sleeping task, in seconds."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - started - interval)
+
+
+async def _download_all(mdp: Any, server: _BenchServer, base_url: str, count: int) -> list[dict]:
+    server.loop = asyncio.get_running_loop()
+    download_ids = []
+    for index in range(count):
+        filename = f"model{index}.safetensors"
+        download_id, error = mdp._register_download(
+            f"{base_url}/{filename}", "checkpoints", filename, mdp.PRIORITY_NORMAL
+        )
+        if download_id is None:
+            raise RuntimeError(error)
+        download_ids.append(download_id)
+    while any(mdp.active_downloads[d].status not in _TERMINAL for d in download_ids):
+        server.sent.clear()
+        await server.sent.wait()
+    await mdp.close_session()
+    return [mdp.active_downloads[d].as_dict() for d in download_ids]
+
+
+async def _measure(mdp: Any, server: _BenchServer, base_url: str, count: int) -> dict[str, Any]:
+    lag: list[float] = []
+    sampler = asyncio.ensure_future(_sample_loop_lag(lag))
+    # The downloader's own monitor names the functions behind any stalls
+    monitor = asyncio.ensure_future(mdp._loop_monitor.run())
+    before, started = resource.getrusage(resource.RUSAGE_SELF), time.perf_counter()
+    try:
+        downloads = await _download_all(mdp, server, base_url, count)
+    finally:
+        sampler.cancel()
+        monitor.cancel()
+    elapsed = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return {
+        "downloads": downloads,
+        "elapsed": elapsed,
+        "cpu": cpu,
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        "peak_rss": after.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+        "lag": lag or [0.0],
+        "stalls": mdp._loop_monitor.snapshot()["stalls"],
+    }
+
+
+def _report(args: argparse.Namespace, run: dict[str, Any], server: _BenchServer) -> dict:
+    total = args.count * args.size * _MB
+    lag = sorted(run["lag"])
+    events = sum(server.events.values())
+    return {
+        "downloads": args.count,
+        "size_mb": args.size,
+        "segments": max(download.get("segments", 1) for download in run["downloads"]),
+        "ranges": not args.no_ranges,
+        "redirect": args.redirect,
+        "latency_ms": args.latency,
+        "wall_s": round(run["elapsed"], 3),
+        "throughput_mb_s": round(total / _MB / run["elapsed"], 1),
+        "cpu_s": round(run["cpu"], 3),
+        "cpu_s_per_gb": round(run["cpu"] / (total / 1024**3), 3),
+        "peak_rss_mb": round(run["peak_rss"] / _MB, 1),
+        "loop_lag_p50_ms": round(statistics.median(lag) * 1000, 2),
+        "loop_lag_p99_ms": round(lag[int(0.99 * (len(lag) - 1))] * 1000, 2),
+        "loop_lag_max_ms": round(lag[-1] * 1000, 2),
+        "loop_stalls": run["stalls"]["count"],
+        "stall_seconds": {
+            stall["location"]: stall["seconds"] for stall in run["stalls"]["locations"]
+        },
+        "ws_events": events,
+        "ws_events_per_s": round(events / run["elapsed"], 1),
+    }
+
+
+def _check(args: argparse.Namespace, run: dict[str, Any], report: dict) -> list[str]:
+    """Failed downloads, wrong data and exceeded budgets, as messages."""
+    problems = []
+    expected = _expected_sha256(args.size * _MB)
+    for download in run["downloads"]:
+        if download["status"] != "completed":
+            problems.append(f"{download['filename']}: {download['status']} {download.get('error')}")
+        elif download.get("sha256") != expected:
+            problems.append(f"{download['filename']}: wrong sha256 {download.get('sha256')}")
+    budgets = [
+        ("cpu_s_per_gb", args.max_cpu_per_gb, "CPU seconds per GB"),
+        ("loop_lag_p99_ms", args.max_loop_lag_ms, "p99 loop lag (ms)"),
+    ]
+    for key, limit, label in budgets:
+        if limit is not None and report[key] > limit:
+            problems.append(f"{label} {report[key]} exceeds budget {limit}")
+    if args.min_throughput is not None and report["throughput_mb_s"] < args.min_throughput:
+        problems.append(
+            f"throughput {report['throughput_mb_s']} MB/s below budget {args.min_throughput}"
+        )
+    return problems
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--count", type=int, default=10, help="concurrent downloads")
+    parser.add_argument("--size", type=int, default=256, help="size of each file in MB")
+    parser.add_argument("--segments", type=int, help="Range connections per download")
+    parser.add_argument("--no-ranges", action="store_true", help="origin ignores Range")
+    parser.add_argument("--redirect", action="store_true", help="reach files via a 302")
+    parser.add_argument("--latency", type=float, default=0.0, help="ms before each response")
+    parser.add_argument("--dir", help="where to write downloads (default: system temp)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the downloader's log")
+    parser.add_argument("--max-cpu-per-gb", type=float, help="fail above this CPU s/GB")
+    parser.add_argument("--max-loop-lag-ms", type=float, help="fail above this p99 lag")
+    parser.add_argument("--min-throughput", type=float, help="fail below this many MB/s")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix="model-downloader-bench-", dir=args.dir)
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    origin = context.Process(
+        target=_run_origin,
+        args=(
+            sender,
+            {
+                "size": args.size * _MB,
+                "ranges": not args.no_ranges,
+                "latency": args.latency / 1000,
+            },
+        ),
+        daemon=True,
+    )
+    origin.start()
+    try:
+        if not receiver.poll(30):
+            print("Origin did not start", file=sys.stderr)
+            return 1
+        port = receiver.recv()
+        route = "redirect" if args.redirect else "files"
+        mdp, server = _load_downloader(args, work_dir)
+        run = asyncio.run(_measure(mdp, server, f"http://127.0.0.1:{port}/{route}", args.count))
+    finally:
+        origin.terminate()
+        origin.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = _report(args, run, server)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:>18}: {value}")
+    problems = _check(args, run, report)
+    for problem in problems:
+        print(f"FAIL: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,6 +16,7 @@ function registerMessageHandler() {
                 window.api.reportedUnknownMessageTypes = new Set();
             }
             window.api.reportedUnknownMessageTypes.add('model_download_progress');
+            window.api.reportedUnknownMessageTypes.add('model_download_progress_batch');
         }
         
         // Method 2: Using API extension system (newer ComfyUI versions)
@@ -29,6 +30,11 @@ function registerMessageHandler() {
                             window.modelDownloader.handleMessageEvent(data);
                         }
                     });
+                    window.api.addEventListener("model_download_progress_batch", function(data) {
+                        if (window.modelDownloader && typeof window.modelDownloader.handleBatchEvent === 'function') {
+                            window.modelDownloader.handleBatchEvent(data);
+                        }
+                    });
                 }
             });
         }
@@ -40,6 +46,11 @@ function registerMessageHandler() {
                     window.modelDownloader.handleMessageEvent(event);
                 }
             });
+            window.app.registerMessageHandler('model_download_progress_batch', function(event) {
+                if (window.modelDownloader && typeof window.modelDownloader.handleBatchEvent === 'function') {
+                    window.modelDownloader.handleBatchEvent(event);
+                }
+            });
         }
         
         // Method 4: Direct WebSocket patching (fallback for older ComfyUI versions)
@@ -73,6 +84,10 @@ function registerMessageHandler() {
                             if (window.modelDownloader && typeof window.modelDownloader.handleMessageEvent === 'function') {
                                 window.modelDownloader.handleMessageEvent(message);
                             }
+                        } else if (message.type === 'model_download_progress_batch') {
+                            if (window.modelDownloader && typeof window.modelDownloader.handleBatchEvent === 'function') {
+                                window.modelDownloader.handleBatchEvent(message);
+                            }
                         }
                     } catch (e) {
                         // Ignore JSON parse errors
@@ -146,11 +146,19 @@
       bar.classList.add('fail');
       pctEl.textContent = 'Failed';
       speedEl.textContent = data.error || '';
+    } else if (data.status === 'queued') {
+      pctEl.textContent = data.queue_position ? `Queued (#${data.queue_position})` : 'Queued';
+      speedEl.textContent = '';
     } else {
       const pct = Math.round(data.percent || 0);
       bar.style.width = pct + '%';
       pctEl.textContent = pct + '%';
-      speedEl.textContent = data.speed ? (data.speed + ' MB/s') : '';
+      if (data.retry_at) {
+        const wait = Math.max(0, Math.round(data.retry_at - Date.now() / 1000));
+        speedEl.textContent = `${data.retry_reason || 'Error'}, retrying in ${wait}s`;
+      } else {
+        speedEl.textContent = data.speed ? (data.speed + ' MB/s') : '';
+      }
     }
   }
 
@@ -305,22 +313,52 @@
     return '';
   }
 
-  // Ask the backend to resolve which folder a filename belongs to
-  async function resolveDirectoryFromBackend(filename) {
+  // Lookups requested in the same tick (e.g. "Download all" on a workflow)
+  // are sent to the backend as one batch: filename → [resolve callbacks]
+  let pendingResolves = null;
+
+  async function flushResolveBatch() {
+    const batch = pendingResolves;
+    pendingResolves = null;
+    const filenames = [...batch.keys()];
+    const folders = {};
     try {
-      const resp = await fetch(`/model-downloader/resolve-folder/${encodeURIComponent(filename)}`);
+      const resp = await fetch('/model-downloader/resolve-folders', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filenames })
+      });
       if (resp.ok) {
         const data = await resp.json();
-        if (data.success && data.folder) {
-          console.log('[MODEL_DOWNLOADER] Backend resolved folder:', data.folder, 'for', filename);
-          dirCache[filename] = data.folder;
-          return data.folder;
+        if (data.success && Array.isArray(data.files)) {
+          for (const file of data.files) {
+            if (file.exists && file.folder) folders[file.filename] = file.folder;
+          }
         }
       }
     } catch (e) {
-      console.warn('[MODEL_DOWNLOADER] Backend resolve-folder failed:', e);
+      console.warn('[MODEL_DOWNLOADER] Backend resolve-folders failed:', e);
+    }
+    for (const filename of filenames) {
+      const folder = folders[filename] || '';
+      if (folder) {
+        console.log('[MODEL_DOWNLOADER] Backend resolved folder:', folder, 'for', filename);
+        dirCache[filename] = folder;
+      }
+      for (const resolve of batch.get(filename)) resolve(folder);
     }
-    return '';
+  }
+
+  // Ask the backend to resolve which folder a filename belongs to
+  function resolveDirectoryFromBackend(filename) {
+    return new Promise(resolve => {
+      if (!pendingResolves) {
+        pendingResolves = new Map();
+        setTimeout(flushResolveBatch, 0);
+      }
+      if (!pendingResolves.has(filename)) pendingResolves.set(filename, []);
+      pendingResolves.get(filename).push(resolve);
+    });
   }
 
   // Combined directory detection: backend API first, cache second, URL third, default last
@@ -386,6 +424,55 @@
     }
   }
 
+  // Progress batches carry every download that changed during one tick
+  function handleBatchEvent(event) {
+    try {
+      let batch = event.data || event;
+      if (batch && batch.type === 'model_download_progress_batch' && batch.data) {
+        batch = batch.data;
+      }
+      if (batch && batch.detail) {
+        batch = batch.detail.data || batch.detail;
+      }
+      if (!batch || !Array.isArray(batch.downloads)) return;
+      for (const download of batch.downloads) handleMessageEvent(download);
+    } catch (error) {
+      console.error('[MODEL_DOWNLOADER] Error handling progress batch:', error);
+    }
+  }
+
+  // ── Progress subscription ────────────────────────────────────────────
+  // Each tab only follows the downloads it started, instead of receiving
+  // progress for every download of every open tab
+  let progressSubscribed = false;
+
+  function getClientId() {
+    return window.api?.clientId || window.app?.api?.clientId ||
+      window.sessionStorage?.getItem('clientId') || null;
+  }
+
+  async function subscribeToOwnDownloads() {
+    if (progressSubscribed) return;
+    const clientId = getClientId();
+    if (!clientId) return;
+    const downloads = window.modelDownloader?.activeDownloads || {};
+    const downloadIds = Object.keys(downloads).filter(id => downloads[id].client_id);
+    try {
+      const resp = await fetch('/model-downloader/subscribe', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ client_id: clientId, download_ids: downloadIds })
+      });
+      if (resp.ok) {
+        const data = await resp.json();
+        progressSubscribed = !!data.success;
+      }
+    } catch (e) {
+      // Without a subscription the tab keeps receiving every download
+      console.warn('[MODEL_DOWNLOADER] Progress subscription failed:', e);
+    }
+  }
+
   // ── Backend download API ─────────────────────────────────────────────
   async function downloadModelWithBackend(url, folder, filename, button) {
     const clientDownloadId = `${folder}_${filename}_${Date.now()}`;
@@ -406,7 +493,8 @@
     };
 
     try {
-      const jsonData = { url, folder, filename };
+      await subscribeToOwnDownloads();
+      const jsonData = { url, folder, filename, client_id: getClientId() };
       console.log('[MODEL_DOWNLOADER] Sending download request:', jsonData);
 
       const response = await fetch('/model-downloader/download', {
@@ -497,7 +585,8 @@
   // Expose to global scope
   window.modelDownloaderCore = {
     isTrustedDomain, downloadModelWithBackend, interceptBrowserDownloads,
-    initialize, handleMessageEvent, getOrCreateRow, updateRow,
+    initialize, handleMessageEvent, handleBatchEvent, subscribeToOwnDownloads,
+    getOrCreateRow, updateRow,
     scanMissingModelsPanel, detectDirectory, resolveDirectoryFromBackend,
     refreshKnownDirs, dirCache
   };
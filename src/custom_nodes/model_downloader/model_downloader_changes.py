@@ -0,0 +1,90 @@
+"""Version numbers for the download table, for delta polling.
+
+Every change to a download bumps a table-wide version and records it against
+that download, and a removal leaves a tombstone. A client that remembers the
+version of its last poll can then be sent just the downloads changed and
+removed since, or be parked until something changes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+
+# Removals remembered for delta clients; a client further behind than the
+# oldest of them is sent the full table again
+MAX_TOMBSTONES = 1000
+
+
+class ChangeTracker:
+    """Track which keys of a table changed after a given version.
+
+    Versions start from the current time in milliseconds rather than zero,
+    so a version a client kept across a server restart is older than any
+    the new process hands out and is answered with the full table.
+    """
+
+    def __init__(self, max_tombstones: int = MAX_TOMBSTONES) -> None:
+        self.version = time.time_ns() // 1_000_000
+        # Oldest version from which changes_since() is still complete
+        self._floor = self.version
+        self._max_tombstones = max_tombstones
+        # key -> version of its last change, in ascending version order
+        self._changed: dict[str, int] = {}
+        self._removed: dict[str, int] = {}
+        self._waiters: list[asyncio.Future[None]] = []
+
+    def touch(self, key: str) -> None:
+        """Record a change to *key*."""
+        self.version += 1
+        self._removed.pop(key, None)
+        self._changed.pop(key, None)
+        self._changed[key] = self.version
+        self._wake()
+
+    def remove(self, key: str) -> None:
+        """Record that *key* left the table."""
+        self.version += 1
+        self._changed.pop(key, None)
+        self._removed.pop(key, None)
+        self._removed[key] = self.version
+        if len(self._removed) > self._max_tombstones:
+            oldest = next(iter(self._removed))
+            self._floor = self._removed.pop(oldest)
+        self._wake()
+
+    def changes_since(self, since: int) -> tuple[list[str], list[str]] | None:
+        """Keys changed and removed after *since*, or None if it is unknown."""
+        if since < self._floor or since > self.version:
+            return None
+        return _newer_than(self._changed, since), _newer_than(self._removed, since)
+
+    async def wait(self, since: int, max_wait: float) -> None:
+        """Return once the version is past *since*, or after *max_wait* seconds."""
+        if self.version != since:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(waiter, max_wait)
+        finally:
+            with contextlib.suppress(ValueError):
+                self._waiters.remove(waiter)
+
+    def _wake(self) -> None:
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def _newer_than(versions: dict[str, int], since: int) -> list[str]:
+    keys: list[str] = []
+    for key, version in reversed(versions.items()):
+        if version <= since:
+            break
+        keys.append(key)
+    keys.reverse()
+    return keys
@@ -0,0 +1,86 @@
+"""SHA-256 digests of downloaded models.
+
+Every completed download records the digest computed while it streamed in,
+together with the file's size and mtime. A later request that names an
+expected hash can then decide to skip an existing file without reading it
+again, and a record whose file has since changed is ignored.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any
+
+logger = logging.getLogger("model_downloader")
+
+DIGESTS_VERSION = 1
+
+# Records are rewritten as a whole; serialise concurrent writers
+_lock = threading.Lock()
+
+
+def digests_path(state_dir: str) -> str:
+    return os.path.join(state_dir, "digests.json")
+
+
+def lookup_digest(state_dir: str, full_path: str) -> str | None:
+    """Return the recorded SHA-256 of *full_path* if the file is unchanged."""
+    record = _load(state_dir).get(full_path)
+    if record is None:
+        return None
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        return None
+    if record.get("size") != st.st_size or record.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    return record.get("sha256")
+
+
+def record_digest(state_dir: str, full_path: str, sha256: str) -> None:
+    """Remember *sha256* as the digest of *full_path* in its current state."""
+    st = os.stat(full_path)
+    with _lock:
+        records = _load(state_dir)
+        records[full_path] = {"sha256": sha256, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        # Drop records of files that no longer exist while rewriting anyway
+        records = {path: rec for path, rec in records.items() if os.path.exists(path)}
+        _save(state_dir, records)
+
+
+def file_sha256(path: str, block_size: int = 8 * 1024 * 1024) -> str:
+    """Hash an existing file; used once for files downloaded before digests."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _load(state_dir: str) -> dict[str, dict[str, Any]]:
+    path = digests_path(state_dir)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        logger.warning("Ignoring unreadable digest store %s", path)
+        return {}
+    if not isinstance(data, dict) or data.get("version") != DIGESTS_VERSION:
+        return {}
+    records = data.get("files")
+    return records if isinstance(records, dict) else {}
+
+
+def _save(state_dir: str, records: dict[str, dict[str, Any]]) -> None:
+    os.makedirs(state_dir, exist_ok=True)
+    target = digests_path(state_dir)
+    tmp = f"{target}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": DIGESTS_VERSION, "files": records}, f)
+    os.replace(tmp, target)
@@ -0,0 +1,122 @@
+"""Coalesced progress events for model downloads.
+
+Progress of every running download used to go out as its own websocket
+message, broadcast to every open tab, once a second. Progress is now
+collected per tick and sent as one batch holding only the downloads that
+changed, to the clients that subscribed to them. A change of status
+(queued, downloading, completed, error, ...) is still sent right away.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Iterable
+from typing import Any
+
+PROGRESS_EVENT = "model_download_progress"
+BATCH_EVENT = "model_download_progress_batch"
+
+Send = Callable[[str, dict[str, Any], str | None], None]
+Payload = Callable[[str], dict[str, Any] | None]
+
+
+class ProgressBroadcaster:
+    """Deliver download events to websocket clients.
+
+    Clients receive every download unless they subscribe to a set of
+    download IDs (possibly empty). While no client has subscribed, each
+    event is a single broadcast, as before.
+
+    Args:
+        send: Sends ``(event, data, sid)``; a None sid broadcasts.
+        clients: Returns the sids of the connected clients.
+        payload: Returns the current event data of a download, or None once
+            it has been forgotten.
+        interval: Seconds between progress batches.
+    """
+
+    def __init__(
+        self,
+        send: Send,
+        clients: Callable[[], Iterable[str]],
+        payload: Payload,
+        interval: float = 1.0,
+    ) -> None:
+        self._send = send
+        self._clients = clients
+        self._payload = payload
+        self.interval = interval
+        # sid -> download IDs it wants; absent means all of them
+        self._subscriptions: dict[str, set[str]] = {}
+        self._last_status: dict[str, str] = {}
+        self._dirty: dict[str, None] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_loop: asyncio.AbstractEventLoop | None = None
+
+    def subscribe(self, sid: str, download_ids: Iterable[str] | None) -> None:
+        """Limit *sid* to *download_ids*; None restores all downloads."""
+        if download_ids is None:
+            self._subscriptions.pop(sid, None)
+        else:
+            self._subscriptions[sid] = set(download_ids)
+
+    def watch(self, sid: str, download_id: str) -> None:
+        """Add *download_id* to the subscription of *sid*, if it has one."""
+        wanted = self._subscriptions.get(sid)
+        if wanted is not None:
+            wanted.add(download_id)
+
+    def publish(self, download_id: str, status: str) -> None:
+        """Report that *download_id* changed; must run on the event loop."""
+        if self._last_status.get(download_id) != status:
+            self._last_status[download_id] = status
+            self._dirty.pop(download_id, None)
+            data = self._payload(download_id)
+            if data is not None:
+                self._deliver(PROGRESS_EVENT, [data], lambda items: items[0])
+            return
+        self._dirty[download_id] = None
+        loop = asyncio.get_running_loop()
+        if self._timer is None or self._timer_loop is not loop:
+            self._timer = loop.call_later(self.interval, self.flush)
+            self._timer_loop = loop
+
+    def forget(self, download_id: str) -> None:
+        """Drop what is known about a download that has gone away."""
+        self._last_status.pop(download_id, None)
+        self._dirty.pop(download_id, None)
+        for wanted in self._subscriptions.values():
+            wanted.discard(download_id)
+
+    def flush(self) -> None:
+        """Send one batch with the downloads that changed since the last one."""
+        self._timer = None
+        dirty, self._dirty = self._dirty, {}
+        batch = []
+        for download_id in dirty:
+            data = self._payload(download_id)
+            if data is not None:
+                batch.append(data)
+        if batch:
+            self._deliver(BATCH_EVENT, batch, lambda items: {"downloads": items})
+
+    def _deliver(
+        self,
+        event: str,
+        items: list[dict[str, Any]],
+        wrap: Callable[[list[dict[str, Any]]], dict[str, Any]],
+    ) -> None:
+        connected: list[str] = []
+        if self._subscriptions:
+            # Forget the subscriptions of tabs that have since closed
+            connected = list(self._clients())
+            for sid in self._subscriptions.keys() - set(connected):
+                del self._subscriptions[sid]
+        if not self._subscriptions:
+            self._send(event, wrap(items), None)
+            return
+        for sid in connected:
+            wanted = self._subscriptions.get(sid)
+            selected = items if wanted is None else [d for d in items if d["download_id"] in wanted]
+            if selected:
+                self._send(event, wrap(selected), sid)
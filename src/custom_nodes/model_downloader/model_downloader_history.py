@@ -0,0 +1,112 @@
+"""Persistent history of finished model downloads.
+
+``active_downloads`` only holds a download until shortly after it finishes.
+Every completed, skipped or failed download is also recorded here, in a
+small SQLite database in the state directory, with its size, duration and
+throughput, so what was fetched (and how fast) can still be looked up after
+the entry is gone or ComfyUI has restarted.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any
+
+logger = logging.getLogger("model_downloader")
+
+HISTORY_VERSION = 1
+
+# Rows kept at most; the oldest are dropped first
+MAX_HISTORY_ENTRIES = 10000
+
+# Columns of a history row, after its ``id``
+COLUMNS = (
+    "download_id",
+    "url",
+    "folder",
+    "filename",
+    "path",
+    "status",
+    "error",
+    "total_size",
+    "downloaded",
+    "sha256",
+    "started_at",
+    "finished_at",
+    "duration",
+    "throughput",
+)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS downloads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    {", ".join(COLUMNS)}
+)
+"""
+
+# One writer at a time; readers use their own connections
+_lock = threading.Lock()
+
+
+def history_path(state_dir: str) -> str:
+    return os.path.join(state_dir, "history.sqlite3")
+
+
+def record_history(state_dir: str, rows: list[dict[str, Any]]) -> None:
+    """Append *rows* (keyed by ``COLUMNS``) and drop rows beyond the limit."""
+    if not rows:
+        return
+    placeholders = ", ".join("?" * len(COLUMNS))
+    with _lock, contextlib.closing(_connect(state_dir)) as db, db:
+        db.executemany(
+            f"INSERT INTO downloads ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+            [tuple(row.get(column) for column in COLUMNS) for row in rows],
+        )
+        db.execute(
+            "DELETE FROM downloads WHERE id <= (SELECT MAX(id) FROM downloads) - ?",
+            (MAX_HISTORY_ENTRIES,),
+        )
+
+
+def list_history(
+    state_dir: str, *, limit: int, before: int | None = None, status: str | None = None
+) -> list[dict[str, Any]]:
+    """Up to *limit* rows, newest first, with an ``id`` below *before* if given.
+
+    Passing the last row's ``id`` as *before* fetches the next page; rows
+    added meanwhile do not shift it. *status* keeps only rows with that status.
+    """
+    if not os.path.exists(history_path(state_dir)):
+        return []
+    query = f"SELECT id, {', '.join(COLUMNS)} FROM downloads WHERE 1 = 1"
+    params: list[Any] = []
+    if before is not None:
+        query += " AND id < ?"
+        params.append(before)
+    if status is not None:
+        query += " AND status = ?"
+        params.append(status)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    with contextlib.closing(_connect(state_dir)) as db:
+        db.row_factory = sqlite3.Row
+        return [dict(row) for row in db.execute(query, params)]
+
+
+def _connect(state_dir: str) -> sqlite3.Connection:
+    os.makedirs(state_dir, exist_ok=True)
+    db = sqlite3.connect(history_path(state_dir), timeout=5)
+    try:
+        if db.execute("PRAGMA user_version").fetchone()[0] != HISTORY_VERSION:
+            with db:
+                db.execute("DROP TABLE IF EXISTS downloads")
+                db.execute(_SCHEMA)
+                db.execute(f"PRAGMA user_version = {HISTORY_VERSION}")
+    except BaseException:
+        db.close()
+        raise
+    return db
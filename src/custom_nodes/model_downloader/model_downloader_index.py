@@ -0,0 +1,202 @@
+"""In-memory index of model files, used to resolve which folder a file is in.
+
+Resolving a filename used to stat it in every search path of every model
+folder type, for every model of every workflow opened. The index is built
+once in the background and then kept current by polling directory mtimes,
+re-listing only directories that changed, so lookups never touch the disk.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import posixpath
+import threading
+import time
+from collections.abc import Callable
+
+logger = logging.getLogger("model_downloader")
+
+# Directories modified this recently are listed again on the next refresh:
+# a file added within the same mtime tick would otherwise go unnoticed.
+RACY_MTIME_SECONDS = 2.0
+
+ModelRoots = Callable[[], list[tuple[str, list[str]]]]
+
+
+class _Listing:
+    __slots__ = ("files", "mtime_ns", "subdirs")
+
+    def __init__(self, mtime_ns: int, files: list[str], subdirs: list[str]) -> None:
+        self.mtime_ns = mtime_ns
+        self.files = files
+        self.subdirs = subdirs
+
+
+class FilenameIndex:
+    """Map filenames, relative to a model folder's search path, to folder names.
+
+    When a file exists under several folders the one listed first by *roots*
+    wins, matching a search of the folders in order.
+
+    Args:
+        roots: Returns ``(folder_name, search_paths)`` pairs in priority order.
+            Called on every refresh so newly registered folders are picked up.
+    """
+
+    def __init__(self, roots: ModelRoots) -> None:
+        self._roots = roots
+        self._root_list: list[tuple[str, str]] = []
+        self._dirs: dict[str, _Listing] = {}
+        # key -> (rank, folder, root); rank orders folders and search paths
+        self._owners: dict[str, tuple[int, str, str]] = {}
+        # Files added by the downloader since the running refresh started
+        self._recent: dict[str, tuple[tuple[int, str, str], float]] = {}
+        self._refresh_lock = threading.Lock()
+        self.ready = False
+
+    def lookup(self, filename: str) -> str | None:
+        """Return the folder containing *filename*, or None if not indexed."""
+        located = self.locate(filename)
+        return located[0] if located else None
+
+    def locate(self, filename: str) -> tuple[str, str] | None:
+        """Return ``(folder, full_path)`` for *filename*, or None if not indexed."""
+        key = _normalise(filename)
+        if key is None:
+            return None
+        owner = self._owners.get(key)
+        if owner is None:
+            return None
+        _rank, folder, root = owner
+        return folder, os.path.join(root, *key.split("/"))
+
+    def add(self, full_path: str) -> None:
+        """Index a file the downloader just completed, ahead of the next refresh."""
+        for rank, (folder, root) in enumerate(self._root_list):
+            prefix = os.path.join(root, "")
+            if not full_path.startswith(prefix):
+                continue
+            key = _normalise(os.path.relpath(full_path, root))
+            if key is None:
+                continue
+            owner = (rank, folder, root)
+            self._recent[key] = (owner, time.time())
+            if self._owners.get(key, owner) >= owner:
+                self._owners[key] = owner
+            return
+
+    def refresh(self) -> int:
+        """Bring the index up to date; blocking. Returns directories re-listed."""
+        with self._refresh_lock:
+            started = time.time()
+            root_list = [(folder, root) for folder, paths in self._roots() for root in paths]
+            dirs: dict[str, _Listing] = {}
+            relisted = 0
+            for _folder, root in root_list:
+                relisted += self._scan(root, dirs, started)
+
+            owners: dict[str, tuple[int, str, str]] = {}
+            for rank, (folder, root) in enumerate(root_list):
+                for key in _files_under(root, dirs):
+                    owners.setdefault(key, (rank, folder, root))
+            for key, (owner, added) in list(self._recent.items()):
+                if added < started:
+                    del self._recent[key]
+                elif owners.get(key, owner) >= owner:
+                    owners[key] = owner
+
+            self._dirs = dirs
+            self._root_list = root_list
+            self._owners = owners
+            self.ready = True
+            return relisted
+
+    def _scan(self, root: str, dirs: dict[str, _Listing], started: float) -> int:
+        relisted = 0
+        visited: set[tuple[int, int]] = set()
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            if directory in dirs:
+                continue
+            try:
+                st = os.stat(directory)
+            except OSError:
+                continue
+            # Symlinked directories are followed; guard against loops
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+
+            listing = self._dirs.get(directory)
+            if listing is None or listing.mtime_ns != st.st_mtime_ns:
+                listing = _list_directory(directory, st.st_mtime_ns, started)
+                relisted += 1
+            dirs[directory] = listing
+            stack.extend(os.path.join(directory, name) for name in listing.subdirs)
+        return relisted
+
+    async def run(self, interval: float) -> None:
+        """Refresh the index every *interval* seconds, off the event loop."""
+        while True:
+            try:
+                started = time.monotonic()
+                relisted = await asyncio.to_thread(self.refresh)
+                if relisted:
+                    logger.debug(
+                        "Model index refreshed: %d directories listed in %.2fs",
+                        relisted,
+                        time.monotonic() - started,
+                    )
+            except Exception:
+                logger.exception("Model index refresh failed")
+            await asyncio.sleep(interval)
+
+
+def _list_directory(directory: str, mtime_ns: int, started: float) -> _Listing:
+    files: list[str] = []
+    subdirs: list[str] = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if not entry.name.startswith("."):
+                            subdirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        logger.warning("Cannot list model directory %s", directory)
+    if mtime_ns >= (started - RACY_MTIME_SECONDS) * 1e9:
+        mtime_ns = -1
+    return _Listing(mtime_ns, files, subdirs)
+
+
+def _files_under(root: str, dirs: dict[str, _Listing]) -> list[str]:
+    """Paths, relative to *root* and "/"-separated, of every indexed file below it."""
+    keys: list[str] = []
+    stack = [(root, "")]
+    seen: set[str] = set()
+    while stack:
+        directory, prefix = stack.pop()
+        listing = dirs.get(directory)
+        if listing is None or directory in seen:
+            continue
+        seen.add(directory)
+        keys.extend(prefix + name for name in listing.files)
+        stack.extend(
+            (os.path.join(directory, name), f"{prefix}{name}/") for name in listing.subdirs
+        )
+    return keys
+
+
+def _normalise(filename: str) -> str | None:
+    """Canonical index key for *filename*, or None if it escapes its folder."""
+    key = posixpath.normpath(filename.replace(os.sep, "/"))
+    if key.startswith(("/", "../")) or key in {".", ".."}:
+        return None
+    return key
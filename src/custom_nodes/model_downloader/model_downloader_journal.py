@@ -0,0 +1,85 @@
+"""Persistent journal for resumable model downloads.
+
+Every in-flight download owns one small JSON file recording its source URL,
+validators and how many bytes of each segment are confirmed on disk. An
+interrupted transfer resumes from it with Range requests instead of starting
+over, including after a ComfyUI restart.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+from typing import Any
+
+logger = logging.getLogger("model_downloader")
+
+JOURNAL_VERSION = 1
+
+# Journal states: "running" entries were in flight when last written and are
+# picked up again at startup; "failed" entries only resume on a new request.
+STATE_RUNNING = "running"
+STATE_FAILED = "failed"
+
+
+def part_path_for(full_path: str) -> str:
+    """Return the temporary path a download is written to before completion."""
+    return f"{full_path}.part"
+
+
+def journal_path(journal_dir: str, full_path: str) -> str:
+    """Return the journal file for the download targeting *full_path*."""
+    key = hashlib.sha256(full_path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(journal_dir, f"{key}.json")
+
+
+def load_journal(journal_dir: str, full_path: str) -> dict[str, Any] | None:
+    """Load the journal for *full_path*, or None if missing or unreadable."""
+    return _read(journal_path(journal_dir, full_path))
+
+
+def save_journal(journal_dir: str, entry: dict[str, Any]) -> None:
+    """Atomically write *entry* (keyed by its ``path``) to the journal.
+
+    The file is created owner-only since the URL may carry credentials.
+    """
+    os.makedirs(journal_dir, exist_ok=True)
+    target = journal_path(journal_dir, entry["path"])
+    tmp = f"{target}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({**entry, "version": JOURNAL_VERSION}, f)
+    os.replace(tmp, target)
+
+
+def delete_journal(journal_dir: str, full_path: str) -> None:
+    """Remove the journal for *full_path* if it exists."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(journal_path(journal_dir, full_path))
+
+
+def list_journals(journal_dir: str) -> list[dict[str, Any]]:
+    """Return every readable journal entry in *journal_dir*."""
+    try:
+        names = os.listdir(journal_dir)
+    except FileNotFoundError:
+        return []
+    entries = [_read(os.path.join(journal_dir, name)) for name in names if name.endswith(".json")]
+    return [entry for entry in entries if entry is not None]
+
+
+def _read(path: str) -> dict[str, Any] | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        logger.warning("Ignoring unreadable download journal %s", path)
+        return None
+    if not isinstance(entry, dict) or entry.get("version") != JOURNAL_VERSION:
+        return None
+    return entry
@@ -0,0 +1,248 @@
+"""Event-loop lag and stall attribution for the model downloader.
+
+Downloads run on the same event loop as the rest of ComfyUI's server, so a
+blocking call in the downloader (a stat, a write, a hash) delays every other
+request and websocket message. The monitor measures how late the loop wakes
+a sleeping sampler, and a watchdog thread looks at the loop thread's stack
+while the loop is stuck, so each stall is credited to the downloader
+function that was running, or to something else in the process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+    from types import FrameType
+
+logger = logging.getLogger("model_downloader")
+
+# Location of stalls caused by code outside the monitored directories
+OTHER = "other"
+
+# Lag samples kept for percentiles, and stalls kept for listing
+LAG_WINDOW = 600
+RECENT_STALLS = 50
+
+# Where the loop calls into callbacks and tasks; frames further out (whatever
+# started the loop) did not cause the stall
+_DISPATCH_CODE = asyncio.events.Handle._run.__code__  # noqa: SLF001
+
+
+class Stall:
+    """A period the event loop did not run other callbacks."""
+
+    __slots__ = ("at", "duration", "frame", "location")
+
+    def __init__(self, at: float, duration: float, location: str, frame: str) -> None:
+        self.at = at
+        self.duration = duration
+        self.location = location
+        self.frame = frame
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "at": self.at,
+            "duration": round(self.duration, 4),
+            "location": self.location,
+            "frame": self.frame,
+        }
+
+
+class LoopMonitor:
+    """Sample event-loop lag and attribute stalls to the code causing them.
+
+    Args:
+        roots: Directories whose code counts as the downloader's; a stall is
+            credited to the innermost function on the loop's stack defined
+            under one of them, or to ``"other"``.
+        interval: Seconds between lag samples.
+        threshold: Lag, in seconds, from which a sample counts as a stall.
+        on_lag: Called with every lag sample, in seconds.
+        on_stall: Called with every stall.
+    """
+
+    def __init__(
+        self,
+        roots: Iterable[str],
+        *,
+        interval: float = 0.1,
+        threshold: float = 0.1,
+        on_lag: Callable[[float], None] | None = None,
+        on_stall: Callable[[Stall], None] | None = None,
+    ) -> None:
+        self.roots = tuple(os.path.join(os.path.realpath(root), "") for root in roots)
+        self.interval = interval
+        self.threshold = threshold
+        self._on_lag = on_lag
+        self._on_stall = on_stall
+        self._lags: collections.deque[float] = collections.deque(maxlen=LAG_WINDOW)
+        self._recent: collections.deque[Stall] = collections.deque(maxlen=RECENT_STALLS)
+        # location -> [stalls, seconds, longest]
+        self._totals: dict[str, list[float]] = {}
+        self._since_summary: list[Stall] = []
+        self.running = False
+        # Written by the sampler, read by the watchdog thread
+        self._loop_thread: int | None = None
+        self._due = 0.0
+        self._samples: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._code_locations: dict[Any, str | None] = {}
+
+    async def run(self, summary_interval: float = 60.0) -> None:
+        """Sample lag until cancelled, logging a summary of stalls periodically."""
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        watchdog = threading.Thread(
+            target=self._watch, name="model-downloader-loop-watchdog", daemon=True
+        )
+        watchdog.start()
+        self.running = True
+        next_summary = time.monotonic() + summary_interval
+        try:
+            while True:
+                self._due = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                self.record(max(0.0, now - self._due))
+                if now >= next_summary:
+                    self.log_summary(summary_interval)
+                    next_summary = now + summary_interval
+        finally:
+            self.running = False
+            self._due = 0.0
+            self._stop.set()
+
+    def record(self, lag: float) -> None:
+        """Add a lag sample, turning it into a stall if it reached the threshold."""
+        self._lags.append(lag)
+        if self._on_lag is not None:
+            self._on_lag(lag)
+        with self._lock:
+            samples, self._samples = self._samples, []
+        if lag < self.threshold:
+            return
+
+        if samples:
+            # The location seen most often while the loop was stuck
+            (location, frame), _count = collections.Counter(samples).most_common(1)[0]
+        else:
+            location, frame = OTHER, "unknown"
+        stall = Stall(time.time(), lag, location, frame)
+        self._recent.append(stall)
+        self._since_summary.append(stall)
+        totals = self._totals.setdefault(location, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += lag
+        totals[2] = max(totals[2], lag)
+        logger.debug("Event loop stalled for %.3fs in %s (%s)", lag, location, frame)
+        if self._on_stall is not None:
+            self._on_stall(stall)
+
+    def log_summary(self, period: float) -> None:
+        """Log the stalls recorded since the last summary, if there were any."""
+        stalls, self._since_summary = self._since_summary, []
+        if not stalls:
+            return
+        by_location: dict[str, list[float]] = {}
+        for stall in stalls:
+            by_location.setdefault(stall.location, []).append(stall.duration)
+        worst = sorted(by_location.items(), key=lambda item: -sum(item[1]))
+        logger.warning(
+            "Event loop stalled %d times (%.2fs) in the last %ds: %s",
+            len(stalls),
+            sum(stall.duration for stall in stalls),
+            period,
+            ", ".join(
+                f"{location} {len(durations)}x {sum(durations):.2f}s"
+                for location, durations in worst[:5]
+            ),
+        )
+
+    def snapshot(self) -> dict[str, Any]:
+        """Lag percentiles and stall statistics, JSON-serialisable."""
+        lags = sorted(self._lags)
+        locations = sorted(self._totals.items(), key=lambda item: -item[1][1])
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "lag": {
+                "samples": len(lags),
+                "p50": _percentile(lags, 0.5),
+                "p99": _percentile(lags, 0.99),
+                "max": round(lags[-1], 4) if lags else 0.0,
+            },
+            "stalls": {
+                "count": int(sum(totals[0] for _location, totals in locations)),
+                "seconds": round(sum(totals[1] for _location, totals in locations), 4),
+                "locations": [
+                    {
+                        "location": location,
+                        "count": int(count),
+                        "seconds": round(seconds, 4),
+                        "max": round(longest, 4),
+                    }
+                    for location, (count, seconds, longest) in locations
+                ],
+                "recent": [stall.as_dict() for stall in reversed(self._recent)],
+            },
+        }
+
+    def _watch(self) -> None:
+        """Sample the loop thread's stack while the sampler is overdue."""
+        # Stalls of at least `threshold` are seen at least once
+        poll = self.threshold / 4
+        while not self._stop.wait(poll):
+            due = self._due
+            if not due or time.monotonic() - due < self.threshold / 2:
+                continue
+            frame = sys._current_frames().get(self._loop_thread or 0)  # noqa: SLF001
+            if frame is not None:
+                sample = self._locate(frame)
+                with self._lock:
+                    self._samples.append(sample)
+
+    def _locate(self, frame: FrameType | None) -> tuple[str, str]:
+        """``(location, innermost frame)`` for the stack ending at *frame*."""
+        innermost = _describe(frame) if frame is not None else "unknown"
+        while frame is not None and frame.f_code is not _DISPATCH_CODE:
+            location = self._code_location(frame)
+            if location is not None:
+                return location, innermost
+            frame = frame.f_back
+        return OTHER, innermost
+
+    def _code_location(self, frame: FrameType) -> str | None:
+        code = frame.f_code
+        try:
+            return self._code_locations[code]
+        except KeyError:
+            pass
+        location = None
+        filename = os.path.realpath(code.co_filename)
+        if filename.startswith(self.roots):
+            module = os.path.splitext(os.path.basename(filename))[0]
+            location = f"{module}.{code.co_qualname}"
+        self._code_locations[code] = location
+        return location
+
+
+def _describe(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{frame.f_lineno} in {code.co_qualname}"
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
@@ -0,0 +1,106 @@
+"""Cache of what origins said about model URLs.
+
+A probe (HEAD) or the first GET of a download reveals a URL's size, content
+type, ETag, where its redirects lead and whether it needs a token. Those
+answers are kept on disk for a while, so the frontend can show sizes and
+gated status for many models without a request per model, and the
+downloader can decide that an existing file is already complete without
+asking the origin again. Fresh entries are served without any network
+access.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from http import HTTPStatus
+from typing import Any
+
+logger = logging.getLogger("model_downloader")
+
+METADATA_VERSION = 1
+
+# Entries kept at most; the least recently checked are dropped first
+MAX_METADATA_ENTRIES = 5000
+
+# Records are rewritten as a whole; serialise concurrent writers
+_lock = threading.Lock()
+
+
+def metadata_path(state_dir: str) -> str:
+    return os.path.join(state_dir, "metadata.json")
+
+
+def lookup_metadata(state_dir: str, urls: dict[str, bool]) -> dict[str, dict[str, Any]]:
+    """The unexpired records of *urls*, keyed by URL.
+
+    *urls* maps each URL to whether it is requested with a token. A record
+    only counts if it was made the same way, since a gated file looks
+    different with and without one.
+    """
+    records = _load(state_dir)
+    now = time.time()
+    found: dict[str, dict[str, Any]] = {}
+    for url, authenticated in urls.items():
+        record = records.get(url)
+        if (
+            record is not None
+            and record.get("authenticated") == authenticated
+            and record.get("expires", 0) > now
+        ):
+            found[url] = record
+    return found
+
+
+def record_metadata(
+    state_dir: str, records: dict[str, dict[str, Any]], ttl: float, error_ttl: float
+) -> None:
+    """Store *records* (keyed by URL) for *ttl* seconds from now.
+
+    Each record notes in ``authenticated`` whether it was fetched with a
+    token.
+    Records whose ``status`` is not 200 (missing files, gated models without
+    access) are kept for *error_ttl* seconds instead, since they are the
+    ones most likely to change.
+    """
+    now = time.time()
+    with _lock:
+        stored = _load(state_dir)
+        for url, record in records.items():
+            lifetime = ttl if record.get("status") == HTTPStatus.OK else error_ttl
+            stored.pop(url, None)
+            stored[url] = {**record, "checked_at": now, "expires": now + lifetime}
+        # Insertion order is check order, so the oldest entries come first
+        for url in list(stored)[: max(0, len(stored) - MAX_METADATA_ENTRIES)]:
+            del stored[url]
+        _save(state_dir, stored)
+
+
+def _load(state_dir: str) -> dict[str, dict[str, Any]]:
+    path = metadata_path(state_dir)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        logger.warning("Ignoring unreadable metadata cache %s", path)
+        return {}
+    if not isinstance(data, dict) or data.get("version") != METADATA_VERSION:
+        return {}
+    records = data.get("urls")
+    return records if isinstance(records, dict) else {}
+
+
+def _save(state_dir: str, records: dict[str, dict[str, Any]]) -> None:
+    os.makedirs(state_dir, exist_ok=True)
+    target = metadata_path(state_dir)
+    tmp = f"{target}.tmp"
+    # Owner-only, since URLs may carry credentials
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"version": METADATA_VERSION, "urls": records}, f)
+    os.replace(tmp, target)
@@ -0,0 +1,89 @@
+"""Mirrors and URL rewrites for model downloads.
+
+Nodes on one network can fetch models through an internal HTTP cache or
+artifact server instead of each pulling the same checkpoints from the
+public origin. A download tries its rewritten URLs, then the mirrors, then
+the original URL, moving on when a source misses.
+
+Credentials are scoped by host. A mirror only receives the original URL's
+auth headers if it is listed as trusted with them, and only over HTTPS;
+otherwise it is asked like any other URL, with whatever headers its own
+host would get.
+"""
+
+from __future__ import annotations
+
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger("model_downloader")
+
+
+def parse_mirrors(spec: str) -> list[str]:
+    """Parse ``"http://cache.lan:8080,https://mirror.example"`` into base URLs."""
+    mirrors: list[str] = []
+    for item in spec.replace(",", " ").split():
+        if urlparse(item).scheme in {"http", "https"}:
+            mirrors.append(item.rstrip("/"))
+        else:
+            logger.warning("Ignoring invalid mirror %r", item)
+    return mirrors
+
+
+def parse_rewrites(spec: str) -> list[tuple[str, str]]:
+    """Parse ``"https://huggingface.co/=http://hf.lan/,..."`` into prefix pairs."""
+    rewrites: list[tuple[str, str]] = []
+    for item in spec.replace(",", " ").split():
+        prefix, sep, replacement = item.partition("=")
+        if sep and prefix and urlparse(replacement).scheme in {"http", "https"}:
+            rewrites.append((prefix, replacement))
+        else:
+            logger.warning("Ignoring invalid URL rewrite %r", item)
+    return rewrites
+
+
+class MirrorList:
+    """Where to look for a URL before asking its origin.
+
+    Args:
+        mirrors: Base URLs serving ``<base>/<host>/<path>`` for any origin,
+            e.g. a caching proxy.
+        rewrites: ``(prefix, replacement)`` pairs; a URL starting with
+            *prefix* is also tried with it replaced.
+        auth_hosts: Mirror hosts trusted with the original URL's
+            credentials, e.g. an authenticated proxy for gated models.
+    """
+
+    def __init__(
+        self,
+        mirrors: list[str] | None = None,
+        rewrites: list[tuple[str, str]] | None = None,
+        auth_hosts: set[str] | None = None,
+    ) -> None:
+        self.mirrors = list(mirrors or [])
+        self.rewrites = list(rewrites or [])
+        self.auth_hosts = {host.lower() for host in auth_hosts or ()}
+
+    def __bool__(self) -> bool:
+        return bool(self.mirrors or self.rewrites)
+
+    def sources(self, url: str) -> list[str]:
+        """URLs to try for *url*, in order, ending with *url* itself."""
+        sources = [
+            replacement + url.removeprefix(prefix)
+            for prefix, replacement in self.rewrites
+            if url.startswith(prefix)
+        ]
+        parsed = urlparse(url)
+        if parsed.hostname:
+            # Never the userinfo: that is a credential for the origin
+            host = parsed.hostname if parsed.port is None else f"{parsed.hostname}:{parsed.port}"
+            location = parsed._replace(scheme="", netloc="").geturl()
+            sources.extend(f"{base}/{host}{location}" for base in self.mirrors)
+        sources.append(url)
+        return list(dict.fromkeys(sources))
+
+    def forwards_auth(self, source: str) -> bool:
+        """Whether *source* may be sent the original URL's credentials."""
+        parsed = urlparse(source)
+        return parsed.scheme == "https" and (parsed.hostname or "").lower() in self.auth_hosts
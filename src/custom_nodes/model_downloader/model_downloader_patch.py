@@ -3,59 +3,400 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import errno
+import hashlib
+import itertools
 import json
 import logging
 import os
+import queue
+import re
+import shutil
+import sqlite3
+import statistics
+import threading
 import time
+from collections import deque
 from http import HTTPStatus
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, TypedDict
+from typing import TYPE_CHECKING, Any
 from urllib.parse import urlparse
 
 import folder_paths  # type: ignore[import-not-found]
-from aiohttp import ClientSession, ClientTimeout, web
+from aiohttp import (
+    ClientConnectionError,
+    ClientError,
+    ClientPayloadError,
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+    web,
+)
+from model_downloader_changes import ChangeTracker
+from model_downloader_digests import file_sha256, lookup_digest, record_digest
+from model_downloader_events import ProgressBroadcaster
+from model_downloader_history import list_history, record_history
+from model_downloader_index import FilenameIndex
+from model_downloader_journal import (
+    STATE_FAILED,
+    STATE_RUNNING,
+    delete_journal,
+    list_journals,
+    load_journal,
+    part_path_for,
+    save_journal,
+)
+from model_downloader_loopmonitor import LoopMonitor, Stall
+from model_downloader_metadata import lookup_metadata, record_metadata
+from model_downloader_metrics import CONTENT_TYPE, THROUGHPUT_BUCKETS, Registry
+from model_downloader_mirrors import MirrorList, parse_mirrors, parse_rewrites
+from model_downloader_ratelimit import BandwidthLimiter, parse_host_rates, parse_rate
+from model_downloader_record import COMPLETED, DOWNLOADING, ERROR, SKIPPED, Download
+from model_downloader_retention import RetentionQueue
+from model_downloader_retry import HTTPStatusError, RetryPolicy, failure_reason, parse_retry_after
+from model_downloader_scheduler import (
+    PRIORITY_HIGH,
+    PRIORITY_LABELS,
+    PRIORITY_NAMES,
+    PRIORITY_NORMAL,
+    DownloadScheduler,
+    parse_host_limits,
+)
+from model_downloader_workflow import ModelReference, extract_model_references
 from server import PromptServer  # type: ignore[import-not-found]
 
 if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Callable, Coroutine
+
     from aiohttp import ClientResponse
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
 logger = logging.getLogger("model_downloader")
 
 
-class DownloadInfo(TypedDict):
-    """Type definition for download information."""
+# Store active downloads with their progress information
+active_downloads: dict[str, Download] = {}
+
+# Queued or running download of each requested (folder, filename); entries
+# whose download has finished are ignored and dropped with the download
+_in_flight: dict[tuple[str, str], str] = {}
+
+# Versions of the entries in active_downloads, for delta polling of /downloads
+_changes = ChangeTracker()
+
+# Encoded /downloads responses by (version, since); valid until the next change
+_listing_cache: dict[tuple[int, int | None], bytes] = {}
+MAX_CACHED_LISTINGS = 16
+
+# Longest a /downloads long-poll (?wait=) is held open, in seconds
+MAX_POLL_WAIT = 30.0
+
+# Seconds a finished download stays in active_downloads, so the frontend can
+# show its outcome; after that only the history remembers it
+RETENTION_SECONDS = float(os.getenv("MODEL_DOWNLOADER_RETENTION_SECONDS", "60"))
+
+# Rows returned by one /history request: by default and at most
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+
+# Files at least this large are fetched over several parallel HTTP Range
+# requests when the origin advertises byte-range support. A single connection
+# to a CDN is often capped well below the link speed.
+SEGMENTED_MIN_SIZE = 64 * 1024 * 1024
+SEGMENT_COUNT = int(os.getenv("MODEL_DOWNLOADER_SEGMENTS", "4"))
+
+# Seconds between journal checkpoints of an in-flight download. Each checkpoint
+# fsyncs the part file, so this bounds how much work a crash can lose.
+JOURNAL_INTERVAL = 5.0
+
+# Seconds between progress samples of a running download: connections only
+# count bytes, and its record's percent, speed and ETA are worked out (and
+# published) at this rate, the websocket's batch interval.
+PROGRESS_INTERVAL = 1.0
+
+# Chunk writes happen on a writer thread. Up to WRITE_QUEUE_BYTES may wait for
+# the disk before the network reader is paused, and contiguous chunks are
+# merged into writes of up to WRITE_COALESCE_BYTES.
+WRITE_QUEUE_BYTES = 32 * 1024 * 1024
+WRITE_COALESCE_BYTES = 8 * 1024 * 1024
+
+# Each connection's body is handled in batches of about READ_TARGET_SECONDS of
+# its measured throughput, between READ_MIN_BYTES and READ_MAX_BYTES: slow
+# links still report progress and reach the disk steadily, fast ones pay the
+# per-batch progress and rate-limit bookkeeping rarely.
+READ_MIN_BYTES = 64 * 1024
+READ_MAX_BYTES = 512 * 1024
+READ_TARGET_SECONDS = 0.1
+
+# Data already on disk that the running SHA-256 has not seen (resumed bytes,
+# later segments) is read back in blocks of this size while the writer is idle.
+HASH_READ_BYTES = 8 * 1024 * 1024
+
+_SHA256_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+# Seconds between checks of the model directories' mtimes by the filename index
+INDEX_REFRESH_INTERVAL = 10.0
+
+# Most filenames accepted by one resolve-folders request
+MAX_RESOLVE_BATCH = 1000
+
+# HEAD requests a probe or workflow prefetch sends at once
+PROBE_CONCURRENCY = 8
+
+# Most URLs accepted by one probe request
+MAX_PROBE_BATCH = 200
+
+# Seconds a URL's size, ETag and redirect target are trusted without asking
+# the origin again; answers other than 200 (missing or gated files) are
+# trusted for METADATA_ERROR_TTL only
+METADATA_TTL = float(os.getenv("MODEL_DOWNLOADER_METADATA_TTL", "3600"))
+METADATA_ERROR_TTL = 300.0
+
+# Space a download must leave free on the models volume, so ComfyUI's
+# outputs and temp files still fit while it runs
+MIN_FREE_SPACE = int(os.getenv("MODEL_DOWNLOADER_MIN_FREE_MB", "1024")) * 1024 * 1024
+
+# Reserve the whole file with posix_fallocate before writing, so large
+# models are laid out contiguously and a full disk fails the download at the
+# start instead of part-way through
+PREALLOCATE = os.getenv("MODEL_DOWNLOADER_PREALLOCATE", "1") != "0"
+
+# A download from a mirror slower than this many bytes per second, measured
+# over MIRROR_CHECK_INTERVAL seconds once MIRROR_GRACE_PERIOD has passed,
+# falls back to the next source; 0 disables the check
+MIRROR_MIN_RATE = parse_rate(os.getenv("MODEL_DOWNLOADER_MIRROR_MIN_RATE", "1M"))
+MIRROR_CHECK_INTERVAL = 10.0
+MIRROR_GRACE_PERIOD = 15.0
+
+# Transient failures (5xx, 429, resets, read timeouts) of a connection are
+# retried up to RETRY_ATTEMPTS times in a row, RETRY_BASE_DELAY seconds
+# apart at first and doubling up to RETRY_MAX_DELAY; a connection that
+# delivered data since its last failure starts counting afresh
+RETRY_ATTEMPTS = int(os.getenv("MODEL_DOWNLOADER_RETRIES", "5"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# Event-loop monitoring: lag is sampled every LOOP_LAG_INTERVAL seconds, and
+# lag from LOOP_STALL_THRESHOLD is a stall, credited to the code running
+LOOP_MONITOR = os.getenv("MODEL_DOWNLOADER_LOOP_MONITOR", "1") != "0"
+LOOP_LAG_INTERVAL = 0.1
+LOOP_STALL_THRESHOLD = float(os.getenv("MODEL_DOWNLOADER_STALL_MS", "100")) / 1000
+LOOP_SUMMARY_INTERVAL = 60.0
+
+# Throughput (MB/s) of recently completed downloads, for prefetch estimates
+_recent_speeds: deque[float] = deque(maxlen=10)
+
+
+# Folders whose models are typically small enough (VAEs, LoRAs, configs) to
+# jump ahead of multi-GB checkpoints in the download queue.
+SMALL_MODEL_FOLDERS = frozenset(
+    {"configs", "embeddings", "hypernetworks", "loras", "upscale_models", "vae", "vae_approx"}
+)
 
-    url: str
-    folder: str
-    filename: str
-    path: str
-    total_size: int
-    downloaded: int
-    percent: int
-    status: str
-    error: str | None
-    start_time: float
-    download_id: str
 
+class _RangeNotSupportedError(OSError):
+    """Raised when an origin answers a Range request with the full body."""
 
-class DownloadInfoOptional(TypedDict, total=False):
-    """Optional fields for download information."""
 
-    end_time: float
-    content_type: str
-    speed: float
-    eta: int
+class _ChecksumMismatchError(OSError):
+    """Raised when a finished download does not match its expected SHA-256."""
 
 
-# Combined type for active downloads (all fields)
-DownloadData = dict[str, Any]  # Using Any for flexibility with TypedDict limitations
+class _InsufficientSpaceError(OSError):
+    """Raised when the file being downloaded does not fit on the disk."""
 
-# Store active downloads with their progress information
-active_downloads: dict[str, DownloadData] = {}
+
+class _SlowSourceError(OSError):
+    """Raised when a mirror delivers below the minimum acceptable rate."""
+
+
+def _on_queue_change() -> None:
+    """Publish new queue positions of waiting downloads."""
+    for download_id, position in _scheduler.positions().items():
+        download = active_downloads.get(download_id)
+        if download is None or download.queue_position == position:
+            continue
+        download.queue_position = position
+        _publish_update(download_id)
+
+
+def _spawn(coroutine: Coroutine[Any, Any, None]) -> asyncio.Task[None]:
+    return PromptServer.instance.loop.create_task(coroutine)
+
+
+def _create_scheduler() -> DownloadScheduler:
+    return DownloadScheduler(
+        max_active=int(os.getenv("MODEL_DOWNLOADER_MAX_ACTIVE", "3")),
+        host_limits={
+            "huggingface.co": 3,
+            "civitai.com": 2,
+            **parse_host_limits(os.getenv("MODEL_DOWNLOADER_HOST_LIMITS", "")),
+        },
+        default_host_limit=2,
+        spawn=_spawn,
+        on_change=_on_queue_change,
+    )
+
+
+_scheduler = _create_scheduler()
+
+
+def _create_limiter() -> BandwidthLimiter:
+    def env_rate(name: str) -> float | None:
+        try:
+            return parse_rate(os.getenv(name, ""))
+        except ValueError:
+            logger.warning("Ignoring invalid %s", name)
+            return None
+
+    return BandwidthLimiter(
+        global_rate=env_rate("MODEL_DOWNLOADER_MAX_RATE"),
+        download_rate=env_rate("MODEL_DOWNLOADER_MAX_RATE_PER_DOWNLOAD"),
+        host_rates=parse_host_rates(os.getenv("MODEL_DOWNLOADER_HOST_RATES", "")),
+    )
+
+
+_limiter = _create_limiter()
+
+
+def _create_mirrors() -> MirrorList:
+    return MirrorList(
+        mirrors=parse_mirrors(os.getenv("MODEL_DOWNLOADER_MIRRORS", "")),
+        rewrites=parse_rewrites(os.getenv("MODEL_DOWNLOADER_URL_REWRITES", "")),
+        auth_hosts=set(
+            os.getenv("MODEL_DOWNLOADER_MIRROR_AUTH_HOSTS", "").replace(",", " ").split()
+        ),
+    )
+
+
+_mirrors = _create_mirrors()
+
+_retry_policy = RetryPolicy(RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+
+# Prometheus metrics, served at /model-downloader/metrics. Hosts are the
+# scheduler's host buckets, so CDN subdomains count towards their site.
+_metrics = Registry()
+_bytes_downloaded = _metrics.counter(
+    "model_downloader_downloaded_bytes_total", "Bytes received from origins.", ("host",)
+)
+_download_results = _metrics.counter(
+    "model_downloader_downloads_total",
+    "Downloads finished, by result (completed, skipped, error).",
+    ("result",),
+)
+_throughput = _metrics.histogram(
+    "model_downloader_throughput_bytes_per_second",
+    "Average speed of completed downloads.",
+    ("host",),
+    THROUGHPUT_BUCKETS,
+)
+_time_to_first_byte = _metrics.histogram(
+    "model_downloader_time_to_first_byte_seconds",
+    "Time from sending a download request to receiving its response headers.",
+    ("host",),
+)
+_head_latency = _metrics.histogram(
+    "model_downloader_head_request_seconds",
+    "Duration of HEAD requests sizing downloads.",
+    ("host",),
+)
+_download_retries = _metrics.counter(
+    "model_downloader_retries_total",
+    "Requests retried after a transient failure, by reason (HTTP status, timeout, connection).",
+    ("host", "reason"),
+)
+_write_latency = _metrics.histogram(
+    "model_downloader_disk_write_seconds", "Duration of each write of downloaded data to disk."
+)
+_metrics.gauge(
+    "model_downloader_queued_downloads",
+    "Downloads waiting for a free slot.",
+    lambda: _scheduler.queued_count,
+)
+_metrics.gauge(
+    "model_downloader_active_downloads", "Downloads running.", lambda: _scheduler.active_count
+)
+_loop_lag = _metrics.histogram(
+    "model_downloader_event_loop_lag_seconds",
+    "How late the server's event loop ran a timer, sampled periodically.",
+)
+_loop_stalls = _metrics.counter(
+    "model_downloader_event_loop_stalls_total",
+    "Event-loop stalls, by the downloader function running (other if none).",
+    ("location",),
+)
+_loop_stall_seconds = _metrics.counter(
+    "model_downloader_event_loop_stall_seconds_total",
+    "Time the event loop was stalled, by the downloader function running.",
+    ("location",),
+)
+
+
+def _count_stall(stall: Stall) -> None:
+    _loop_stalls.inc(location=stall.location)
+    _loop_stall_seconds.inc(stall.duration, location=stall.location)
+
+
+# Stalls are credited to functions defined in this directory
+_loop_monitor = LoopMonitor(
+    (os.path.dirname(os.path.realpath(__file__)),),
+    interval=LOOP_LAG_INTERVAL,
+    threshold=LOOP_STALL_THRESHOLD,
+    on_lag=_loop_lag.observe,
+    on_stall=_count_stall,
+)
+
+# One long-lived HTTP session shared by every download and probe, so repeated
+# requests to the same origin reuse pooled keep-alive connections (and their
+# TLS state) and cached DNS answers instead of paying for a fresh handshake.
+_session: ClientSession | None = None
+
+
+def _get_session() -> ClientSession:
+    """Return the shared ClientSession, creating it on first use.
+
+    Must be called from a coroutine running on the server's event loop.
+    """
+    global _session  # noqa: PLW0603
+    if _session is None or _session.closed:
+        connector = TCPConnector(
+            limit=64,
+            limit_per_host=16,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        _session = ClientSession(
+            connector=connector,
+            timeout=ClientTimeout(total=None, connect=30, sock_connect=30, sock_read=30),
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Close the shared ClientSession, if one was created."""
+    global _session
+    session, _session = _session, None
+    if session is not None and not session.closed:
+        await session.close()
+
+
+async def on_cleanup(app: web.Application) -> None:
+    """aiohttp cleanup signal handler releasing the shared session."""
+    await close_session()
+
+
+def _model_roots() -> list[tuple[str, list[str]]]:
+    """Model folder names and their search paths, in ComfyUI's order."""
+    return [
+        (name, list(paths))
+        for name, (paths, _extensions) in folder_paths.folder_names_and_paths.items()
+        if name != "custom_nodes"
+    ]
+
+
+# Answers resolve_folder lookups from memory; see model_downloader_index
+_filename_index = FilenameIndex(_model_roots)
+_background_tasks: set[asyncio.Task[None]] = set()
 
 
 def _get_hf_token() -> str | None:
@@ -157,7 +498,8 @@ async def download_model(request: web.Request) -> web.Response:
     Handle POST requests to download models.
 
     This function returns IMMEDIATELY after starting a background download.
-    If the file already exists with a matching size, the download is skipped
+    If the file already exists with a matching size (or, when the optional
+    ``sha256`` field is given, a matching digest), the download is skipped
     and a "skipped" status is returned via WebSocket.
 
     Args:
@@ -172,6 +514,9 @@ async def download_model(request: web.Request) -> web.Response:
         url = data.get("url")
         folder = data.get("folder")
         filename = data.get("filename")
+        priority_name = data.get("priority")
+        expected_sha256 = data.get("sha256")
+        client_id = data.get("client_id")
 
         logger.info("Received download request for %s in folder %s", filename, folder)
 
@@ -184,53 +529,39 @@ async def download_model(request: web.Request) -> web.Response:
             logger.error("Missing required parameters: %s", ", ".join(missing))
             return web.json_response({"success": False, "error": "Missing required parameters"})
 
-        # Get the model folder path
-        try:
-            folder_path = folder_paths.get_folder_paths(folder)
-        except KeyError:
-            folder_path = []
-
-        if not folder_path:
-            logger.error("Invalid folder: %s", folder)
-            return web.json_response({"success": False, "error": f"Invalid folder: {folder}"})
-
-        # Find a writable directory from the available paths
-        full_path = _find_writable_path(folder_path, filename)
-        if full_path is None:
-            logger.error("No writable directory found for folder: %s", folder)
+        if priority_name and priority_name not in PRIORITY_NAMES:
             return web.json_response(
-                {"success": False, "error": f"No writable directory for folder: {folder}"}
+                {"success": False, "error": f"Invalid priority: {priority_name}"}
             )
 
-        logger.info("Will download model to %s", full_path)
-
-        # Generate a unique download ID
-        download_id = f"{folder}_{filename}_{int(time.time())}"
-
-        # Create a download entry
-        active_downloads[download_id] = {
-            "url": url,
-            "folder": folder,
-            "filename": filename,
-            "path": full_path,
-            "total_size": 0,
-            "downloaded": 0,
-            "percent": 0,
-            "status": "downloading",
-            "error": None,
-            "start_time": time.time(),
-            "download_id": download_id,
-        }
-
-        # Start the download as a separate task (don't await)
-        PromptServer.instance.loop.create_task(_start_download(download_id, url, full_path))
+        if expected_sha256 and not _SHA256_RE.fullmatch(str(expected_sha256)):
+            return web.json_response({"success": False, "error": "Invalid sha256"})
+
+        active = _active_download_for(folder, filename)
+        if active is not None:
+            return _attach_to_download(active, url, expected_sha256)
+
+        priority = PRIORITY_NAMES[priority_name] if priority_name else _default_priority(folder)
+        download_id, error = _register_download(
+            url,
+            folder,
+            filename,
+            priority,
+            expected_sha256,
+            client_id=client_id if isinstance(client_id, str) and client_id else None,
+        )
+        if download_id is None:
+            return web.json_response({"success": False, "error": error})
 
         logger.info("Download %s queued, returning immediately to client", download_id)
+        download = active_downloads[download_id]
         return web.json_response(
             {
                 "success": True,
                 "download_id": download_id,
-                "status": "queued",
+                "status": download.status,
+                "priority": download.priority,
+                "queue_position": download.queue_position or 0,
                 "message": "Download has been queued and will start automatically",
             }
         )
@@ -243,6 +574,42 @@ async def download_model(request: web.Request) -> web.Response:
         return web.json_response({"success": False, "error": str(e)})
 
 
+def _attach_to_download(download: Download, url: str, expected_sha256: str | None) -> web.Response:
+    """Answer a request for a file that is already being downloaded.
+
+    The request gets the running download's ID instead of starting a second
+    transfer into the same ``.part`` file. A request naming another URL or
+    expected digest for the file is refused.
+    """
+    download_id = download.download_id
+    if url != download.url:
+        return web.json_response(
+            {"success": False, "error": "File is already being downloaded from another URL"}
+        )
+    if expected_sha256:
+        expected_sha256 = expected_sha256.lower()
+        if download.expected_sha256 is None:
+            download.expected_sha256 = expected_sha256
+            _changes.touch(download_id)
+        if download.expected_sha256 != expected_sha256:
+            return web.json_response(
+                {"success": False, "error": "File is already being downloaded with another sha256"}
+            )
+
+    logger.info("Download of %s already in progress as %s", download.filename, download_id)
+    return web.json_response(
+        {
+            "success": True,
+            "download_id": download_id,
+            "status": download.status,
+            "priority": download.priority,
+            "queue_position": download.queue_position or 0,
+            "attached": True,
+            "message": "Download is already in progress; attached to it",
+        }
+    )
+
+
 async def _parse_request_data(request: web.Request) -> dict[str, Any]:
     """Parse request data from various content types."""
     content_type = request.headers.get("Content-Type", "")
@@ -272,16 +639,169 @@ async def _parse_request_data(request: web.Request) -> dict[str, Any]:
     return data
 
 
+def _register_download(
+    url: str,
+    folder: str,
+    filename: str,
+    priority: int,
+    expected_sha256: str | None = None,
+    *,
+    client_id: str | None = None,
+) -> tuple[str | None, str | None]:
+    """Pick a destination for a download, record it and hand it to the scheduler.
+
+    *client_id* is the tab that asked for it, which is sent the download's
+    progress events from the first (``queued``) one on, even if it follows
+    only its own downloads.
+
+    Returns ``(download_id, None)``, or ``(None, error)`` if *folder* is unknown
+    or has no writable directory.
+    """
+    # Get the model folder path
+    try:
+        folder_path = folder_paths.get_folder_paths(folder)
+    except KeyError:
+        folder_path = []
+
+    if not folder_path:
+        logger.error("Invalid folder: %s", folder)
+        return None, f"Invalid folder: {folder}"
+
+    # Find a writable directory from the available paths
+    full_path = _find_writable_path(folder_path, filename)
+    if full_path is None:
+        logger.error("No writable directory found for folder: %s", folder)
+        return None, f"No writable directory for folder: {folder}"
+
+    logger.info("Will download model to %s", full_path)
+
+    download_id = _new_download_id(folder, filename)
+
+    # Create a download entry
+    download = active_downloads[download_id] = Download(
+        download_id, url, folder, filename, full_path
+    )
+    if expected_sha256:
+        download.expected_sha256 = expected_sha256.lower()
+    _in_flight[folder, filename] = download_id
+    _changes.touch(download_id)
+    if client_id is not None:
+        # Before queueing: a download that has to wait publishes its status
+        # right away
+        _broadcaster.watch(client_id, download_id)
+
+    # Hand the download to the scheduler (starts now if there is capacity)
+    _queue_download(download_id, url, full_path, priority)
+    return download_id, None
+
+
+def _new_download_id(folder: str, filename: str) -> str:
+    """A download ID not used by any download in ``active_downloads``.
+
+    IDs carry the second they were made in, so one left in the journal by an
+    earlier run does not come back for a new download.
+    """
+    base = f"{folder}_{filename}_{int(time.time())}"
+    download_id = base
+    for suffix in itertools.count(2):
+        if download_id not in active_downloads:
+            break
+        download_id = f"{base}_{suffix}"
+    return download_id
+
+
+def _default_priority(folder: str) -> int:
+    """Small model types skip ahead of checkpoints unless told otherwise."""
+    return PRIORITY_HIGH if folder in SMALL_MODEL_FOLDERS else PRIORITY_NORMAL
+
+
+def _queue_download(download_id: str, url: str, full_path: str, priority: int) -> None:
+    """Queue a registered download with the scheduler."""
+    active_downloads[download_id].priority = PRIORITY_LABELS[priority]
+    _scheduler.submit(
+        download_id, url, priority, lambda: _run_queued_download(download_id, url, full_path)
+    )
+
+
+async def _run_queued_download(download_id: str, url: str, full_path: str) -> None:
+    """Scheduler job: mark the download as started, then run it."""
+    download = active_downloads.get(download_id)
+    if download is None:
+        return
+    download.transition(DOWNLOADING)
+    await send_download_update(download_id)
+    await _start_download(download_id, url, full_path)
+
+
 async def _start_download(download_id: str, url: str, full_path: str) -> None:
     """Start a download in the background."""
     try:
         await download_file(download_id, url, full_path)
     except (OSError, TimeoutError) as e:
         logger.exception("Error in start_download")
+        await _fail_download(download_id, str(e))
+    except Exception:
+        # Anything else would leave the download active, and repeat requests
+        # attached to it, forever
+        logger.exception("Unexpected error in start_download")
+        await _fail_download(download_id, "Download failed")
+
+
+async def _fail_download(download_id: str, error: str) -> None:
+    """Mark an unfinished download as failed with *error* and publish it."""
+    download = active_downloads.get(download_id)
+    if download is None or not download.active:
+        return
+    download.transition(ERROR, error)
+    _download_results.inc(result="error")
+    await send_download_update(download_id)
+    _download_finished(download)
+
+
+async def _resume_interrupted_downloads() -> None:
+    """Restart downloads whose journal shows they were running at shutdown."""
+    entries = await asyncio.to_thread(list_journals, _journal_dir())
+    for entry in entries:
+        download_id = entry.get("download_id")
+        if entry.get("state") != STATE_RUNNING or not download_id:
+            continue
         if download_id in active_downloads:
-            active_downloads[download_id]["status"] = "error"
-            active_downloads[download_id]["error"] = str(e)
-            await send_download_update(download_id)
+            continue
+
+        logger.info("Resuming interrupted download %s", download_id)
+        # "url" is the source the data came from, possibly a mirror
+        url = entry.get("origin") or entry["url"]
+        folder = entry.get("folder", "")
+        filename = entry.get("filename", os.path.basename(entry["path"]))
+        download = active_downloads[download_id] = Download(
+            download_id, url, folder, filename, entry["path"]
+        )
+        download.total_size = entry.get("total_size", 0)
+        if entry.get("sha256"):
+            download.expected_sha256 = entry["sha256"]
+        _in_flight[folder, filename] = download_id
+        _queue_download(download_id, url, entry["path"], _default_priority(folder))
+
+
+def resume_interrupted_downloads() -> None:
+    """Schedule a resume of downloads that were running when ComfyUI stopped."""
+    PromptServer.instance.loop.create_task(_resume_interrupted_downloads())
+
+
+def start_filename_index() -> None:
+    """Build the model filename index in the background and keep it current."""
+    task = PromptServer.instance.loop.create_task(_filename_index.run(INDEX_REFRESH_INTERVAL))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def start_loop_monitor() -> None:
+    """Sample the server loop's lag and attribute stalls, unless disabled."""
+    if not LOOP_MONITOR or _loop_monitor.running:
+        return
+    task = PromptServer.instance.loop.create_task(_loop_monitor.run(LOOP_SUMMARY_INTERVAL))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 
 async def download_file(download_id: str, url: str, full_path: str) -> None:
@@ -290,7 +810,8 @@ async def download_file(download_id: str, url: str, full_path: str) -> None:
 
     Uses aiohttp for non-blocking downloads that won't starve the event loop.
     If the file already exists with a size matching the remote Content-Length,
-    the download is skipped and a "skipped" notification is sent.
+    the download is skipped and a "skipped" notification is sent. Configured
+    mirrors and URL rewrites are tried before *url* (see ``_download_sources``).
 
     Args:
         download_id: Unique identifier for this download.
@@ -300,43 +821,242 @@ async def download_file(download_id: str, url: str, full_path: str) -> None:
     try:
         logger.info("Starting download task for %s to %s", download_id, full_path)
 
-        # Auth headers (needed for gated HuggingFace models)
-        headers = _auth_headers_for_url(url)
+        session = _get_session()
+        sources = await _download_sources(url, full_path)
+
+        # The remote size decides whether an existing file is complete and
+        # whether the download fits on the disk. It is a fresh cached one,
+        # else the one in the headers of the download's first GET, whose body
+        # is only read if the download goes ahead. A part file to resume
+        # already has its space and knows its size from the journal.
+        response = None
+        cached = await _cached_metadata(url, _auth_headers_for_url(url))
+        if cached is not None:
+            _apply_metadata(download_id, cached)
+        elif not await asyncio.to_thread(_has_resumable_part, full_path):
+            response, sources = await _open_first_source(session, download_id, url, sources)
+
+        download = active_downloads.get(download_id)
+        remote_size = download.total_size if download is not None else 0
+
+        # Prepare destination directory (may skip if file exists with same size)
+        try:
+            prepared_path = await _prepare_download_path(download_id, full_path, remote_size)
+        except BaseException:
+            if response is not None:
+                response.close()
+            raise
+        if prepared_path is None:
+            if response is not None:
+                # Skipped or failed: drop the connection without reading the body
+                response.close()
+            # Either skipped (file exists) or error — both already notified
+            return
+
+        # Download the file
+        await _download_from_sources(
+            session, download_id, url, prepared_path, sources, response=response
+        )
+
+    except (OSError, TimeoutError) as e:
+        logger.exception("Error downloading file")
+        # Only these messages are known not to contain the URL
+        await _fail_download(
+            download_id,
+            str(e)
+            if isinstance(e, _ChecksumMismatchError | _InsufficientSpaceError)
+            else "Download failed",
+        )
+    except Exception:
+        logger.exception("Unexpected error downloading file")
+        await _fail_download(download_id, "Download failed")
+
 
-        # Create ClientTimeout with reasonable values
-        timeout = ClientTimeout(total=None, connect=30, sock_connect=30, sock_read=30)
+async def _download_sources(url: str, full_path: str) -> list[str]:
+    """The URLs to fetch *url* from, in order: rewrites, mirrors, then *url*.
 
-        async with ClientSession(timeout=timeout) as session:
-            # Get file size via HEAD request first (needed for skip-if-exists check)
-            await _fetch_content_length(session, download_id, url, headers=headers)
+    An interrupted download starts with the source its part file came from,
+    so it resumes instead of starting over somewhere else.
+    """
+    sources = _mirrors.sources(url)
+    if len(sources) > 1:
+        entry = await asyncio.to_thread(load_journal, _journal_dir(), full_path)
+        if entry is not None and entry.get("url") in sources:
+            sources.remove(entry["url"])
+            sources.insert(0, entry["url"])
+    return sources
 
-            remote_size = 0
-            if download_id in active_downloads:
-                remote_size = active_downloads[download_id].get("total_size", 0)
 
-            # Prepare destination directory (may skip if file exists with same size)
-            prepared_path = await _prepare_download_path(download_id, full_path, remote_size)
-            if prepared_path is None:
-                # Either skipped (file exists) or error — both already notified
-                # Clean up after visibility timeout (same as completed downloads)
-                await asyncio.sleep(60)
-                active_downloads.pop(download_id, None)
-                return
+def _source_headers(url: str, source: str) -> dict[str, str]:
+    """Auth headers for fetching *url* from *source*.
 
-            # Download the file
-            await _download_with_progress(session, download_id, url, prepared_path, headers=headers)
+    The original URL's credentials only go to the URL itself and to mirrors
+    trusted with them; any other source gets what its own host would.
+    """
+    if source == url or _mirrors.forwards_auth(source):
+        return _auth_headers_for_url(url)
+    return _auth_headers_for_url(source)
 
-        # Keep download info for 60 seconds for frontend visibility
-        await asyncio.sleep(60)
-        active_downloads.pop(download_id, None)
 
-    except (OSError, TimeoutError):
-        logger.exception("Error downloading file")
-        if download_id in active_downloads:
-            active_downloads[download_id]["status"] = "error"
-            active_downloads[download_id]["error"] = "Download failed"
-            active_downloads[download_id]["end_time"] = time.time()
-            await send_download_update(download_id)
+def _source_label(source: str) -> str:
+    # Hosts only: URLs may carry credentials and signed queries
+    return urlparse(source).hostname or "?"
+
+
+async def _open_first_source(
+    session: ClientSession, download_id: str, url: str, sources: list[str]
+) -> tuple[ClientResponse, list[str]]:
+    """Open the first of *sources* that answers; returns it with the untried rest.
+
+    Connection errors and error statuses (a mirror's 404 for a file it does
+    not have) move on to the next source; the last one's error is raised.
+    """
+    for index, source in enumerate(sources):
+        try:
+            # A mirror that cannot serve the download is passed over at once
+            response = await _open_download(
+                session,
+                download_id,
+                source,
+                headers=_source_headers(url, source),
+                retry=index == len(sources) - 1,
+            )
+        except (OSError, TimeoutError) as e:
+            if index == len(sources) - 1:
+                raise
+            logger.warning(
+                "[%s] %s cannot serve the download (%s), trying %s",
+                download_id,
+                _source_label(source),
+                e,
+                _source_label(sources[index + 1]),
+            )
+        else:
+            return response, sources[index:]
+    msg = "No download sources"
+    raise OSError(msg)
+
+
+async def _download_from_sources(
+    session: ClientSession,
+    download_id: str,
+    url: str,
+    full_path: str,
+    sources: list[str],
+    *,
+    response: ClientResponse | None = None,
+) -> None:
+    """Download *full_path* from the first of *sources* that can deliver it.
+
+    *response* is an open first GET to ``sources[0]``. A source that fails,
+    misses the file, serves data with the wrong checksum, or (for a mirror)
+    stays below ``MIRROR_MIN_RATE`` hands over to the next one, which
+    starts from scratch; the last source's error is raised. Running out of
+    disk space is not the source's fault and fails at once.
+    """
+    for index, source in enumerate(sources):
+        try:
+            await _download_with_progress(
+                session,
+                download_id,
+                source,
+                full_path,
+                headers=_source_headers(url, source),
+                response=response,
+                min_rate=None if source == url else _mirror_min_rate(download_id, source),
+                retry_open=index == len(sources) - 1,
+            )
+        except _InsufficientSpaceError:
+            raise
+        except (OSError, TimeoutError) as e:
+            if index == len(sources) - 1:
+                raise
+            logger.warning(
+                "[%s] Download from %s failed (%s), falling back to %s",
+                download_id,
+                _source_label(source),
+                e,
+                _source_label(sources[index + 1]),
+            )
+            response = None
+        else:
+            return
+
+
+def _mirror_min_rate(download_id: str, source: str) -> float | None:
+    """Throughput below which a mirror is abandoned, allowing for bandwidth caps."""
+    if not MIRROR_MIN_RATE:
+        return None
+    cap = _limiter.lowest_rate(download_id, _scheduler.host_key(source))
+    return MIRROR_MIN_RATE if cap is None else min(MIRROR_MIN_RATE, cap / 2)
+
+
+def _forget_download(download_id: str) -> None:
+    if active_downloads.pop(download_id, None) is not None:
+        _changes.remove(download_id)
+    for key in [key for key, value in _in_flight.items() if value == download_id]:
+        del _in_flight[key]
+    _broadcaster.forget(download_id)
+    _limiter.forget(download_id)
+
+
+# Finished downloads, forgotten RETENTION_SECONDS after they finish
+_retention = RetentionQueue(RETENTION_SECONDS, _forget_download)
+
+# History rows waiting for the writer, and the task writing them
+_pending_history: list[dict[str, Any]] = []
+_history_writer: asyncio.Task[None] | None = None
+
+
+def _download_finished(download: Download) -> None:
+    """Schedule a finished download to be forgotten and record it in the history.
+
+    Rows finished while the writer is busy are written together by its next
+    round, so a burst of finishing downloads costs one transaction.
+    """
+    global _history_writer  # noqa: PLW0603
+    _retention.add(download.download_id)
+    _pending_history.append(_history_row(download))
+    if _history_writer is None or _history_writer.done():
+        _history_writer = asyncio.get_running_loop().create_task(_write_history())
+
+
+def _history_row(download: Download) -> dict[str, Any]:
+    finished_at = download.end_time or time.time()
+    duration = max(0.0, finished_at - download.start_time)
+    throughput = None
+    if download.status == COMPLETED and duration > 0:
+        throughput = round(download.downloaded / duration)
+    return {
+        "download_id": download.download_id,
+        "url": _redacted_url(download.url),
+        "folder": download.folder,
+        "filename": download.filename,
+        "path": download.path,
+        "status": download.status,
+        "error": download.error,
+        "total_size": download.total_size,
+        "downloaded": download.downloaded,
+        "sha256": download.sha256,
+        "started_at": download.start_time,
+        "finished_at": finished_at,
+        "duration": round(duration, 3),
+        "throughput": throughput,
+    }
+
+
+async def _write_history() -> None:
+    while _pending_history:
+        rows = _pending_history.copy()
+        _pending_history.clear()
+        try:
+            await asyncio.to_thread(record_history, _state_dir(), rows)
+        except (OSError, sqlite3.Error):
+            logger.warning("Could not record %d downloads in the history", len(rows), exc_info=True)
+
+
+def _has_resumable_part(full_path: str) -> bool:
+    return not os.path.exists(full_path) and os.path.exists(part_path_for(full_path))
 
 
 async def _prepare_download_path(download_id: str, full_path: str, remote_size: int) -> str | None:
@@ -344,8 +1064,13 @@ async def _prepare_download_path(download_id: str, full_path: str, remote_size:
 
     If the file already exists and its size matches *remote_size*, the download
     is skipped — a "skipped" status is sent via WebSocket and ``None`` is returned.
-    When *remote_size* is 0 (unknown) the size check is skipped and the existing
-    file is kept by appending a timestamp to the new download.
+    When the request names an expected SHA-256, the file's digest must match
+    instead (see ``_existing_file_matches``). When *remote_size* is 0 (unknown)
+    the size check is skipped and the existing file is kept by appending a
+    timestamp to the new download.
+
+    A download of known size that would not fit on the disk (see
+    ``_disk_space_error``) fails here, before anything is written.
     """
     try:
         target_directory = os.path.dirname(full_path)
@@ -356,21 +1081,24 @@ async def _prepare_download_path(download_id: str, full_path: str, remote_size:
         # Handle existing file conflicts
         if os.path.exists(full_path):
             local_size = os.path.getsize(full_path)
+            download = active_downloads.get(download_id)
+            expected_sha256 = download.expected_sha256 if download is not None else None
 
-            # If remote size is known and matches, skip the download entirely
-            if remote_size > 0 and local_size == remote_size:
+            # If the existing file is the requested one, skip the download entirely
+            if await _existing_file_matches(full_path, local_size, remote_size, expected_sha256):
                 logger.info(
-                    "File already exists at %s with matching size (%d bytes). Skipping download.",
+                    "File already exists at %s with matching %s (%d bytes). Skipping download.",
                     full_path,
+                    "sha256" if expected_sha256 else "size",
                     local_size,
                 )
-                if download_id in active_downloads:
-                    active_downloads[download_id]["status"] = "skipped"
-                    active_downloads[download_id]["total_size"] = local_size
-                    active_downloads[download_id]["downloaded"] = local_size
-                    active_downloads[download_id]["percent"] = 100
-                    active_downloads[download_id]["end_time"] = time.time()
+                if download is not None:
+                    download.transition(SKIPPED)
+                    download.total_size = download.downloaded = local_size
+                    download.percent = 100
+                    _download_results.inc(result="skipped")
                     await send_download_update(download_id)
+                    _download_finished(download)
                 return None
 
             # Size mismatch or unknown — append timestamp to avoid overwriting
@@ -384,174 +1112,1318 @@ async def _prepare_download_path(download_id: str, full_path: str, remote_size:
             timestamped_filename = f"{filename_parts[0]}_{int(time.time())}{filename_parts[1]}"
             full_path = os.path.join(target_directory, timestamped_filename)
 
-            if download_id in active_downloads:
-                active_downloads[download_id]["path"] = full_path
-                active_downloads[download_id]["filename"] = timestamped_filename
+            if download is not None:
+                download.path = full_path
+                download.filename = timestamped_filename
                 logger.info("Updated download path to: %s", full_path)
+
+        if remote_size > 0:
+            space_error = await _check_disk_space(download_id, full_path, remote_size)
+            if space_error is not None:
+                logger.error("Not starting %s: %s", download_id, space_error)
+                await _fail_download(download_id, space_error)
+                return None
     except OSError as e:
         logger.exception("Error preparing download directory")
-        if download_id in active_downloads:
-            active_downloads[download_id]["status"] = "error"
-            active_downloads[download_id]["error"] = f"Failed to create directory: {e}"
-            await send_download_update(download_id)
+        await _fail_download(download_id, f"Failed to create directory: {e}")
         return None
     else:
         return full_path
 
 
+async def _check_disk_space(download_id: str, full_path: str, size: int) -> str | None:
+    """Why a *size*-byte download to *full_path* cannot start, or None if it fits."""
+    others = [
+        (download.path, download.total_size)
+        for other_id, download in active_downloads.items()
+        if other_id != download_id and download.status == DOWNLOADING
+        if download.path
+    ]
+    return await asyncio.to_thread(_disk_space_error, full_path, size, others)
+
+
+def _disk_space_error(full_path: str, size: int, others: list[tuple[str, int]]) -> str | None:
+    """Admission check for a download of *size* bytes to *full_path*; blocking.
+
+    Free space must cover what is not yet allocated to the download's part
+    file, plus what the running downloads in *others* (path, size) on the same
+    filesystem still have to allocate, plus ``MIN_FREE_SPACE``. Preallocated
+    part files are already counted by the filesystem.
+    """
+    directory = os.path.dirname(full_path)
+    try:
+        free = shutil.disk_usage(directory).free
+        device = os.stat(directory).st_dev
+    except OSError:
+        # Nothing to go by; let the write itself find out
+        return None
+
+    needed = max(0, size - _allocated_bytes(part_path_for(full_path)))
+    pending = 0
+    for path, total_size in others:
+        try:
+            if os.stat(os.path.dirname(path)).st_dev != device:
+                continue
+        except OSError:
+            continue
+        pending += max(0, total_size - _allocated_bytes(part_path_for(path)))
+
+    available = free - pending - MIN_FREE_SPACE
+    if needed <= available:
+        return None
+    gib = 1024**3
+    return (
+        f"Not enough disk space: {needed / gib:.1f} GB needed, "
+        f"{max(available, 0) / gib:.1f} GB available"
+    )
+
+
+def _allocated_bytes(path: str) -> int:
+    """Disk space allocated to *path*, which may be sparse; 0 if it is missing."""
+    try:
+        return os.stat(path).st_blocks * 512
+    except (FileNotFoundError, AttributeError):
+        return 0
+
+
+async def _existing_file_matches(
+    full_path: str, local_size: int, remote_size: int, expected_sha256: str | None
+) -> bool:
+    """Whether an existing file at *full_path* is the one being downloaded.
+
+    Without an expected digest this is the size comparison. With one, the
+    digest recorded when the file was downloaded decides; a file without a
+    valid record is hashed once, unless its size already rules it out, and
+    the result recorded for next time.
+    """
+    if not expected_sha256:
+        return remote_size > 0 and local_size == remote_size
+    if remote_size > 0 and local_size != remote_size:
+        return False
+    state_dir = _state_dir()
+    digest = await asyncio.to_thread(lookup_digest, state_dir, full_path)
+    if digest is None:
+        logger.info("Hashing existing %s to compare with the expected sha256", full_path)
+        digest = await asyncio.to_thread(file_sha256, full_path)
+        await asyncio.to_thread(record_digest, state_dir, full_path, digest)
+    return digest == expected_sha256
+
+
 async def _fetch_content_length(
     session: ClientSession, download_id: str, url: str, headers: dict[str, str] | None = None
 ) -> None:
     """Fetch content length via HEAD request."""
     try:
+        started = time.monotonic()
         async with session.head(url, allow_redirects=True, headers=headers) as head_response:
+            _head_latency.observe(time.monotonic() - started, host=_scheduler.host_key(url))
             if head_response.status == HTTPStatus.OK:
                 content_length = head_response.headers.get("content-length")
                 if content_length:
                     total_size = int(content_length)
                     content_type = head_response.headers.get("content-type", "")
+                    accept_ranges = head_response.headers.get("accept-ranges", "").lower()
                     size_mb = total_size / (1024 * 1024)
                     logger.info("File size from HEAD: %d bytes (%.2f MB)", total_size, size_mb)
 
-                    if download_id in active_downloads:
-                        active_downloads[download_id]["total_size"] = total_size
-                        active_downloads[download_id]["content_type"] = content_type
+                    download = active_downloads.get(download_id)
+                    if download is not None:
+                        download.total_size = total_size
+                        download.content_type = content_type
+                        download.accept_ranges = accept_ranges == "bytes"
+                        download.etag = head_response.headers.get("etag")
             else:
                 logger.warning("HEAD request returned status %d", head_response.status)
     except (OSError, TimeoutError) as e:
         logger.warning("HEAD request failed: %s", e)
 
 
+async def _open_download(
+    session: ClientSession,
+    download_id: str,
+    url: str,
+    headers: dict[str, str] | None = None,
+    *,
+    retry: bool = True,
+) -> ClientResponse:
+    """Send the first GET of a fresh download and record what its headers say.
+
+    The request asks for ``bytes=0-``: an origin that supports ranges answers
+    206 with the total size in Content-Range, one that does not sends the
+    whole file with a 200. Either way this one round trip gives the size, the
+    validator and whether the download can be segmented, so no HEAD has to
+    go first. The body is left unread for the caller, who must close the
+    response. Transient failures are retried (see ``_retry_or_raise``)
+    unless *retry* is false.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await _send_first_get(session, download_id, url, headers)
+        except (OSError, TimeoutError, ClientError) as e:
+            attempt += 1
+            await _retry_or_raise(download_id, url, e, attempt if retry else None)
+
+
+async def _send_first_get(
+    session: ClientSession, download_id: str, url: str, headers: dict[str, str] | None
+) -> ClientResponse:
+    request_headers = {**(headers or {}), "Range": "bytes=0-"}
+    started = time.monotonic()
+    response = await session.get(url, allow_redirects=True, headers=request_headers)
+    _time_to_first_byte.observe(time.monotonic() - started, host=_scheduler.host_key(url))
+    try:
+        if response.status == HTTPStatus.PARTIAL_CONTENT:
+            start, total_size = _parse_content_range(response.headers.get("content-range", ""))
+            if start != 0:
+                raise OSError(f"Origin answered bytes=0- from byte {start}")
+            accept_ranges = total_size > 0
+        elif response.status == HTTPStatus.OK:
+            total_size = int(response.headers.get("content-length") or 0)
+            accept_ranges = False
+        else:
+            raise _http_error(response)
+    except BaseException:
+        response.close()
+        raise
+
+    logger.info("File size from GET: %d bytes (%.2f MB)", total_size, total_size / (1024 * 1024))
+    metadata = _metadata_from_response(response, total_size or None, accept_ranges=accept_ranges)
+    _apply_metadata(download_id, metadata)
+    try:
+        await _remember_metadata({url: {**metadata, "authenticated": bool(headers)}})
+    except OSError:
+        logger.warning("Could not update the metadata cache", exc_info=True)
+    return response
+
+
+def _metadata_from_response(
+    response: ClientResponse, size: int | None, *, accept_ranges: bool
+) -> dict[str, Any]:
+    """What a response says about its URL, in the metadata cache's format."""
+    status = response.status
+    if status == HTTPStatus.PARTIAL_CONTENT:
+        # The answer to bytes=0-: the file is there just as for a 200
+        status = HTTPStatus.OK
+    return {
+        "status": status,
+        "size": size,
+        "content_type": response.headers.get("content-type", ""),
+        "etag": response.headers.get("etag"),
+        "accept_ranges": accept_ranges,
+        "final_url": _redacted_url(str(response.url)),
+        "auth_required": status in {HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN},
+    }
+
+
+def _redacted_url(url: str) -> str:
+    """*url* without credentials, query or fragment.
+
+    Redirects to CDNs carry short-lived signatures in the query string; they
+    are neither useful once expired nor anything to store or show.
+    """
+    parsed = urlparse(url)
+    netloc = parsed.hostname or ""
+    if parsed.port is not None:
+        netloc = f"{netloc}:{parsed.port}"
+    return parsed._replace(netloc=netloc, query="", fragment="").geturl()
+
+
+def _apply_metadata(download_id: str, metadata: dict[str, Any]) -> None:
+    download = active_downloads.get(download_id)
+    if download is not None:
+        download.total_size = metadata.get("size") or 0
+        download.content_type = metadata.get("content_type") or ""
+        download.accept_ranges = bool(metadata.get("accept_ranges"))
+        download.etag = metadata.get("etag")
+
+
+async def _cached_metadata(url: str, headers: dict[str, str] | None) -> dict[str, Any] | None:
+    """The fresh cached metadata of a URL known to exist, with its size."""
+    state_dir = _state_dir()
+    try:
+        found = await asyncio.to_thread(lookup_metadata, state_dir, {url: bool(headers)})
+    except OSError:
+        return None
+    metadata = found.get(url)
+    if metadata is None or metadata.get("status") != HTTPStatus.OK or not metadata.get("size"):
+        return None
+    return metadata
+
+
+async def _remember_metadata(records: dict[str, dict[str, Any]]) -> None:
+    await asyncio.to_thread(
+        record_metadata, _state_dir(), records, METADATA_TTL, METADATA_ERROR_TTL
+    )
+
+
+def _parse_content_range(header: str) -> tuple[int, int]:
+    """First byte and total size from ``bytes 0-99/1234``; an unknown size is 0."""
+    unit, _, spec = header.partition(" ")
+    byte_range, _, total = spec.partition("/")
+    first, _, _ = byte_range.partition("-")
+    try:
+        start = int(first)
+        total_size = 0 if total.strip() == "*" else int(total)
+    except ValueError:
+        raise OSError(f"Invalid Content-Range: {header!r}") from None
+    if unit.lower() != "bytes":
+        raise OSError(f"Invalid Content-Range: {header!r}")
+    return start, total_size
+
+
+class _TransferProgress:
+    """Byte count of one download and its periodic reporting.
+
+    A segmented download shares one instance between all of its connections,
+    so the frontend still sees a single progress figure per download. The
+    connections only add to ``downloaded``; ``run`` samples it every
+    ``PROGRESS_INTERVAL`` seconds into the download's record and metrics,
+    logs every 10% and publishes the update. Bytes already on disk from a
+    resumed download count towards progress but not towards speed.
+
+    With a *min_rate*, a download that receives less than that many bytes
+    per second over ``MIRROR_CHECK_INTERVAL``, once ``MIRROR_GRACE_PERIOD``
+    has passed, fails with ``_SlowSourceError`` at its next chunk.
+    """
+
+    def __init__(
+        self,
+        download_id: str,
+        total_size: int,
+        resumed: int = 0,
+        host: str = "",
+        min_rate: float | None = None,
+    ) -> None:
+        self.download_id = download_id
+        self.download = active_downloads.get(download_id)
+        self.host = host
+        self.total_size = total_size
+        self.downloaded = resumed
+        self.resumed = resumed
+        self.min_rate = min_rate
+        self.failure: _SlowSourceError | None = None
+        self._started = time.monotonic()
+        # Bytes already added to the downloaded-bytes metric
+        self._counted = resumed
+        self._window_start = self._started + MIRROR_GRACE_PERIOD
+        self._window_offset: int | None = None
+        self._tenths_logged = 0
+
+    def advance(self, nbytes: int) -> None:
+        """Account for *nbytes* received."""
+        self.downloaded += nbytes
+        if self.failure is not None:
+            raise self.failure
+
+    def rewind(self, nbytes: int) -> None:
+        """Forget *nbytes* that have to be fetched again."""
+        self._count_bytes()
+        self.downloaded -= nbytes
+        self.resumed = min(self.resumed, self.downloaded)
+        self._counted = self.downloaded
+        # Measure the source's rate afresh
+        self._window_offset = None
+
+    async def run(self) -> None:
+        """Sample and publish the download's progress until cancelled."""
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            self.sample()
+            await send_download_update(self.download_id)
+
+    def sample(self) -> None:
+        """Bring the metrics and the download's record up to date."""
+        now = time.monotonic()
+        self._count_bytes()
+        if self.min_rate:
+            self._check_rate(now)
+        download = self.download
+        if download is None or not download.active:
+            return
+        download.update_progress(
+            self.downloaded, self.downloaded - self.resumed, now - self._started
+        )
+
+        tenths = download.percent // 10
+        if tenths > self._tenths_logged:
+            self._tenths_logged = tenths
+            _log_progress(download)
+
+    def _count_bytes(self) -> None:
+        if self.downloaded > self._counted:
+            _bytes_downloaded.inc(self.downloaded - self._counted, host=self.host)
+            self._counted = self.downloaded
+
+    def _check_rate(self, now: float) -> None:
+        if now < self._window_start:
+            return
+        if self._window_offset is None:
+            self._window_start, self._window_offset = now, self.downloaded
+            return
+        elapsed = now - self._window_start
+        if elapsed < MIRROR_CHECK_INTERVAL:
+            return
+        rate = (self.downloaded - self._window_offset) / elapsed
+        if rate < self.min_rate:
+            self.failure = _SlowSourceError(
+                f"{self.host} sent {rate / 1024:.0f} KiB/s, "
+                f"below the minimum of {self.min_rate / 1024:.0f} KiB/s"
+            )
+        self._window_start, self._window_offset = now, self.downloaded
+
+
+class _Segment:
+    """Inclusive byte range ``start..end`` of a download and its progress.
+
+    ``offset`` is the next byte to request and ``written`` the end of the data
+    the writer thread has put on disk; only the latter is journaled. ``end``
+    is None while the total size is unknown, in which case the segment runs to
+    the end of the response.
+    """
+
+    __slots__ = ("end", "offset", "start", "written")
+
+    def __init__(self, start: int, end: int | None, offset: int | None = None) -> None:
+        self.start = start
+        self.end = end
+        self.offset = start if offset is None else offset
+        self.written = self.offset
+
+    def reset(self) -> None:
+        self.offset = self.written = self.start
+
+    @property
+    def done(self) -> bool:
+        return self.end is not None and self.offset > self.end
+
+    def range_header(self) -> str:
+        return f"bytes={self.offset}-{'' if self.end is None else self.end}"
+
+
+class _ResumableTransfer:
+    """A download written to ``<path>.part`` and described by an on-disk journal.
+
+    Methods that touch the disk block and are run via ``asyncio.to_thread``.
+    """
+
+    def __init__(
+        self,
+        download_id: str,
+        url: str,
+        full_path: str,
+        total_size: int = 0,
+        etag: str | None = None,
+    ) -> None:
+        self.download_id = download_id
+        self.url = url
+        self.full_path = full_path
+        self.part_path = part_path_for(full_path)
+        self.total_size = total_size
+        self.etag = etag
+        self.segments: list[_Segment] = []
+        self.resumed = False
+        self.fd = -1
+        # Serialises checkpoints (run from worker threads) with commit/close
+        self._lock = threading.Lock()
+        self._finished = False
+
+    @property
+    def downloaded(self) -> int:
+        return sum(segment.offset - segment.start for segment in self.segments)
+
+    def open(self, segments: list[_Segment]) -> None:
+        """Start *segments* in a fresh part file, preallocated to the total size."""
+        self.segments = segments
+        self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        if self.total_size > 0:
+            try:
+                _preallocate(self.fd, self.total_size)
+            except OSError as e:
+                os.close(self.fd)
+                self.fd = -1
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.part_path)
+                if e.errno == errno.ENOSPC:
+                    gib = 1024**3
+                    raise _InsufficientSpaceError(
+                        f"Not enough disk space: {self.total_size / gib:.1f} GB needed"
+                    ) from e
+                raise
+        self.checkpoint()
+
+    def resume(self, entry: dict[str, Any]) -> None:
+        """Continue the part file from where the journal *entry* left it."""
+        self.total_size = entry.get("total_size") or 0
+        self.etag = entry.get("etag")
+        self.segments = [_Segment(*values) for values in entry["segments"]]
+        self.fd = os.open(self.part_path, os.O_RDWR)
+        self.resumed = True
+
+    def restart(self, segments: list[_Segment]) -> None:
+        """Discard progress and continue with *segments* from scratch."""
+        self.segments = segments
+        os.ftruncate(self.fd, self.total_size)
+        self.checkpoint()
+
+    def checkpoint(self, state: str = STATE_RUNNING) -> None:
+        """Flush written data, then record the confirmed offsets in the journal."""
+        with self._lock:
+            if not self._finished:
+                self._checkpoint(state)
+
+    def _checkpoint(self, state: str) -> None:
+        # Snapshot before syncing: only bytes written by now are confirmed.
+        segments = [[s.start, s.end, s.written] for s in self.segments]
+        if self.fd >= 0:
+            os.fsync(self.fd)
+        download = active_downloads.get(self.download_id)
+        save_journal(
+            _journal_dir(),
+            {
+                "download_id": self.download_id,
+                "url": self.url,
+                "origin": download.url if download else self.url,
+                "folder": download.folder if download else "",
+                "filename": download.filename if download else os.path.basename(self.full_path),
+                "path": self.full_path,
+                "etag": self.etag,
+                "total_size": self.total_size,
+                "segments": segments,
+                "sha256": download.expected_sha256 if download else None,
+                "state": state,
+            },
+        )
+
+    def close(self, state: str) -> None:
+        """Checkpoint and release the part file, keeping it for a later resume."""
+        with self._lock:
+            self._close(state)
+
+    def _close(self, state: str) -> None:
+        self._finished = True
+        try:
+            self._checkpoint(state)
+        finally:
+            if self.fd >= 0:
+                os.close(self.fd)
+                self.fd = -1
+
+    def discard(self) -> None:
+        """Delete the part file and journal; the data cannot be used."""
+        with self._lock:
+            self._finished = True
+            if self.fd >= 0:
+                os.close(self.fd)
+                self.fd = -1
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.part_path)
+            delete_journal(_journal_dir(), self.full_path)
+
+    def commit(self) -> None:
+        """Move the completed part file into place and drop the journal.
+
+        Raises OSError, and keeps the part file as a failed download, if any
+        segment has not been written to its end: the reader's offsets alone
+        do not prove the data reached the file.
+        """
+        size = self.segments[-1].end + 1 if self.segments[-1].end is not None else 0
+        with self._lock:
+            for segment in self.segments:
+                if segment.end is None or segment.written <= segment.end:
+                    self._close(STATE_FAILED)
+                    msg = (
+                        f"Segment {segment.start}-{segment.end} written only up to byte "
+                        f"{segment.written}"
+                    )
+                    raise OSError(msg)
+            self._finished = True
+            if os.fstat(self.fd).st_size != size:
+                os.ftruncate(self.fd, size)
+            os.fsync(self.fd)
+            os.close(self.fd)
+            self.fd = -1
+            os.replace(self.part_path, self.full_path)
+            delete_journal(_journal_dir(), self.full_path)
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """Size the file *fd* to *size* bytes, reserving its blocks if possible.
+
+    ``posix_fallocate`` lets the filesystem place the file contiguously and
+    fails up front with ENOSPC if it does not fit. Filesystems without it get
+    a sparse file, as does everything with ``MODEL_DOWNLOADER_PREALLOCATE=0``
+    (glibc emulates fallocate by writing every block on some network mounts,
+    which is slow for multi-GB files).
+    """
+    if PREALLOCATE and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError as e:
+            if e.errno not in {errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS}:
+                raise
+        else:
+            return
+    os.ftruncate(fd, size)
+
+
+def _state_dir() -> str:
+    """Directory holding the downloader's persistent state."""
+    override = os.getenv("MODEL_DOWNLOADER_STATE_DIR")
+    if override:
+        return override
+    return os.path.join(folder_paths.get_user_directory(), "model_downloader")
+
+
+def _journal_dir() -> str:
+    return os.path.join(_state_dir(), "journal")
+
+
 async def _download_with_progress(
     session: ClientSession,
     download_id: str,
     url: str,
     full_path: str,
+    *,
     headers: dict[str, str] | None = None,
+    response: ClientResponse | None = None,
+    min_rate: float | None = None,
+    retry_open: bool = True,
 ) -> None:
-    """Download file with progress tracking."""
-    async with session.get(url, allow_redirects=True, headers=headers) as response:
-        if response.status != HTTPStatus.OK:
-            raise OSError(f"HTTP error {response.status}: {response.reason}")
+    """Download file with progress tracking.
+
+    Data goes to ``<full_path>.part`` and is only moved into place once
+    complete. Confirmed offsets are journaled periodically, so a failed or
+    interrupted download resumes with Range requests from the last confirmed
+    byte. Large files from origins that support ranges are fetched over
+    several connections.
+
+    *response* is the unread first GET from ``_open_download``, if the caller
+    already sent it; it starts a fresh download and its body becomes the
+    first segment. The response is closed in every case. *min_rate* abandons
+    a source that is too slow (see ``_TransferProgress``). Connections that
+    drop mid-transfer are reopened from where they stopped; *retry_open*
+    false fails at once if the first request does.
+
+    A SHA-256 is computed as the data is written and recorded for the finished
+    file. If the request named an expected digest and it differs, the data is
+    deleted and ``_ChecksumMismatchError`` raised.
+    """
+    download = active_downloads.get(download_id)
+    transfer = _ResumableTransfer(download_id, url, full_path)
+    try:
+        entry = None
+        if response is None:
+            entry = await _resumable_journal(session, transfer, headers)
+        if entry is not None:
+            await asyncio.to_thread(transfer.resume, entry)
+            if download is not None:
+                download.total_size = transfer.total_size
+                download.etag = transfer.etag
+        else:
+            if response is None:
+                response = await _open_download(
+                    session, download_id, url, headers=headers, retry=retry_open
+                )
+            if download is not None:
+                transfer.total_size = download.total_size
+                transfer.etag = download.etag
+            segments = _initial_segments(
+                transfer.total_size, segmented=_should_segment(download_id)
+            )
+            await asyncio.to_thread(transfer.open, segments)
+    except BaseException:
+        if response is not None:
+            response.close()
+        raise
+
+    if transfer.resumed:
+        logger.info(
+            "[%s] Resuming download at %.2f MB", download_id, transfer.downloaded / (1024 * 1024)
+        )
+    if download is not None:
+        download.segments = len(transfer.segments)
+
+    logger.info(
+        "[%s] Beginning data transfer for %s (%.2f MB, %d connection(s))",
+        download_id,
+        os.path.basename(full_path),
+        transfer.total_size / (1024 * 1024),
+        len(transfer.segments),
+    )
+
+    try:
+        try:
+            hasher = await _run_transfer(
+                session, transfer, headers, response=response, min_rate=min_rate
+            )
+        except _RangeNotSupportedError:
+            logger.warning(
+                "[%s] Origin ignored Range request, falling back to a single stream",
+                download_id,
+            )
+            segments = _initial_segments(transfer.total_size, segmented=False)
+            await asyncio.to_thread(transfer.restart, segments)
+            hasher = await _run_transfer(session, transfer, headers, min_rate=min_rate)
+        # Usually a no-op: only data the writer had no idle time to read back
+        digest = await asyncio.to_thread(hasher.hexdigest, transfer.fd)
+    except asyncio.CancelledError:
+        # Server shutdown: keep the journal "running" so startup resumes it.
+        # Shielded, so a second cancellation cannot skip the checkpoint.
+        await asyncio.shield(asyncio.to_thread(transfer.close, STATE_RUNNING))
+        raise
+    except BaseException:
+        await asyncio.to_thread(transfer.close, STATE_FAILED)
+        raise
+
+    expected_sha256 = download.expected_sha256 if download is not None else None
+    if expected_sha256 and digest != expected_sha256:
+        await asyncio.to_thread(transfer.discard)
+        logger.error(
+            "[%s] sha256 mismatch: expected %s, got %s", download_id, expected_sha256, digest
+        )
+        raise _ChecksumMismatchError(f"sha256 mismatch: expected {expected_sha256}, got {digest}")
+
+    await asyncio.to_thread(transfer.commit)
+    _filename_index.add(full_path)
+    await asyncio.to_thread(record_digest, _state_dir(), full_path, digest)
+
+    # Mark download as completed
+    if download is not None:
+        download.sha256 = digest
+    _finalize_download(download_id, transfer.downloaded, transfer.total_size, full_path)
+    await send_download_update(download_id)
+    if download is not None:
+        _download_finished(download)
+
+
+async def _resumable_journal(
+    session: ClientSession,
+    transfer: _ResumableTransfer,
+    headers: dict[str, str] | None = None,
+) -> dict[str, Any] | None:
+    """The journal of an interrupted download of the same file, if it can go on.
+
+    A strong ETag is sent as If-Range with every request, so an origin whose
+    file has changed answers with the whole new file and the download starts
+    over; nothing has to be checked up front. Without one, a HEAD compares
+    the remote size and validator with the journal's first, since a changed
+    file must not be spliced onto the old data.
+    """
+    entry = await asyncio.to_thread(load_journal, _journal_dir(), transfer.full_path)
+    if entry is None or entry.get("url") != transfer.url:
+        return None
+    if not await asyncio.to_thread(os.path.isfile, transfer.part_path):
+        return None
+    if _is_strong_etag(entry.get("etag")):
+        return entry
 
-        # Get or update file size
-        total_size = _get_or_update_total_size(download_id, response)
+    await _fetch_content_length(session, transfer.download_id, transfer.url, headers=headers)
+    download = active_downloads.get(transfer.download_id)
+    if download is None:
+        return None
+    total_size, etag = download.total_size, download.etag
+    # Without a size or validator there is no way to tell the remote file
+    # is still the one the part file was started from.
+    if not total_size and not etag:
+        return None
+    if entry.get("total_size") != total_size or entry.get("etag") != etag:
+        return None
+    return entry
 
-        logger.info("Starting download of %.2f MB file", total_size / (1024 * 1024))
 
-        downloaded = 0
-        update_interval = 1.0
-        last_update_time = 0.0
-        percent_logged = -1
-        filename = os.path.basename(full_path)
-        start_time = time.time()
+def _is_strong_etag(etag: str | None) -> bool:
+    return bool(etag) and not etag.startswith("W/")
 
-        logger.info("[%s] Beginning data transfer for %s", download_id, filename)
 
-        with open(full_path, "wb") as f:
-            async for chunk in response.content.iter_chunked(1024 * 1024):
-                if not chunk:
-                    break
+def _should_segment(download_id: str) -> bool:
+    """Whether the download is large enough and its origin supports ranges."""
+    download = active_downloads.get(download_id)
+    if download is None or SEGMENT_COUNT < 2:  # noqa: PLR2004
+        return False
+    return bool(download.accept_ranges) and download.total_size >= SEGMENTED_MIN_SIZE
 
-                f.write(chunk)
-                downloaded += len(chunk)
 
-                _update_download_progress(download_id, downloaded, total_size, start_time)
+def _plan_segments(total_size: int, count: int) -> list[tuple[int, int]]:
+    """Split ``total_size`` bytes into at most *count* inclusive byte ranges."""
+    count = max(1, min(count, total_size))
+    base = total_size // count
+    segments: list[tuple[int, int]] = []
+    start = 0
+    for index in range(count):
+        end = total_size - 1 if index == count - 1 else start + base - 1
+        segments.append((start, end))
+        start = end + 1
+    return segments
 
-                # Log at 10% increments
-                if download_id in active_downloads:
-                    current_percent = active_downloads[download_id].get("percent", 0)
+
+def _initial_segments(total_size: int, *, segmented: bool) -> list[_Segment]:
+    """Plan a fresh download: several ranges when segmenting, else one stream."""
+    if segmented:
+        return [_Segment(start, end) for start, end in _plan_segments(total_size, SEGMENT_COUNT)]
+    return [_Segment(0, total_size - 1 if total_size > 0 else None)]
+
+
+async def _run_transfer(
+    session: ClientSession,
+    transfer: _ResumableTransfer,
+    headers: dict[str, str] | None,
+    *,
+    response: ClientResponse | None = None,
+    min_rate: float | None = None,
+) -> _StreamHasher:
+    """Fetch every unfinished segment concurrently, checkpointing as it goes.
+
+    An open *response* for the start of the file serves the first segment.
+    Returns the hasher that followed the written data.
+    """
+    progress = _TransferProgress(
+        transfer.download_id,
+        transfer.total_size,
+        transfer.downloaded,
+        host=_scheduler.host_key(transfer.url),
+        min_rate=min_rate,
+    )
+    hasher = _StreamHasher(transfer.segments)
+    writer = _ChunkWriter(transfer.fd, asyncio.get_running_loop(), hasher)
+    tasks = [
+        asyncio.ensure_future(
+            _fetch_segment(
+                session,
+                transfer,
+                segment,
+                writer,
+                progress=progress,
+                headers=headers,
+                response=response if segment.offset == 0 else None,
+            )
+        )
+        for segment in transfer.segments
+        if not segment.done
+    ]
+    checkpoints = asyncio.ensure_future(_checkpoint_periodically(transfer))
+    sampler = asyncio.ensure_future(progress.run())
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # One failed segment fails the download; stop the others cleanly
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        if response is not None:
+            # Already closed unless its segment was cancelled before it started
+            response.close()
+        checkpoints.cancel()
+        sampler.cancel()
+        progress.sample()
+        # Flush whatever was received so the journal can confirm it
+        await writer.close()
+    return hasher
+
+
+_NOTHING = object()
+
+# A chunk waiting for the writer thread: its segment, file offset and data
+_QueuedChunk = tuple["_Segment", int, "bytes | memoryview"]
+
+# Buffers per vectored write; IOV_MAX is 1024 on Linux and macOS
+_MAX_IOV = 1024
+
+
+class _ReadSizer:
+    """Batch size for one connection: about READ_TARGET_SECONDS of its throughput.
+
+    Sizes are powers of two between READ_MIN_BYTES and READ_MAX_BYTES.
+    Throughput is smoothed over consecutive batches and includes the time
+    the consumer spent on each.
+    """
+
+    __slots__ = ("rate", "size")
+
+    def __init__(self) -> None:
+        self.size = READ_MIN_BYTES
+        self.rate = 0.0
+
+    def update(self, nbytes: int, elapsed: float) -> None:
+        """Account for a full batch of *nbytes* that took *elapsed* seconds."""
+        if elapsed <= 0:
+            return
+        rate = nbytes / elapsed
+        self.rate = (self.rate + rate) / 2 if self.rate else rate
+        target = self.rate * READ_TARGET_SECONDS
+        size = READ_MIN_BYTES
+        while size < target and size < READ_MAX_BYTES:
+            size *= 2
+        self.size = size
+
+
+async def _read_body(content: Any, limit: int | None = None) -> AsyncIterator[list[bytes]]:
+    """Yield a response body in batches of network chunks sized by a ``_ReadSizer``.
+
+    The chunks are the ones aiohttp received, handed on without being joined
+    or copied; the writer merges them into vectored writes. At most *limit*
+    bytes are read. Data received before a connection error is yielded
+    before the error is raised, so it is not lost to a resume.
+    """
+    sizer = _ReadSizer()
+    last = time.monotonic()
+    while limit is None or limit > 0:
+        target = sizer.size if limit is None else min(sizer.size, limit)
+        batch: list[bytes] = []
+        size = 0
+        try:
+            while size < target:
+                data, end_of_http_chunk = await content.readchunk()
+                if not data:
+                    if end_of_http_chunk:
+                        continue
+                    break
+                if limit is not None and size + len(data) > limit:
+                    data = memoryview(data)[: limit - size]
+                batch.append(data)
+                size += len(data)
+        except Exception:
+            if batch:
+                yield batch
+            raise
+        if not batch:
+            return
+        if size >= sizer.size:
+            now = time.monotonic()
+            sizer.update(size, now - last)
+            last = now
+        if limit is not None:
+            limit -= size
+        yield batch
+        if size < target:
+            return
+
+
+class _ChunkWriter:
+    """Write downloaded chunks to disk from a dedicated thread.
+
+    The event loop only enqueues chunks, so slow or network storage cannot
+    stall the server. The thread merges contiguous chunks of a segment into
+    larger vectored writes. At most ``max_pending`` bytes may wait in the
+    queue; beyond that ``write`` blocks, which throttles the network reader to
+    the speed of the disk. Written data is also fed to *hasher*.
+    """
+
+    def __init__(
+        self,
+        fd: int,
+        loop: asyncio.AbstractEventLoop,
+        hasher: _StreamHasher | None = None,
+        max_pending: int = WRITE_QUEUE_BYTES,
+        coalesce: int = WRITE_COALESCE_BYTES,
+    ) -> None:
+        self._fd = fd
+        self._loop = loop
+        self._hasher = hasher
+        self._max_pending = max_pending
+        self._coalesce = coalesce
+        self._queue: queue.SimpleQueue[_QueuedChunk | None] = queue.SimpleQueue()
+        self._pending = 0
+        self._space = asyncio.Event()
+        self._error: BaseException | None = None
+        self._done: asyncio.Future[None] = loop.create_future()
+        self._closed = False
+        threading.Thread(target=self._run, name="model-downloader-writer", daemon=True).start()
+
+    async def write(self, segment: _Segment, data: bytes | memoryview) -> None:
+        """Queue *data* for ``segment.offset``, waiting while the queue is full."""
+        while self._pending >= self._max_pending and self._error is None:
+            self._space.clear()
+            await self._space.wait()
+        if self._error is not None:
+            raise self._error
+        self._pending += len(data)
+        self._queue.put((segment, segment.offset, data))
+
+    async def close(self) -> None:
+        """Wait for queued chunks to reach the file; re-raise any write error."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+        await asyncio.shield(self._done)
+        if self._error is not None:
+            raise self._error
+
+    def _run(self) -> None:
+        try:
+            carry: Any = _NOTHING
+            while True:
+                item = self._next() if carry is _NOTHING else carry
+                carry = _NOTHING
+                if item is None:
+                    break
+                segment, offset, data = item
+                buffers, size = [data], len(data)
+                # Merge directly following chunks of the same segment
+                while size < self._coalesce and len(buffers) < _MAX_IOV:
+                    try:
+                        following = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
                     if (
-                        current_percent > 0
-                        and current_percent % 10 == 0
-                        and current_percent != percent_logged
+                        following is None
+                        or following[0] is not segment
+                        or following[1] != offset + size
                     ):
-                        percent_logged = current_percent
-                        _log_progress(download_id, downloaded, total_size)
-
-                    # Throttled WebSocket updates
-                    current_time = time.time()
-                    if current_time - last_update_time >= update_interval:
-                        last_update_time = current_time
-                        await send_download_update(download_id)
-
-        # Mark download as completed
-        _finalize_download(download_id, downloaded, total_size, full_path)
-        await send_download_update(download_id)
-
-
-def _get_or_update_total_size(download_id: str, response: ClientResponse) -> int:
-    """Get total size from download info or response headers."""
-    total_size = 0
-    if download_id in active_downloads:
-        total_size = active_downloads[download_id].get("total_size", 0)
-
-    if total_size == 0:
-        content_length = response.headers.get("content-length")
-        if content_length:
-            total_size = int(content_length)
-            if download_id in active_downloads:
-                active_downloads[download_id]["total_size"] = total_size
-                active_downloads[download_id]["content_type"] = response.headers.get(
-                    "content-type", ""
-                )
+                        carry = following
+                        break
+                    buffers.append(following[2])
+                    size += len(following[2])
+                started = time.perf_counter()
+                _pwrite_all(self._fd, buffers, offset)
+                _write_latency.observe(time.perf_counter() - started)
+                segment.written = offset + size
+                if self._hasher is not None:
+                    self._hasher.update(buffers, offset)
+                self._call_soon(self._release, size)
+        except BaseException as e:
+            # Whatever stops the thread (a disk error, a bug in the hasher)
+            # must reach write() and close(): the data behind it was never
+            # written
+            self._error = e
+        finally:
+            # Wake a write() waiting for room the thread will no longer make
+            self._call_soon(self._space.set)
+            self._call_soon(self._finish)
+
+    def _next(self) -> _QueuedChunk | None:
+        # Use idle time to hash data the stream hasher could not see directly
+        while self._hasher is not None and self._hasher.backlog:
+            try:
+                return self._queue.get_nowait()
+            except queue.Empty:
+                self._hasher.catch_up(self._fd, HASH_READ_BYTES)
+        return self._queue.get()
+
+    def _release(self, size: int) -> None:
+        self._pending -= size
+        if self._pending < self._max_pending:
+            self._space.set()
+
+    def _finish(self) -> None:
+        if not self._done.done():
+            self._done.set_result(None)
+
+    def _call_soon(self, callback: Callable[..., None], *args: Any) -> None:
+        # The loop may already be closed during shutdown; nothing waits then
+        with contextlib.suppress(RuntimeError):
+            self._loop.call_soon_threadsafe(callback, *args)
+
+
+class _StreamHasher:
+    """SHA-256 of a download, computed as its data reaches the disk.
+
+    Hashing is sequential, so a write is hashed from memory only when it starts
+    at the hash position, which is always the case for a single stream. Data
+    already on disk beyond that position (resumed bytes, later segments) is
+    read back by ``catch_up``. Used from the writer thread only.
+    """
+
+    def __init__(self, segments: list[_Segment]) -> None:
+        self._segments = segments
+        self._sha = hashlib.sha256()
+        self.position = 0
+
+    @property
+    def backlog(self) -> int:
+        """Bytes confirmed on disk right after ``position`` but not yet hashed."""
+        return self._frontier() - self.position
+
+    def _frontier(self) -> int:
+        # End of the data written contiguously from byte 0
+        frontier = 0
+        for segment in self._segments:
+            frontier = segment.written
+            if segment.end is None or segment.written <= segment.end:
+                break
+        return frontier
+
+    def update(self, buffers: list[bytes | memoryview], offset: int) -> None:
+        if offset < self.position:
+            # A restarted stream rewrites data already hashed
+            self._sha = hashlib.sha256()
+            self.position = 0
+        if offset == self.position:
+            for buffer in buffers:
+                self._sha.update(buffer)
+                self.position += len(buffer)
+
+    def catch_up(self, fd: int, limit: int | None = None) -> None:
+        """Hash up to *limit* bytes of the backlog by reading them back."""
+        remaining = self.backlog if limit is None else min(limit, self.backlog)
+        while remaining > 0:
+            block = os.pread(fd, min(remaining, HASH_READ_BYTES), self.position)
+            if not block:
+                raise OSError(f"Unexpected end of file at byte {self.position}")
+            self._sha.update(block)
+            self.position += len(block)
+            remaining -= len(block)
+
+    def hexdigest(self, fd: int) -> str:
+        """Finish hashing whatever is left on disk and return the digest."""
+        self.catch_up(fd)
+        return self._sha.hexdigest()
+
+
+def _pwrite_all(fd: int, buffers: list[bytes | memoryview], offset: int) -> None:
+    """Write *buffers* contiguously at *offset*, retrying short writes."""
+    if len(buffers) > 1 and hasattr(os, "pwritev"):
+        written = os.pwritev(fd, buffers, offset)
+        if written == sum(map(len, buffers)):
+            return
+        view = memoryview(b"".join(buffers))[written:]
+        offset += written
+    else:
+        view = memoryview(buffers[0] if len(buffers) == 1 else b"".join(buffers))
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
 
-    return total_size
+async def _checkpoint_periodically(transfer: _ResumableTransfer) -> None:
+    while True:
+        await asyncio.sleep(JOURNAL_INTERVAL)
+        await asyncio.to_thread(transfer.checkpoint)
 
 
-def _update_download_progress(
-    download_id: str, downloaded: int, total_size: int, start_time: float
+async def _fetch_segment(
+    session: ClientSession,
+    transfer: _ResumableTransfer,
+    segment: _Segment,
+    writer: _ChunkWriter,
+    *,
+    progress: _TransferProgress,
+    headers: dict[str, str] | None = None,
+    response: ClientResponse | None = None,
 ) -> None:
-    """Update download progress information."""
-    if download_id not in active_downloads:
-        return
+    """Fetch the remainder of *segment* and write it at its offset.
 
-    active_downloads[download_id]["downloaded"] = downloaded
+    *response* is the download's first GET, already open. A connection that
+    fails with a transient error is reopened with a Range request from the
+    segment's offset after a backoff (see ``_retry_or_raise``), so the data
+    already received is kept.
+    """
+    attempt = 0
+    while True:
+        received = segment.offset
+        try:
+            await _stream_segment(
+                session,
+                transfer,
+                segment,
+                writer,
+                progress=progress,
+                headers=headers,
+                response=response,
+            )
+        except (OSError, TimeoutError, ClientError) as e:
+            response = None
+            # Count failures in a row: a connection that delivered data was working
+            attempt = 1 if segment.offset > received else attempt + 1
+            await _retry_or_raise(transfer.download_id, transfer.url, e, attempt)
+        else:
+            return
 
-    if total_size > 0:
-        current_percent = int((downloaded / total_size) * 100)
-        active_downloads[download_id]["percent"] = current_percent
 
-    time_elapsed = time.time() - start_time
-    if downloaded > 0 and time_elapsed > 0:
-        speed_mbps = downloaded / (1024 * 1024) / time_elapsed
-        active_downloads[download_id]["speed"] = round(speed_mbps, 2)
+async def _stream_segment(
+    session: ClientSession,
+    transfer: _ResumableTransfer,
+    segment: _Segment,
+    writer: _ChunkWriter,
+    *,
+    progress: _TransferProgress,
+    headers: dict[str, str] | None = None,
+    response: ClientResponse | None = None,
+) -> None:
+    """Read the remainder of *segment* from one connection.
 
-        if total_size > 0 and speed_mbps > 0:
-            bytes_remaining = total_size - downloaded
-            seconds_remaining = bytes_remaining / (speed_mbps * 1024 * 1024)
-            active_downloads[download_id]["eta"] = int(seconds_remaining)
+    *response*, if given, is open at the segment's start but may run past its
+    end, so it is read only as far as the segment goes.
+    """
+    open_ended = response is not None
+    if response is None:
+        response = await _request_segment(session, transfer, segment, progress, headers)
+    limit = None
+    if open_ended and segment.end is not None:
+        limit = segment.end + 1 - segment.offset
+
+    body = _read_body(response.content, limit)
+    async with response, contextlib.aclosing(body):
+        async for batch in body:
+            size = sum(map(len, batch))
+            if segment.end is not None and segment.offset + size > segment.end + 1:
+                raise OSError(f"Origin sent more data than requested for {segment.range_header()}")
+
+            for chunk in batch:
+                await writer.write(segment, chunk)
+                segment.offset += len(chunk)
+            progress.advance(size)
+            await _limiter.throttle(transfer.download_id, progress.host, size)
+        if open_ended and segment.done:
+            # The rest belongs to other segments: drop the connection rather
+            # than drain it
+            response.close()
+
+    if segment.end is None:
+        segment.end = segment.offset - 1
+    elif not segment.done:
+        # A connection cut short: the rest can be asked for again
+        raise ConnectionError(
+            f"Segment {segment.start}-{segment.end} ended at byte {segment.offset}"
+        )
 
 
-def _log_progress(download_id: str, downloaded: int, total_size: int) -> None:
-    """Log download progress at intervals."""
-    if download_id not in active_downloads:
-        return
+def _http_error(response: ClientResponse) -> HTTPStatusError:
+    return HTTPStatusError(
+        response.status, response.reason, parse_retry_after(response.headers.get("retry-after"))
+    )
 
-    speed = active_downloads[download_id].get("speed", 0)
-    eta = active_downloads[download_id].get("eta", 0)
-    percent = active_downloads[download_id].get("percent", 0)
-    eta_str = f", ETA: {eta // 60}m {eta % 60}s" if eta else ""
-    dl_mb = downloaded / (1024 * 1024)
-    total_mb = total_size / (1024 * 1024)
 
+async def _retry_or_raise(
+    download_id: str, url: str, error: BaseException, attempt: int | None
+) -> None:
+    """Wait before retry number *attempt* after *error*, or raise it.
+
+    The error is raised if it is not transient, *attempt* is None or the
+    retries are used up. aiohttp's exceptions for dropped connections
+    (ServerDisconnectedError among them) and truncated bodies are retried as
+    a ConnectionError. Its other errors, such as InvalidURL or
+    TooManyRedirects, would fail the same way again and are raised at once
+    as a plain OSError; either way callers handle them like any other
+    network failure. While waiting, the download's record shows the retry
+    count, reason and when the next attempt starts.
+    """
+    cause = error
+    transient = ClientConnectionError | ClientPayloadError
+    if isinstance(error, transient) and not isinstance(error, TimeoutError):
+        error = ConnectionError(type(cause).__name__)
+    elif isinstance(error, ClientError) and not isinstance(error, OSError | TimeoutError):
+        error = OSError(f"{type(cause).__name__}: {cause}")
+    delay = None if attempt is None else _retry_policy.delay(attempt, error)
+    if delay is None:
+        if error is cause:
+            raise error
+        raise error from cause
+
+    host = _scheduler.host_key(url)
+    reason = failure_reason(error) or "unknown"
+    _download_retries.inc(host=host, reason=reason)
+    logger.warning(
+        "[%s] %s from %s (%s), retrying in %.1fs (attempt %d of %d)",
+        download_id,
+        reason,
+        _source_label(url),
+        type(cause).__name__,
+        delay,
+        attempt,
+        _retry_policy.attempts,
+    )
+    download = active_downloads.get(download_id)
+    if download is not None:
+        download.retries = (download.retries or 0) + 1
+        download.retry_at = time.time() + delay
+        download.retry_reason = reason
+        _publish_update(download_id)
+    try:
+        await asyncio.sleep(delay)
+    finally:
+        if download is not None:
+            download.retry_at = download.retry_reason = None
+            # Before the first GET succeeds no progress sampler publishes this
+            _publish_update(download_id)
+
+
+async def _request_segment(
+    session: ClientSession,
+    transfer: _ResumableTransfer,
+    segment: _Segment,
+    progress: _TransferProgress,
+    headers: dict[str, str] | None,
+) -> ClientResponse:
+    """Send the GET for the remainder of *segment* and check its status."""
+    request_headers = dict(headers or {})
+    ranged = segment.offset > 0 or len(transfer.segments) > 1
+    if ranged:
+        request_headers["Range"] = segment.range_header()
+        # Strong validators only: a changed file must not be spliced onto old data
+        if _is_strong_etag(transfer.etag):
+            request_headers["If-Range"] = transfer.etag
+
+    started = time.monotonic()
+    response = await session.get(transfer.url, allow_redirects=True, headers=request_headers)
+    _time_to_first_byte.observe(time.monotonic() - started, host=progress.host)
+    try:
+        if response.status == HTTPStatus.OK:
+            if len(transfer.segments) > 1:
+                raise _RangeNotSupportedError("Origin returned the full body for a Range request")
+            if ranged:
+                logger.info("[%s] Origin cannot resume, restarting download", transfer.download_id)
+            progress.rewind(segment.offset - segment.start)
+            segment.reset()
+            _update_total_size(transfer, segment, progress, response)
+        elif response.status != HTTPStatus.PARTIAL_CONTENT or not ranged:
+            raise _http_error(response)
+    except BaseException:
+        response.close()
+        raise
+    return response
+
+
+def _update_total_size(
+    transfer: _ResumableTransfer,
+    segment: _Segment,
+    progress: _TransferProgress,
+    response: ClientResponse,
+) -> None:
+    """Take the size and validator of a full 200 body.
+
+    The file may have changed since the journal recorded them, which is why
+    a resumed download was answered with the whole file.
+    """
+    content_length = response.headers.get("content-length")
+    if not content_length or int(content_length) <= 0:
+        return
+    total_size = int(content_length)
+    segment.end = total_size - 1
+    transfer.total_size = progress.total_size = total_size
+    transfer.etag = response.headers.get("etag")
+    download = progress.download
+    if download is not None:
+        download.total_size = total_size
+        download.content_type = response.headers.get("content-type", "")
+        download.etag = transfer.etag
+
+
+def _log_progress(download: Download) -> None:
+    """Log a download's progress."""
+    eta = download.eta
+    eta_str = f", ETA: {eta // 60}m {eta % 60}s" if eta else ""
     logger.info(
         "[%s] Download progress: %d%% (%.2f MB of %.2f MB, %s MB/s%s)",
-        download_id,
-        percent,
-        dl_mb,
-        total_mb,
-        speed,
+        download.download_id,
+        download.percent,
+        download.downloaded / (1024 * 1024),
+        download.total_size / (1024 * 1024),
+        download.speed or 0,
         eta_str,
     )
 
 
 def _finalize_download(download_id: str, downloaded: int, total_size: int, full_path: str) -> None:
     """Finalize download and log completion."""
-    if download_id not in active_downloads:
+    download = active_downloads.get(download_id)
+    if download is None:
         return
 
-    elapsed_time = time.time() - active_downloads[download_id].get("start_time", time.time())
+    elapsed_time = time.time() - download.start_time
     download_speed = (downloaded / elapsed_time) / (1024 * 1024) if elapsed_time > 0 else 0
 
     dl_size_mb = downloaded / (1024 * 1024)
@@ -563,65 +2435,292 @@ def _finalize_download(download_id: str, downloaded: int, total_size: int, full_
         download_speed,
     )
 
-    active_downloads[download_id]["status"] = "completed"
-    active_downloads[download_id]["end_time"] = time.time()
-    active_downloads[download_id]["downloaded"] = downloaded
-    active_downloads[download_id]["percent"] = 100 if total_size > 0 else 0
+    if elapsed_time >= 1 and downloaded > 0:
+        _recent_speeds.append(download_speed)
+        _throughput.observe(
+            downloaded / elapsed_time,
+            host=_scheduler.host_key(download.url),
+        )
+    _download_results.inc(result="completed")
+
+    download.transition(COMPLETED)
+    download.downloaded = downloaded
+    download.percent = 100 if total_size > 0 else 0
 
     logger.info("[%s] Model downloaded successfully to %s", download_id, full_path)
 
 
 async def send_download_update(download_id: str) -> None:
-    """Send a WebSocket update to all clients about download status."""
-    if download_id not in active_downloads:
+    """Publish a download's state to websocket clients.
+
+    A change of status is sent at once; progress goes out with the next batch.
+    """
+    _publish_update(download_id)
+
+
+def _publish_update(download_id: str) -> None:
+    download = active_downloads.get(download_id)
+    if download is None:
         return
 
-    download = active_downloads[download_id]
+    _changes.touch(download_id)
+
+    if download.status == COMPLETED:
+        logger.info("Download complete: %s", download.filename)
+    elif download.status == SKIPPED:
+        logger.info("Download skipped (file exists): %s", download.filename)
+    elif download.status == ERROR:
+        logger.info("Download error: %s", download.error)
 
-    if download["status"] == "completed":
-        logger.info("Download complete: %s", download.get("filename", ""))
-    elif download["status"] == "skipped":
-        logger.info("Download skipped (file exists): %s", download.get("filename", ""))
-    elif download["status"] == "error":
-        logger.info("Download error: %s", download.get("error", ""))
+    _broadcaster.publish(download_id, download.status)
 
+
+def _progress_payload(download_id: str) -> dict[str, Any] | None:
+    """Websocket event data describing *download_id*."""
+    download = active_downloads.get(download_id)
+    if download is None:
+        return None
+    return {
+        "download_id": download_id,
+        "status": download.status,
+        "percent": download.percent,
+        "downloaded": download.downloaded,
+        "total_size": download.total_size,
+        "speed": download.speed or 0,
+        "eta": download.eta or 0,
+        "error": download.error,
+        "priority": download.priority,
+        "queue_position": download.queue_position or 0,
+        "retries": download.retries or 0,
+        "retry_at": download.retry_at,
+        "retry_reason": download.retry_reason,
+    }
+
+
+def _send_event(event: str, data: dict[str, Any], sid: str | None) -> None:
     try:
-        PromptServer.instance.send_sync(
-            "model_download_progress",
-            {
-                "download_id": download_id,
-                "status": download["status"],
-                "percent": download.get("percent", 0),
-                "downloaded": download.get("downloaded", 0),
-                "total_size": download.get("total_size", 0),
-                "speed": download.get("speed", 0),
-                "eta": download.get("eta", 0),
-                "error": download.get("error"),
-            },
-        )
+        PromptServer.instance.send_sync(event, data, sid)
     except (OSError, RuntimeError):
         logger.exception("WebSocket error")
 
 
+def _connected_clients() -> list[str]:
+    return list(getattr(PromptServer.instance, "sockets", None) or ())
+
+
+_broadcaster = ProgressBroadcaster(_send_event, _connected_clients, _progress_payload)
+
+
+async def subscribe_progress(request: web.Request) -> web.Response:
+    """Choose which downloads a websocket client receives progress for.
+
+    Expects JSON ``{"client_id": "...", "download_ids": [...]}``. An empty
+    list stops all download events for the client, ``null`` (the default
+    for every client) sends it every download. Downloads the client starts
+    while subscribed, passing its ``client_id``, are added automatically.
+    """
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        return web.json_response({"success": False, "error": "Invalid JSON"})
+
+    client_id = data.get("client_id") if isinstance(data, dict) else None
+    download_ids = data.get("download_ids") if isinstance(data, dict) else None
+    if not isinstance(client_id, str) or not client_id:
+        return web.json_response({"success": False, "error": "Missing client_id"})
+    if download_ids is not None and not (
+        isinstance(download_ids, list) and all(isinstance(d, str) for d in download_ids)
+    ):
+        return web.json_response(
+            {"success": False, "error": "download_ids must be a list of IDs or null"}
+        )
+
+    _broadcaster.subscribe(client_id, download_ids)
+    return web.json_response({"success": True, "download_ids": download_ids})
+
+
 async def get_download_progress(request: web.Request) -> web.Response:
     """Get the progress of a download."""
     try:
         download_id = request.match_info.get("download_id")
 
         if download_id and download_id in active_downloads:
-            return web.json_response({"success": True, "download": active_downloads[download_id]})
+            return web.json_response(
+                {"success": True, "download": active_downloads[download_id].as_dict()}
+            )
         return web.json_response({"success": False, "error": "Download not found"})
     except (KeyError, TypeError) as e:
         return web.json_response({"success": False, "error": str(e)})
 
 
 async def list_downloads(request: web.Request) -> web.Response:
-    """List all active downloads."""
+    """List active downloads, or only those changed since a version.
+
+    Every response carries the table's ``version`` and a matching ETag.
+    Query parameters:
+
+    - ``since``: a version from an earlier response. Only downloads changed
+      after it are listed, and downloads dropped since are named in
+      ``removed``. ``full`` is true when the whole table is sent instead,
+      because *since* is too old or from before a restart.
+    - ``wait``: with ``since`` or ``If-None-Match``, hold the request for up
+      to this many seconds (at most 30) until something changes.
+
+    ``If-None-Match`` with the current ETag is answered with 304.
+    """
+    try:
+        since = int(request.query["since"]) if "since" in request.query else None
+        wait = min(float(request.query.get("wait", 0)), MAX_POLL_WAIT)
+    except ValueError:
+        return web.json_response({"success": False, "error": "Invalid since or wait"})
+
+    if_none_match = request.headers.get("If-None-Match")
+    known = since if since is not None else _etag_version(if_none_match)
+    if wait > 0 and known is not None:
+        await _changes.wait(known, wait)
+
+    version = _changes.version
+    etag = f'W/"{version}"'
+    if if_none_match and _etag_version(if_none_match) == version:
+        return web.Response(status=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+
+    body = _listing_cache.get((version, since))
+    if body is None:
+        try:
+            body = json.dumps(_listing(version, since)).encode()
+        except (TypeError, ValueError) as e:
+            return web.json_response({"success": False, "error": str(e)})
+        if len(_listing_cache) >= MAX_CACHED_LISTINGS:
+            _listing_cache.clear()
+        _listing_cache[version, since] = body
+    return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+
+def _listing(version: int, since: int | None) -> dict[str, Any]:
+    changes = _changes.changes_since(since) if since is not None else None
+    if changes is None:
+        downloads = {d: download.as_dict() for d, download in active_downloads.items()}
+        return {"success": True, "version": version, "full": True, "downloads": downloads}
+    changed, removed = changes
+    return {
+        "success": True,
+        "version": version,
+        "full": False,
+        "downloads": {d: active_downloads[d].as_dict() for d in changed if d in active_downloads},
+        "removed": removed,
+    }
+
+
+def _etag_version(header: str | None) -> int | None:
+    """The version named by an ``If-None-Match`` header, if it is one of ours."""
+    if not header:
+        return None
+    for tag in header.split(","):
+        value = tag.strip().removeprefix("W/").strip('"')
+        if value.isdigit():
+            return int(value)
+    return None
+
+
+async def get_download_history(request: web.Request) -> web.Response:
+    """List finished downloads, newest first, including those since forgotten.
+
+    Rows carry the download's size, ``duration`` (seconds) and, for completed
+    downloads, ``throughput`` (bytes per second). Query parameters:
+
+    - ``limit``: rows per page (default 50, at most 500).
+    - ``before``: the ``next`` value of the previous page, to fetch the one
+      after it; ``next`` is null on the last page.
+    - ``status``: only ``completed``, ``skipped`` or ``error`` downloads.
+    """
+    status = request.query.get("status") or None
+    try:
+        limit = int(request.query.get("limit", HISTORY_PAGE_SIZE))
+        before = int(request.query["before"]) if "before" in request.query else None
+    except ValueError:
+        return web.json_response({"success": False, "error": "Invalid limit or before"})
+    if not 0 < limit <= MAX_HISTORY_PAGE_SIZE:
+        return web.json_response(
+            {"success": False, "error": f"limit must be between 1 and {MAX_HISTORY_PAGE_SIZE}"}
+        )
+    if status not in {None, COMPLETED, SKIPPED, ERROR}:
+        return web.json_response({"success": False, "error": f"Unknown status: {status}"})
+
+    try:
+        rows = await asyncio.to_thread(
+            list_history, _state_dir(), limit=limit, before=before, status=status
+        )
+    except (OSError, sqlite3.Error) as e:
+        logger.exception("Error reading download history")
+        return web.json_response({"success": False, "error": str(e)})
+    next_before = rows[-1]["id"] if len(rows) == limit else None
+    return web.json_response({"success": True, "downloads": rows, "next": next_before})
+
+
+async def get_metrics(request: web.Request) -> web.Response:
+    """Serve the downloader's metrics in the Prometheus text format."""
+    return web.Response(body=_metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def get_loop_lag(request: web.Request) -> web.Response:
+    """Report event-loop lag percentiles and the stalls seen, by location.
+
+    ``location`` is the downloader function (``module.qualname``) running on
+    the loop while it was stuck, or ``"other"``; ``frame`` is the innermost
+    Python frame at that moment.
+    """
+    return web.json_response({"success": True, **_loop_monitor.snapshot()})
+
+
+async def get_bandwidth_limits(request: web.Request) -> web.Response:
+    """Return the current bandwidth caps in bytes per second (null is unlimited)."""
+    return web.json_response({"success": True, "limits": _limiter.limits()})
+
+
+async def set_bandwidth_limits(request: web.Request) -> web.Response:
+    """Change bandwidth caps while downloads are running.
+
+    Expects JSON with any of ``global``, ``per_download`` (the default cap of
+    each download), ``hosts`` (``{host: rate}``) and ``downloads``
+    (``{download_id: rate}``). Rates are bytes per second, or strings such as
+    ``"20M"``; null or 0 removes a cap. Fields left out are unchanged, and
+    nothing changes if any field is invalid.
+    """
     try:
-        return web.json_response({"success": True, "downloads": active_downloads})
+        data = await request.json()
+    except json.JSONDecodeError:
+        return web.json_response({"success": False, "error": "Invalid JSON"})
+    if not isinstance(data, dict):
+        return web.json_response({"success": False, "error": "Expected a JSON object"})
+
+    try:
+        changes = _parse_bandwidth_changes(data)
     except (TypeError, ValueError) as e:
         return web.json_response({"success": False, "error": str(e)})
 
+    for apply, *args in changes:
+        apply(*args)
+    logger.info("Bandwidth limits changed: %s", _limiter.limits())
+    return web.json_response({"success": True, "limits": _limiter.limits()})
+
+
+def _parse_bandwidth_changes(data: dict[str, Any]) -> list[tuple[Any, ...]]:
+    """Validate a bandwidth request into ``(setter, *args)`` calls."""
+    changes: list[tuple[Any, ...]] = []
+    if "global" in data:
+        changes.append((_limiter.set_global_rate, parse_rate(data["global"])))
+    if "per_download" in data:
+        changes.append((_limiter.set_download_rate, parse_rate(data["per_download"])))
+    for field, setter in (("hosts", _limiter.set_host_rate), ("downloads", _limiter.set_rate_for)):
+        rates = data.get(field) or {}
+        if not isinstance(rates, dict):
+            raise TypeError(f"{field} must map names to rates")
+        for key, rate in rates.items():
+            if field == "downloads" and key not in active_downloads:
+                raise ValueError(f"Download not found: {key}")
+            changes.append((setter, key.lower() if field == "hosts" else key, parse_rate(rate)))
+    return changes
+
 
 async def resolve_folder(request: web.Request) -> web.Response:
     """Resolve which model folder a filename belongs to.
@@ -631,22 +2730,337 @@ async def resolve_folder(request: web.Request) -> web.Response:
     on file extension, since extensions like .safetensors are shared across many
     folder types. When the file is not found, returns success=False so the
     frontend can fall back to its URL/DOM-based heuristics.
+
+    Answered from the in-memory filename index once it is built; until then
+    the folders are searched on disk.
     """
     filename = request.match_info.get("filename", "")
     if not filename:
         return web.json_response({"success": False, "error": "Missing filename"})
 
-    # Search all model folders for the file
-    for folder_name, (paths, _extensions) in folder_paths.folder_names_and_paths.items():
-        if folder_name == "custom_nodes":
-            continue
-        for directory in paths:
-            if os.path.isfile(os.path.join(directory, filename)):
-                return web.json_response({"success": True, "folder": folder_name})
+    located = _locate_model(filename)
+    if located is not None:
+        return web.json_response({"success": True, "folder": located[0]})
 
     return web.json_response({"success": False, "error": f"File not found: {filename}"})
 
 
+def _locate_model(filename: str) -> tuple[str, str] | None:
+    """Return ``(folder, full_path)`` of the first model folder holding *filename*.
+
+    Uses the filename index when built, else checks the disk.
+    """
+    if _filename_index.ready:
+        return _filename_index.locate(filename)
+    for folder_name, paths in _model_roots():
+        for directory in paths:
+            full_path = os.path.join(directory, filename)
+            if os.path.isfile(full_path):
+                return folder_name, full_path
+    return None
+
+
+async def resolve_folders(request: web.Request) -> web.Response:
+    """Resolve a batch of model filenames in one request.
+
+    Expects ``{"filenames": [...]}`` and returns, in the same order, whether
+    each file exists and its folder, full path and size. Lookups come from
+    the filename index (built first if needed, one scan for the whole batch),
+    so the only disk access is a stat of each file found.
+    """
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        return web.json_response({"success": False, "error": "Invalid JSON"})
+
+    filenames = data.get("filenames") if isinstance(data, dict) else None
+    if not isinstance(filenames, list) or not all(isinstance(f, str) and f for f in filenames):
+        return web.json_response({"success": False, "error": "filenames must be a list of names"})
+    if len(filenames) > MAX_RESOLVE_BATCH:
+        return web.json_response(
+            {"success": False, "error": f"At most {MAX_RESOLVE_BATCH} filenames per request"}
+        )
+
+    if not _filename_index.ready:
+        await asyncio.to_thread(_filename_index.refresh)
+    files = await asyncio.to_thread(_describe_models, filenames)
+    return web.json_response({"success": True, "files": files})
+
+
+def _describe_models(filenames: list[str]) -> list[dict[str, Any]]:
+    """Existence, folder, path and size of each of *filenames*; blocking."""
+    described: dict[str, dict[str, Any]] = {}
+    for filename in filenames:
+        if filename in described:
+            continue
+        located = _locate_model(filename)
+        size = None
+        if located is not None:
+            try:
+                size = os.stat(located[1]).st_size
+            except OSError:
+                # Deleted since the index last saw it
+                located = None
+        described[filename] = {
+            "filename": filename,
+            "exists": located is not None,
+            "folder": located[0] if located else None,
+            "path": located[1] if located else None,
+            "size": size,
+        }
+    return [described[filename] for filename in filenames]
+
+
+async def prefetch_workflow(request: web.Request) -> web.Response:
+    """Plan, and queue, every model download a workflow needs.
+
+    The body is a UI workflow, an API prompt, or a ``/prompt`` request body
+    wrapping them. Each referenced model is checked against the model
+    folders; missing files with a URL in the workflow's ``models`` metadata
+    are queued together, unless ``?dry_run=1`` (or ``"dry_run": true``) asks
+    for the plan only. Files already being downloaded are not queued again.
+
+    The response lists files that exist, files to download, and missing files
+    without a URL or folder, with the total bytes to fetch and a time estimate
+    based on recent download speeds (null until a download has completed).
+    A file whose origin cannot be probed is still queued, with its size
+    unknown.
+    """
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        return web.json_response({"success": False, "error": "Invalid JSON"})
+
+    dry_run = request.query.get("dry_run", "").lower() in {"1", "true", "yes"} or (
+        isinstance(payload, dict) and payload.get("dry_run") is True
+    )
+    references = extract_model_references(payload)
+    if not _filename_index.ready:
+        await asyncio.to_thread(_filename_index.refresh)
+    located = await asyncio.to_thread(_locate_references, references)
+
+    existing: list[dict[str, Any]] = []
+    missing: list[tuple[ModelReference, str, str]] = []
+    unavailable: list[dict[str, Any]] = []
+    for reference, found in zip(references, located, strict=True):
+        if found is not None:
+            folder, path, size = found
+            existing.append({"name": reference.name, "folder": folder, "path": path, "size": size})
+        elif reference.url and reference.directory:
+            missing.append((reference, reference.url, reference.directory))
+        else:
+            reason = "No download URL in workflow" if not reference.url else "No folder in workflow"
+            unavailable.append(
+                {"name": reference.name, "folder": reference.directory, "reason": reason}
+            )
+
+    probes = await _probe_urls([url for _reference, url, _folder in missing])
+    sizes = [probe.get("size") for probe in probes]
+    downloads: list[dict[str, Any]] = []
+    for (reference, url, folder), size in zip(missing, sizes, strict=True):
+        item: dict[str, Any] = {
+            "name": reference.name,
+            "folder": folder,
+            "url": url,
+            "size": size,
+            "status": "missing",
+        }
+        active = _active_download_for(folder, reference.name)
+        if active is not None:
+            item["download_id"] = active.download_id
+            item["status"] = active.status
+        elif not dry_run:
+            download_id, error = _register_download(
+                url, folder, reference.name, _default_priority(folder), reference.sha256
+            )
+            if download_id is None:
+                unavailable.append({"name": reference.name, "folder": folder, "reason": error})
+                continue
+            item["download_id"] = download_id
+            item["status"] = active_downloads[download_id].status
+        downloads.append(item)
+
+    total_bytes = sum(item["size"] or 0 for item in downloads)
+    logger.info(
+        "Workflow prefetch: %d present, %d to download (%.2f MB), %d unavailable",
+        len(existing),
+        len(downloads),
+        total_bytes / (1024 * 1024),
+        len(unavailable),
+    )
+    return web.json_response(
+        {
+            "success": True,
+            "dry_run": dry_run,
+            "existing": existing,
+            "downloads": downloads,
+            "unavailable": unavailable,
+            "total_bytes": total_bytes,
+            "unknown_sizes": sum(1 for item in downloads if item["size"] is None),
+            "estimated_seconds": _estimate_seconds(total_bytes),
+        }
+    )
+
+
+def _locate_references(references: list[ModelReference]) -> list[tuple[str, str, int] | None]:
+    """Folder, path and size of each reference present on disk; blocking."""
+    results: list[tuple[str, str, int] | None] = []
+    for reference in references:
+        located = _locate_in_folder(reference.name, reference.directory)
+        if located is not None:
+            try:
+                results.append((*located, os.stat(located[1]).st_size))
+                continue
+            except OSError:
+                pass
+        results.append(None)
+    return results
+
+
+def _locate_in_folder(filename: str, folder: str | None) -> tuple[str, str] | None:
+    """Like ``_locate_model``, but only a copy in *folder* counts when given."""
+    located = _locate_model(filename)
+    if located is not None and folder in {None, located[0]}:
+        return located
+    if folder is None:
+        return None
+    # Also present in a folder searched earlier; check this one directly
+    try:
+        paths = folder_paths.get_folder_paths(folder)
+    except KeyError:
+        return None
+    for directory in paths:
+        full_path = os.path.join(directory, filename)
+        if os.path.isfile(full_path):
+            return folder, full_path
+    return None
+
+
+def _active_download_for(folder: str, filename: str) -> Download | None:
+    """The queued or running download of *filename* into *folder*, if any.
+
+    Matches on the filename as requested, which stays the key even when the
+    file is saved under a timestamped name.
+    """
+    download = active_downloads.get(_in_flight.get((folder, filename), ""))
+    if download is not None and download.active:
+        return download
+    return None
+
+
+async def probe_urls(request: web.Request) -> web.Response:
+    """Describe a batch of remote files without downloading them.
+
+    Expects ``{"urls": [...]}`` and returns, in the same order, each URL's
+    status, size, content type, ETag, redirect target (without its query
+    string), whether it accepts ranges and whether it needs a token the
+    server lacks. Answers are cached on disk for ``METADATA_TTL`` seconds
+    and served from there, offline included, until then; ``"refresh": true``
+    asks every origin again.
+    """
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        return web.json_response({"success": False, "error": "Invalid JSON"})
+
+    urls = data.get("urls") if isinstance(data, dict) else None
+    if not isinstance(urls, list) or not all(
+        isinstance(url, str) and urlparse(url).scheme in {"http", "https"} for url in urls
+    ):
+        return web.json_response({"success": False, "error": "urls must be a list of URLs"})
+    if len(urls) > MAX_PROBE_BATCH:
+        return web.json_response(
+            {"success": False, "error": f"At most {MAX_PROBE_BATCH} URLs per request"}
+        )
+
+    probes = await _probe_urls(urls, refresh=data.get("refresh") is True)
+    results = [
+        {"url": url, **{key: probe[key] for key in _PROBE_FIELDS if key in probe}}
+        for url, probe in zip(urls, probes, strict=True)
+    ]
+    return web.json_response({"success": True, "results": results})
+
+
+# Fields of a cached metadata record that probe_urls reports
+_PROBE_FIELDS = (
+    "status",
+    "size",
+    "content_type",
+    "etag",
+    "final_url",
+    "auth_required",
+    "accept_ranges",
+    "checked_at",
+    "cached",
+    "error",
+)
+
+
+async def _probe_urls(urls: list[str], *, refresh: bool = False) -> list[dict[str, Any]]:
+    """Metadata of each URL, from the cache while fresh, else by a HEAD request.
+
+    HEAD requests for the uncached URLs run concurrently over the shared
+    session, and their answers are cached; *refresh* ignores cached ones.
+    A URL whose origin could not be reached, or answered with a redirect loop
+    or a dropped connection, gets an ``error`` instead and is not cached, so
+    the next probe tries again; the rest of the batch is unaffected.
+    """
+    unique = list(dict.fromkeys(urls))
+    auth_headers = {url: _auth_headers_for_url(url) for url in unique}
+    cached: dict[str, dict[str, Any]] = {}
+    if not refresh:
+        with contextlib.suppress(OSError):
+            cached = await asyncio.to_thread(
+                lookup_metadata, _state_dir(), {url: bool(auth_headers[url]) for url in unique}
+            )
+
+    session = _get_session()
+    semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+
+    async def probe(url: str) -> dict[str, Any]:
+        async with semaphore:
+            try:
+                started = time.monotonic()
+                async with session.head(
+                    url, allow_redirects=True, headers=auth_headers[url]
+                ) as response:
+                    _head_latency.observe(time.monotonic() - started, host=_scheduler.host_key(url))
+                    content_length = response.headers.get("content-length")
+                    size = None
+                    if response.status == HTTPStatus.OK and content_length:
+                        size = int(content_length)
+                    accept_ranges = response.headers.get("accept-ranges", "").lower() == "bytes"
+                    return _metadata_from_response(response, size, accept_ranges=accept_ranges)
+            except (OSError, TimeoutError, ValueError, ClientError) as e:
+                logger.warning("HEAD request failed: %s", e)
+                return {"error": "Request failed"}
+
+    uncached = [url for url in unique if url not in cached]
+    probed = dict(zip(uncached, await asyncio.gather(*map(probe, uncached)), strict=True))
+    reachable = {
+        url: {**metadata, "authenticated": bool(auth_headers[url])}
+        for url, metadata in probed.items()
+        if "error" not in metadata
+    }
+    if reachable:
+        try:
+            await _remember_metadata(reachable)
+        except OSError:
+            logger.warning("Could not update the metadata cache", exc_info=True)
+
+    results = {url: {**metadata, "cached": False} for url, metadata in probed.items()}
+    results.update({url: {**metadata, "cached": True} for url, metadata in cached.items()})
+    return [results[url] for url in urls]
+
+
+def _estimate_seconds(total_bytes: int) -> int | None:
+    """Rough time to fetch *total_bytes* at the median recent download speed."""
+    if not total_bytes or not _recent_speeds:
+        return None
+    speed = statistics.median(_recent_speeds)
+    return int(total_bytes / (speed * 1024 * 1024)) if speed > 0 else None
+
+
 async def list_folders(request: web.Request) -> web.Response:
     """Return the model folder names registered with ComfyUI.
 
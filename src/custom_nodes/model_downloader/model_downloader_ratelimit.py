@@ -0,0 +1,222 @@
+"""Bandwidth limits for model downloads.
+
+Each limit is a token bucket that is allowed to go into debt: a received
+chunk is always accounted for in full, and the reader then sleeps until the
+debt is repaid. Data is therefore paced at a steady rate instead of arriving
+in bursts followed by long stalls. Downloads are limited by, in turn, their
+own cap, the cap of their host and the global cap; the global capacity is
+shared round-robin between downloads, so one download's parallel segments
+do not crowd out a single-stream download.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any
+
+logger = logging.getLogger("model_downloader")
+
+# A bucket holds at most this many seconds of its rate, so an idle download
+# can only burst briefly before it is paced.
+BURST_SECONDS = 0.25
+
+_RATE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def parse_rate(value: Any) -> float | None:
+    """Parse a rate in bytes per second; ``"10M"`` is 10 MiB/s.
+
+    None, an empty string and zero mean unlimited. Raises ValueError for
+    anything else that is not a positive rate.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, int | float) and not isinstance(value, bool):
+        rate = float(value)
+    else:
+        text = str(value).strip().lower().removesuffix("/s").removesuffix("b")
+        unit = text[-1:] if text[-1:] in _RATE_UNITS else ""
+        try:
+            rate = float(text.removesuffix(unit)) * _RATE_UNITS[unit]
+        except ValueError:
+            raise ValueError(f"Invalid rate: {value!r}") from None
+    if not math.isfinite(rate) or rate < 0:
+        raise ValueError(f"Invalid rate: {value!r}")
+    return rate or None
+
+
+def parse_host_rates(spec: str) -> dict[str, float]:
+    """Parse ``"huggingface.co=20M,civitai.com=5M"`` into a host -> rate mapping."""
+    rates: dict[str, float] = {}
+    for item in spec.split(","):
+        host, sep, value = item.strip().partition("=")
+        if not sep:
+            continue
+        try:
+            rate = parse_rate(value)
+        except ValueError:
+            logger.warning("Ignoring invalid host rate %r", item)
+            continue
+        if rate is not None:
+            rates[host.strip().lower()] = rate
+    return rates
+
+
+class TokenBucket:
+    """Tokens (bytes) refilled continuously at ``rate`` per second.
+
+    A None rate means unlimited.
+    """
+
+    def __init__(self, rate: float | None) -> None:
+        self.rate = rate
+        self._tokens = self._capacity()
+        self._updated = time.monotonic()
+
+    def set_rate(self, rate: float | None) -> None:
+        self._refill()
+        self.rate = rate
+        self._tokens = min(self._tokens, self._capacity())
+
+    def reserve(self, amount: int) -> float:
+        """Take *amount* tokens; return seconds until the bucket is out of debt."""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        self._tokens -= amount
+        return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def _capacity(self) -> float:
+        return self.rate * BURST_SECONDS if self.rate else 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self._capacity(), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class _FairQueue:
+    """Grant a shared bucket's bytes to waiting downloads in turn."""
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self._bucket = bucket
+        self._waiting: dict[str, deque[tuple[int, asyncio.Future[None]]]] = {}
+        self._turns: deque[str] = deque()
+        self._pacer: asyncio.Task[None] | None = None
+
+    async def acquire(self, key: str, amount: int) -> None:
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        if key not in self._waiting:
+            self._waiting[key] = deque()
+            self._turns.append(key)
+        self._waiting[key].append((amount, waiter))
+        if self._pacer is None or self._pacer.done():
+            self._pacer = loop.create_task(self._pace())
+        await waiter
+
+    async def _pace(self) -> None:
+        while self._turns:
+            key = self._turns.popleft()
+            waiting = self._waiting[key]
+            amount, waiter = waiting.popleft()
+            if not waiter.done():
+                delay = self._bucket.reserve(amount)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if not waiter.done():
+                    waiter.set_result(None)
+            # Back of the line, behind downloads that queued meanwhile
+            if waiting:
+                self._turns.append(key)
+            else:
+                del self._waiting[key]
+
+
+class BandwidthLimiter:
+    """Global, per-host and per-download bandwidth caps.
+
+    Args:
+        global_rate: Cap on all downloads together, in bytes per second.
+        download_rate: Cap on each download unless overridden for it.
+        host_rates: Caps per host, keyed like the scheduler's host limits.
+    """
+
+    def __init__(
+        self,
+        global_rate: float | None = None,
+        download_rate: float | None = None,
+        host_rates: dict[str, float] | None = None,
+    ) -> None:
+        self._global = TokenBucket(global_rate)
+        self._shared = _FairQueue(self._global)
+        self.download_rate = download_rate
+        self._hosts = {host: TokenBucket(rate) for host, rate in (host_rates or {}).items()}
+        self._overrides: dict[str, float | None] = {}
+        self._downloads: dict[str, TokenBucket] = {}
+
+    def limits(self) -> dict[str, Any]:
+        """The current caps, in bytes per second (None is unlimited)."""
+        return {
+            "global": self._global.rate,
+            "per_download": self.download_rate,
+            "hosts": {host: bucket.rate for host, bucket in self._hosts.items()},
+            "downloads": dict(self._overrides),
+        }
+
+    def set_global_rate(self, rate: float | None) -> None:
+        self._global.set_rate(rate)
+
+    def set_download_rate(self, rate: float | None) -> None:
+        """Change the default cap of every download without an override."""
+        self.download_rate = rate
+        for download_id, bucket in self._downloads.items():
+            if download_id not in self._overrides:
+                bucket.set_rate(rate)
+
+    def set_host_rate(self, host: str, rate: float | None) -> None:
+        if rate is None:
+            self._hosts.pop(host, None)
+        elif host in self._hosts:
+            self._hosts[host].set_rate(rate)
+        else:
+            self._hosts[host] = TokenBucket(rate)
+
+    def set_rate_for(self, download_id: str, rate: float | None) -> None:
+        """Cap one download at *rate*; None lifts its cap."""
+        self._overrides[download_id] = rate
+        if download_id in self._downloads:
+            self._downloads[download_id].set_rate(rate)
+
+    def lowest_rate(self, download_id: str, host: str) -> float | None:
+        """The tightest cap on *download_id* fetching from *host*; None if unlimited."""
+        rates = [
+            self._overrides.get(download_id, self.download_rate),
+            self._hosts[host].rate if host in self._hosts else None,
+            self._global.rate,
+        ]
+        return min((rate for rate in rates if rate), default=None)
+
+    def forget(self, download_id: str) -> None:
+        self._overrides.pop(download_id, None)
+        self._downloads.pop(download_id, None)
+
+    async def throttle(self, download_id: str, host: str, amount: int) -> None:
+        """Wait until *amount* bytes just received by *download_id* fit the caps."""
+        bucket = self._downloads.get(download_id)
+        if bucket is None:
+            rate = self._overrides.get(download_id, self.download_rate)
+            bucket = self._downloads[download_id] = TokenBucket(rate)
+        delay = bucket.reserve(amount)
+        host_bucket = self._hosts.get(host)
+        if host_bucket is not None:
+            delay = max(delay, host_bucket.reserve(amount))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._global.rate:
+            await self._shared.acquire(download_id, amount)
@@ -0,0 +1,178 @@
+"""The record of one download, as kept in ``active_downloads``.
+
+Downloads used to be plain dicts, written field by field from wherever the
+download happened to be, with every data chunk re-checking the entry and
+rewriting its progress. A record has a fixed set of fields, its status only
+moves along the allowed transitions, and its progress figures are refreshed
+by the download's sampler rather than by each chunk.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+COMPLETED = "completed"
+SKIPPED = "skipped"
+ERROR = "error"
+
+# Statuses of downloads that have not finished
+ACTIVE = frozenset({QUEUED, DOWNLOADING})
+
+# Where each status may go next; finished downloads stay as they are
+TRANSITIONS = {
+    QUEUED: frozenset({DOWNLOADING, ERROR}),
+    DOWNLOADING: frozenset({COMPLETED, SKIPPED, ERROR}),
+    COMPLETED: frozenset(),
+    SKIPPED: frozenset(),
+    ERROR: frozenset(),
+}
+
+# Always present in the JSON form, in this order
+_FIELDS = (
+    "url",
+    "folder",
+    "filename",
+    "path",
+    "total_size",
+    "downloaded",
+    "percent",
+    "status",
+    "error",
+    "start_time",
+    "download_id",
+)
+# Present once known
+_OPTIONAL_FIELDS = (
+    "end_time",
+    "content_type",
+    "etag",
+    "accept_ranges",
+    "segments",
+    "priority",
+    "queue_position",
+    "expected_sha256",
+    "sha256",
+    "speed",
+    "eta",
+    "retries",
+    "retry_at",
+    "retry_reason",
+)
+
+
+class Download:
+    """State and progress of one requested download.
+
+    ``status`` changes only through ``transition``. ``percent``, ``speed``
+    (MB/s since the transfer started, excluding resumed bytes) and ``eta``
+    (seconds) are derived from the byte counts by ``update_progress``.
+    """
+
+    __slots__ = (
+        "_status",
+        "accept_ranges",
+        "content_type",
+        "download_id",
+        "downloaded",
+        "end_time",
+        "error",
+        "eta",
+        "etag",
+        "expected_sha256",
+        "filename",
+        "folder",
+        "path",
+        "percent",
+        "priority",
+        "queue_position",
+        "retries",
+        "retry_at",
+        "retry_reason",
+        "segments",
+        "sha256",
+        "speed",
+        "start_time",
+        "total_size",
+        "url",
+    )
+
+    def __init__(self, download_id: str, url: str, folder: str, filename: str, path: str) -> None:
+        self.download_id = download_id
+        self.url = url
+        self.folder = folder
+        self.filename = filename
+        self.path = path
+        self._status = QUEUED
+        self.error: str | None = None
+        self.total_size = 0
+        self.downloaded = 0
+        self.percent = 0
+        self.speed: float | None = None
+        self.eta: int | None = None
+        self.start_time = time.time()
+        self.end_time: float | None = None
+        self.content_type: str | None = None
+        self.etag: str | None = None
+        self.accept_ranges: bool | None = None
+        self.segments: int | None = None
+        self.priority: str | None = None
+        self.queue_position: int | None = None
+        self.expected_sha256: str | None = None
+        self.sha256: str | None = None
+        # Reconnects after transient failures, and the one being waited for
+        self.retries: int | None = None
+        self.retry_at: float | None = None
+        self.retry_reason: str | None = None
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @property
+    def active(self) -> bool:
+        """Whether the download is queued or running."""
+        return self._status in ACTIVE
+
+    def transition(self, status: str, error: str | None = None) -> None:
+        """Move to *status*, recording *error* for a failure.
+
+        Raises ValueError if the current status cannot lead to *status*.
+        """
+        if status not in TRANSITIONS[self._status]:
+            msg = f"Download {self.download_id} cannot go from {self._status} to {status}"
+            raise ValueError(msg)
+        self._status = status
+        self.queue_position = None
+        if status == DOWNLOADING:
+            self.start_time = time.time()
+        elif status not in ACTIVE:
+            self.end_time = time.time()
+            if error is not None:
+                self.error = error
+
+    def update_progress(self, downloaded: int, transferred: int, elapsed: float) -> None:
+        """Set the byte count and derive percent, speed and ETA from it.
+
+        *transferred* of the *downloaded* bytes arrived in the last *elapsed*
+        seconds; the rest were on disk already and do not count towards speed.
+        """
+        self.downloaded = downloaded
+        if self.total_size > 0:
+            self.percent = int(downloaded / self.total_size * 100)
+        if transferred > 0 and elapsed > 0:
+            speed = transferred / (1024 * 1024) / elapsed
+            self.speed = round(speed, 2)
+            if self.total_size > 0:
+                self.eta = int((self.total_size - downloaded) / (speed * 1024 * 1024))
+
+    def as_dict(self) -> dict[str, Any]:
+        """The JSON form served by the API: unknown optional fields are left out."""
+        data = {name: getattr(self, name) for name in _FIELDS}
+        for name in _OPTIONAL_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
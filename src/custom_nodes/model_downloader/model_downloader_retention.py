@@ -0,0 +1,59 @@
+"""Expiry of finished downloads from memory.
+
+A finished download stays in ``active_downloads`` for a while, so the
+frontend can show its outcome, and is then forgotten. Every finished
+download used to hold its own sleeping task or timer for that. They all wait
+equally long, so expiries come in the order downloads finish: one queue in
+that order and a single timer for its head cover any number of them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+class RetentionQueue:
+    """Call *evict* with each added key *ttl* seconds after it was added.
+
+    Args:
+        ttl: Seconds a key is kept.
+        evict: Forgets a key; called on the event loop.
+    """
+
+    def __init__(self, ttl: float, evict: Callable[[str], None]) -> None:
+        self.ttl = ttl
+        self._evict = evict
+        # (loop time to evict at, key), in that order
+        self._queue: collections.deque[tuple[float, str]] = collections.deque()
+        self._timer: asyncio.TimerHandle | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def add(self, key: str) -> None:
+        """Evict *key* once the retention time has passed; needs a running loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A new loop (tests, a restarted server) cannot fire the old timer
+            self._loop, self._timer = loop, None
+        self._queue.append((loop.time() + self.ttl, key))
+        if self._timer is None:
+            self._timer = loop.call_at(self._queue[0][0], self._sweep)
+
+    def _sweep(self) -> None:
+        self._timer = None
+        loop = self._loop
+        if loop is None:
+            return
+        now = loop.time()
+        while self._queue and self._queue[0][0] <= now:
+            _expires, key = self._queue.popleft()
+            self._evict(key)
+        if self._queue:
+            self._timer = loop.call_at(self._queue[0][0], self._sweep)
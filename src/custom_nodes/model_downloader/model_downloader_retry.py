@@ -0,0 +1,102 @@
+"""Retry policy for transient download failures.
+
+One dropped connection or read timeout used to fail a download outright,
+throwing away everything fetched so far. Failures that are likely to pass
+(server errors, rate limiting, resets, timeouts) are retried after an
+exponentially growing, jittered delay, or after the one the origin asked for
+with Retry-After. Anything else (a 404, a full disk, a checksum mismatch)
+still fails at once.
+"""
+
+from __future__ import annotations
+
+import email.utils
+import random
+import time
+from http import HTTPStatus
+
+# Statuses worth asking again for
+RETRYABLE_STATUSES = frozenset(
+    {
+        HTTPStatus.REQUEST_TIMEOUT,
+        HTTPStatus.TOO_MANY_REQUESTS,
+        HTTPStatus.INTERNAL_SERVER_ERROR,
+        HTTPStatus.BAD_GATEWAY,
+        HTTPStatus.SERVICE_UNAVAILABLE,
+        HTTPStatus.GATEWAY_TIMEOUT,
+    }
+)
+
+# Longest Retry-After honoured; an origin asking for more is not waited for
+MAX_RETRY_AFTER = 300.0
+
+
+class HTTPStatusError(OSError):
+    """An origin answered a download request with an error status."""
+
+    def __init__(self, status: int, reason: str | None, retry_after: float | None = None) -> None:
+        super().__init__(f"HTTP error {status}: {reason}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """Seconds to wait according to a Retry-After header, if it has a valid one.
+
+    Both forms are accepted: delay-seconds and an HTTP date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+def failure_reason(error: BaseException) -> str | None:
+    """Short description of a transient *error*, or None if it is fatal."""
+    if isinstance(error, HTTPStatusError):
+        return f"HTTP {error.status}" if error.status in RETRYABLE_STATUSES else None
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    if isinstance(error, ConnectionError):
+        return "connection"
+    return None
+
+
+class RetryPolicy:
+    """How often, and after how long, a failed request is tried again.
+
+    Args:
+        attempts: Retries allowed after consecutive failures.
+        base_delay: Seconds before the first retry; doubled for each further one.
+        max_delay: Longest delay between retries, Retry-After aside.
+    """
+
+    __slots__ = ("attempts", "base_delay", "max_delay")
+
+    def __init__(self, attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0) -> None:
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, error: BaseException) -> float | None:
+        """Seconds to wait before retry number *attempt* after *error*.
+
+        None means giving up: the error is fatal, the retries are used up, or
+        the origin asked to wait longer than ``MAX_RETRY_AFTER``. Otherwise
+        the delay is the origin's Retry-After, else a random one between half
+        and all of ``base_delay * 2 ** (attempt - 1)`` (at most ``max_delay``),
+        so downloads failing together do not all come back at once.
+        """
+        if attempt > self.attempts or failure_reason(error) is None:
+            return None
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return retry_after if retry_after <= MAX_RETRY_AFTER else None
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
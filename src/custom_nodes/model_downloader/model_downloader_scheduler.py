@@ -0,0 +1,153 @@
+"""Bounded, prioritised scheduler for model downloads.
+
+Downloads wait in a priority queue until both the global concurrency cap and
+the cap for their origin host allow them to start, so a burst of requests
+does not turn into dozens of streams competing for the same disk and link.
+"""
+
+from __future__ import annotations
+
+import bisect
+import itertools
+import logging
+from collections.abc import Callable, Coroutine
+from typing import Any
+from urllib.parse import urlparse
+
+logger = logging.getLogger("model_downloader")
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+PRIORITY_NAMES = {"high": PRIORITY_HIGH, "normal": PRIORITY_NORMAL, "low": PRIORITY_LOW}
+PRIORITY_LABELS = {value: name for name, value in PRIORITY_NAMES.items()}
+
+JobFactory = Callable[[], Coroutine[Any, Any, None]]
+Spawn = Callable[[Coroutine[Any, Any, None]], Any]
+
+
+def parse_host_limits(spec: str) -> dict[str, int]:
+    """Parse ``"huggingface.co=3,civitai.com=1"`` into a host -> cap mapping."""
+    limits: dict[str, int] = {}
+    for item in spec.split(","):
+        host, sep, value = item.strip().partition("=")
+        if not sep:
+            continue
+        try:
+            limits[host.strip().lower()] = max(1, int(value))
+        except ValueError:
+            logger.warning("Ignoring invalid host limit %r", item)
+    return limits
+
+
+class _Job:
+    __slots__ = ("factory", "host", "key", "priority", "seq")
+
+    def __init__(self, key: str, host: str, priority: int, seq: int, factory: JobFactory) -> None:
+        self.key = key
+        self.host = host
+        self.priority = priority
+        self.seq = seq
+        self.factory = factory
+
+    def __lt__(self, other: _Job) -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class DownloadScheduler:
+    """Start queued downloads as global and per-host capacity allows.
+
+    Jobs are ordered by priority, then submission order. A job whose host is
+    at its cap does not block lower-priority jobs for other hosts.
+
+    Args:
+        max_active: Maximum number of downloads running at once.
+        host_limits: Per-host caps. A key also covers its subdomains, so
+            ``huggingface.co`` includes ``cdn-lfs.huggingface.co``.
+        default_host_limit: Cap for hosts without an explicit entry.
+        spawn: Schedules a coroutine on the event loop.
+        on_change: Called whenever queue positions may have changed.
+    """
+
+    def __init__(
+        self,
+        max_active: int,
+        host_limits: dict[str, int],
+        default_host_limit: int,
+        spawn: Spawn,
+        on_change: Callable[[], None] | None = None,
+    ) -> None:
+        self.max_active = max(1, max_active)
+        self.host_limits = host_limits
+        self.default_host_limit = max(1, default_host_limit)
+        self._spawn = spawn
+        self._on_change = on_change
+        self._queue: list[_Job] = []
+        self._active: dict[str, str] = {}
+        self._active_per_host: dict[str, int] = {}
+        self._seq = itertools.count()
+
+    @property
+    def active_count(self) -> int:
+        return len(self._active)
+
+    @property
+    def queued_count(self) -> int:
+        return len(self._queue)
+
+    def host_key(self, url: str) -> str:
+        """Return the host bucket *url* is counted against."""
+        host = (urlparse(url).hostname or "").lower()
+        for configured in self.host_limits:
+            if host == configured or host.endswith(f".{configured}"):
+                return configured
+        return host
+
+    def host_limit(self, host: str) -> int:
+        return self.host_limits.get(host, self.default_host_limit)
+
+    def submit(self, key: str, url: str, priority: int, factory: JobFactory) -> None:
+        """Queue *factory* under *key*; it starts as soon as capacity allows."""
+        job = _Job(key, self.host_key(url), priority, next(self._seq), factory)
+        bisect.insort(self._queue, job)
+        self._dispatch()
+
+    def is_queued(self, key: str) -> bool:
+        return any(job.key == key for job in self._queue)
+
+    def positions(self) -> dict[str, int]:
+        """Return the 1-based queue position of every waiting job."""
+        return {job.key: index for index, job in enumerate(self._queue, start=1)}
+
+    def _dispatch(self) -> None:
+        started = False
+        for job in list(self._queue):
+            if len(self._active) >= self.max_active:
+                break
+            if self._active_per_host.get(job.host, 0) >= self.host_limit(job.host):
+                continue
+            self._queue.remove(job)
+            self._active[job.key] = job.host
+            self._active_per_host[job.host] = self._active_per_host.get(job.host, 0) + 1
+            self._spawn(self._run(job))
+            started = True
+        if started or self._queue:
+            self._notify()
+
+    async def _run(self, job: _Job) -> None:
+        try:
+            await job.factory()
+        finally:
+            self._active.pop(job.key, None)
+            self._active_per_host[job.host] -= 1
+            if not self._active_per_host[job.host]:
+                del self._active_per_host[job.host]
+            self._dispatch()
+
+    def _notify(self) -> None:
+        if self._on_change is not None:
+            try:
+                self._on_change()
+            except Exception:
+                logger.exception("Download queue change callback failed")
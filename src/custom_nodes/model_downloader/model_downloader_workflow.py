@@ -0,0 +1,172 @@
+"""Find the model files a ComfyUI workflow or prompt depends on.
+
+Understands the UI workflow format (``nodes`` with ``widgets_values``, the
+``models`` download metadata at the top level and in node properties,
+subgraph definitions) and the API prompt format (``{node_id: {"class_type",
+"inputs"}}``), as well as a ``/prompt`` request body wrapping either.
+"""
+
+from __future__ import annotations
+
+import posixpath
+import re
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+# Widget values with one of these extensions are taken to be model files
+MODEL_EXTENSIONS = (
+    ".bin",
+    ".ckpt",
+    ".gguf",
+    ".onnx",
+    ".pt",
+    ".pt2",
+    ".pth",
+    ".safetensors",
+    ".sft",
+)
+
+_SHA256_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+
+class ModelReference:
+    """A model file a workflow needs.
+
+    ``directory`` and ``url`` come from the workflow's ``models`` metadata and
+    are None for files only seen as widget values.
+    """
+
+    __slots__ = ("directory", "name", "sha256", "url")
+
+    def __init__(
+        self,
+        name: str,
+        directory: str | None = None,
+        url: str | None = None,
+        sha256: str | None = None,
+    ) -> None:
+        self.name = name
+        self.directory = directory
+        self.url = url
+        self.sha256 = sha256
+
+
+def extract_model_references(payload: Any) -> list[ModelReference]:
+    """Return each model file referenced by *payload* once, metadata first."""
+    references: dict[str, ModelReference] = {}
+    names: list[str] = []
+    for workflow, prompt in _unwrap(payload):
+        if workflow is not None:
+            for entry in _model_metadata(workflow):
+                reference = _reference_from_metadata(entry)
+                if reference is not None and reference.name not in references:
+                    references[reference.name] = reference
+            names.extend(_widget_model_names(workflow))
+        if prompt is not None:
+            names.extend(_prompt_model_names(prompt))
+
+    described = {posixpath.basename(name) for name in references}
+    for name in names:
+        if name not in references and posixpath.basename(name) not in described:
+            references[name] = ModelReference(name)
+    return list(references.values())
+
+
+def _unwrap(payload: Any) -> Iterator[tuple[dict[str, Any] | None, dict[str, Any] | None]]:
+    """Yield ``(ui_workflow, api_prompt)`` pairs found in *payload*."""
+    if not isinstance(payload, dict):
+        return
+    if isinstance(payload.get("nodes"), list):
+        yield payload, None
+        return
+    if "prompt" in payload or "workflow" in payload or "extra_data" in payload:
+        workflow = payload.get("workflow")
+        extra = payload.get("extra_data")
+        if workflow is None and isinstance(extra, dict):
+            pnginfo = extra.get("extra_pnginfo")
+            if isinstance(pnginfo, dict):
+                workflow = pnginfo.get("workflow")
+        prompt = payload.get("prompt")
+        yield (
+            workflow if isinstance(workflow, dict) else None,
+            prompt if isinstance(prompt, dict) else None,
+        )
+        return
+    yield None, payload
+
+
+def _all_nodes(workflow: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield from (node for node in workflow.get("nodes") or [] if isinstance(node, dict))
+    definitions = workflow.get("definitions")
+    if isinstance(definitions, dict):
+        for subgraph in definitions.get("subgraphs") or []:
+            if isinstance(subgraph, dict):
+                yield from _all_nodes(subgraph)
+
+
+def _model_metadata(workflow: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    for entry in workflow.get("models") or []:
+        if isinstance(entry, dict):
+            yield entry
+    for node in _all_nodes(workflow):
+        properties = node.get("properties")
+        if isinstance(properties, dict):
+            for entry in properties.get("models") or []:
+                if isinstance(entry, dict):
+                    yield entry
+
+
+def _reference_from_metadata(entry: dict[str, Any]) -> ModelReference | None:
+    name = _model_name(entry.get("name"), require_extension=False)
+    if name is None:
+        return None
+    url = entry.get("url")
+    directory = entry.get("directory")
+    sha256 = None
+    if str(entry.get("hash_type", "")).lower() == "sha256" and _SHA256_RE.fullmatch(
+        str(entry.get("hash", ""))
+    ):
+        sha256 = str(entry["hash"]).lower()
+    return ModelReference(
+        name,
+        directory=directory if isinstance(directory, str) and directory else None,
+        url=url if isinstance(url, str) and url.startswith(("https://", "http://")) else None,
+        sha256=sha256,
+    )
+
+
+def _widget_model_names(workflow: dict[str, Any]) -> Iterator[str]:
+    for node in _all_nodes(workflow):
+        values = node.get("widgets_values")
+        if isinstance(values, dict):
+            values = list(values.values())
+        if isinstance(values, list):
+            yield from _model_names(values)
+
+
+def _prompt_model_names(prompt: dict[str, Any]) -> Iterator[str]:
+    for node in prompt.values():
+        if isinstance(node, dict) and isinstance(node.get("inputs"), dict):
+            yield from _model_names(node["inputs"].values())
+
+
+def _model_names(values: Any) -> Iterator[str]:
+    for value in values:
+        name = _model_name(value, require_extension=True)
+        if name is not None:
+            yield name
+
+
+def _model_name(value: Any, *, require_extension: bool) -> str | None:
+    """Normalise a model filename; None if it is not a plausible one."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    # Workflows saved on Windows use backslashes in subfolder paths
+    name = posixpath.normpath(value.strip().replace("\\", "/"))
+    if name.startswith(("/", "../")) or name in {".", ".."}:
+        return None
+    if require_extension and not name.lower().endswith(MODEL_EXTENSIONS):
+        return None
+    return name
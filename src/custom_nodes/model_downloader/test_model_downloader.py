@@ -8,11 +8,20 @@ checks, skip-if-exists, HF auth headers, and progress tracking.
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import errno
+import hashlib
+import importlib
+import itertools
 import json
 import logging
 import os
+import subprocess
 import sys
+import threading
+import time
 import types
+from http import HTTPStatus
 from typing import Any
 from unittest.mock import AsyncMock, MagicMock, patch
 
@@ -36,8 +45,17 @@ _server_mock.PromptServer = _prompt_server_class  # type: ignore[attr-defined]
 # Mock aiohttp if not available (dev shell may not have it)
 if "aiohttp" not in sys.modules:
     _aiohttp = types.ModuleType("aiohttp")
+    _aiohttp.ClientError = type("ClientError", (Exception,), {})  # type: ignore[attr-defined]
+    _aiohttp.ClientConnectionError = type("ClientConnectionError", (_aiohttp.ClientError,), {})  # type: ignore[attr-defined]
+    _aiohttp.ServerDisconnectedError = type(  # type: ignore[attr-defined]
+        "ServerDisconnectedError", (_aiohttp.ClientConnectionError,), {}
+    )
+    _aiohttp.ClientPayloadError = type("ClientPayloadError", (_aiohttp.ClientError,), {})  # type: ignore[attr-defined]
+    _aiohttp.InvalidURL = type("InvalidURL", (_aiohttp.ClientError, ValueError), {})  # type: ignore[attr-defined]
+    _aiohttp.TooManyRedirects = type("TooManyRedirects", (_aiohttp.ClientError,), {})  # type: ignore[attr-defined]
     _aiohttp.ClientSession = MagicMock()  # type: ignore[attr-defined]
     _aiohttp.ClientTimeout = MagicMock()  # type: ignore[attr-defined]
+    _aiohttp.TCPConnector = MagicMock()  # type: ignore[attr-defined]
     _aiohttp_web = types.ModuleType("aiohttp.web")
     _aiohttp_web.Request = MagicMock()  # type: ignore[attr-defined]
 
@@ -46,8 +64,15 @@ if "aiohttp" not in sys.modules:
         resp.body = json.dumps(data).encode()
         return resp
 
+    class _Response:
+        def __init__(self, *, body=None, status=200, headers=None, content_type=None):
+            self.body = body
+            self.status = status
+            self.headers = headers or {}
+            self.content_type = content_type
+
     _aiohttp_web.json_response = _json_response  # type: ignore[attr-defined]
-    _aiohttp_web.Response = MagicMock()  # type: ignore[attr-defined]
+    _aiohttp_web.Response = _Response  # type: ignore[attr-defined]
     _aiohttp.web = _aiohttp_web  # type: ignore[attr-defined]
     sys.modules["aiohttp"] = _aiohttp
     sys.modules["aiohttp.web"] = _aiohttp_web
@@ -71,6 +96,65 @@ def _clear_downloads():
     mdp.active_downloads.clear()
 
 
+# Transitions leading from "queued" to each status
+_STATUS_STEPS = {
+    "queued": (),
+    "downloading": ("downloading",),
+    "completed": ("downloading", "completed"),
+    "skipped": ("downloading", "skipped"),
+    "error": ("error",),
+}
+
+
+def _advance(download: mdp.Download, status: str) -> None:
+    """Move a queued *download* to *status* the way a download would."""
+    for step in _STATUS_STEPS[status]:
+        download.transition(step)
+
+
+def _entry(download_id: str, status: str = "downloading", **fields: Any) -> mdp.Download:
+    """Add a download record in *status* with *fields* to active_downloads."""
+    download = mdp.Download(
+        download_id,
+        fields.pop("url", "https://example.com/m"),
+        fields.pop("folder", "checkpoints"),
+        fields.pop("filename", "m.safetensors"),
+        fields.pop("path", ""),
+    )
+    _advance(download, status)
+    for name, value in fields.items():
+        setattr(download, name, value)
+    mdp.active_downloads[download_id] = download
+    return download
+
+
+@pytest.fixture(autouse=True)
+def _fresh_scheduler(monkeypatch):
+    """Give each test an empty download queue, no shared session and no subscribers."""
+    monkeypatch.setattr(mdp, "_scheduler", mdp._create_scheduler())
+    monkeypatch.setattr(mdp, "_session", None)
+    monkeypatch.setattr(
+        mdp,
+        "_broadcaster",
+        mdp.ProgressBroadcaster(mdp._send_event, mdp._connected_clients, mdp._progress_payload),
+    )
+    monkeypatch.setattr(mdp, "_changes", mdp.ChangeTracker())
+    monkeypatch.setattr(mdp, "_limiter", mdp.BandwidthLimiter())
+    monkeypatch.setattr(mdp, "_in_flight", {})
+    monkeypatch.setattr(mdp, "_retention", mdp.RetentionQueue(60, mdp._forget_download))
+    monkeypatch.setattr(mdp, "_pending_history", [])
+    monkeypatch.setattr(mdp, "_history_writer", None)
+    mdp._listing_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    """Keep journals and other downloader state inside the test's tmp dir."""
+    state = tmp_path / "state"
+    monkeypatch.setenv("MODEL_DOWNLOADER_STATE_DIR", str(state))
+    return state
+
+
 @pytest.fixture
 def tmp_model_dir(tmp_path):
     """Create a temporary writable model directory."""
@@ -90,6 +174,155 @@ def tmp_readonly_dir(tmp_path):
     d.chmod(0o755)
 
 
+class _FakeContent:
+    """Stand-in for aiohttp's StreamReader over an in-memory body.
+
+    The body arrives in network chunks of ``chunk_size`` bytes; a failure
+    raises ``error``.
+    """
+
+    chunk_size = 64 * 1024
+    error: type[OSError] = OSError
+
+    def __init__(self, data: bytes, fail_at: int | None = None) -> None:
+        self._data = data
+        self._fail_at = fail_at
+        self._position = 0
+        self.read = False
+
+    async def readchunk(self) -> tuple[bytes, bool]:
+        self.read = True
+        i = self._position
+        if i >= len(self._data):
+            return b"", False
+        if self._fail_at is not None and i >= self._fail_at:
+            raise self.error("Connection reset by peer")
+        self._position += self.chunk_size
+        return self._data[i : i + self.chunk_size], False
+
+
+class _FakeResponse:
+    """Async context manager mimicking an aiohttp ClientResponse."""
+
+    def __init__(
+        self,
+        status: int,
+        data: bytes = b"",
+        headers: dict[str, str] | None = None,
+        fail_at: int | None = None,
+    ):
+        self.status = status
+        self.reason = HTTPStatus(status).phrase
+        self.headers = headers or {}
+        self.content = _FakeContent(data, fail_at)
+        self.url = "https://example.com/m"
+        self.closed = False
+
+    def __await__(self):
+        yield from ()
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+        return False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class _FakeOrigin:
+    """Minimal ClientSession stand-in serving one in-memory file.
+
+    ``ranges`` controls whether GET honours Range headers; ``advertise``
+    controls whether HEAD claims ``Accept-Ranges: bytes``. ``fail_at`` makes
+    the next GET drop the connection after that many bytes of its body, each
+    of ``statuses`` answers one GET with that status instead of data, and
+    each of ``errors`` is raised by one GET before any of those.
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+        *,
+        ranges: bool = True,
+        advertise: bool | None = None,
+        etag: str | None = None,
+        fail_at: int | None = None,
+    ):
+        self.data = data
+        self.ranges = ranges
+        self.advertise = ranges if advertise is None else advertise
+        self.etag = etag
+        self.fail_at = fail_at
+        self.closed = False
+        self.requests: list[dict[str, str]] = []
+        self.responses: list[_FakeResponse] = []
+        self.heads = 0
+        self.head_status = 200
+        self.final_url: str | None = None
+        self.statuses: list[int] = []
+        self.error_headers: dict[str, str] = {}
+        self.errors: list[Exception] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def head(self, _url: str, **_kwargs: Any) -> _FakeResponse:
+        self.heads += 1
+        headers = {"content-length": str(len(self.data))}
+        if self.advertise:
+            headers["accept-ranges"] = "bytes"
+        if self.etag:
+            headers["etag"] = self.etag
+        response = _FakeResponse(self.head_status, headers=headers)
+        response.url = self.final_url or _url
+        return response
+
+    def get(
+        self, _url: str, headers: dict[str, str] | None = None, **_kwargs: Any
+    ) -> _FakeResponse:
+        headers = dict(headers or {})
+        self.requests.append(headers)
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.statuses:
+            response = _FakeResponse(self.statuses.pop(0), headers=self.error_headers)
+            self.responses.append(response)
+            return response
+        fail_at, self.fail_at = self.fail_at, None
+        range_header = headers.get("Range")
+        if_range = headers.get("If-Range")
+        validator = {"etag": self.etag} if self.etag else {}
+        if range_header and self.ranges and (if_range is None or if_range == self.etag):
+            first, _, last = range_header.removeprefix("bytes=").partition("-")
+            start = int(first)
+            end = int(last) if last else len(self.data) - 1
+            body = self.data[start : end + 1]
+            response = _FakeResponse(
+                206,
+                body,
+                {
+                    "content-length": str(len(body)),
+                    "content-range": f"bytes {start}-{end}/{len(self.data)}",
+                    **validator,
+                },
+                fail_at,
+            )
+        else:
+            response = _FakeResponse(
+                200, self.data, {"content-length": str(len(self.data)), **validator}, fail_at
+            )
+        response.url = self.final_url or _url
+        self.responses.append(response)
+        return response
+
+
 # ---------------------------------------------------------------------------
 # Tests: _find_writable_path
 # ---------------------------------------------------------------------------
@@ -145,12 +378,7 @@ class TestPrepareDownloadPath:
         model_file.write_bytes(data)
 
         download_id = "dl_skip"
-        mdp.active_downloads[download_id] = {
-            "status": "downloading",
-            "total_size": 0,
-            "downloaded": 0,
-            "percent": 0,
-        }
+        _entry(download_id)
 
         with patch.object(mdp, "send_download_update", new_callable=AsyncMock):
             result = asyncio.run(
@@ -158,20 +386,16 @@ class TestPrepareDownloadPath:
             )
 
         assert result is None
-        assert mdp.active_downloads[download_id]["status"] == "skipped"
-        assert mdp.active_downloads[download_id]["percent"] == 100
-        assert mdp.active_downloads[download_id]["total_size"] == 5000
+        assert mdp.active_downloads[download_id].status == "skipped"
+        assert mdp.active_downloads[download_id].percent == 100
+        assert mdp.active_downloads[download_id].total_size == 5000
 
     def test_renames_when_file_exists_with_different_size(self, tmp_model_dir):
         model_file = tmp_model_dir / "existing.safetensors"
         model_file.write_bytes(b"x" * 3000)
 
         download_id = "dl_rename"
-        mdp.active_downloads[download_id] = {
-            "status": "downloading",
-            "path": str(model_file),
-            "filename": "existing.safetensors",
-        }
+        _entry(download_id, path=str(model_file), filename="existing.safetensors")
 
         result = asyncio.run(
             mdp._prepare_download_path(download_id, str(model_file), remote_size=5000)
@@ -187,11 +411,7 @@ class TestPrepareDownloadPath:
         model_file.write_bytes(b"x" * 3000)
 
         download_id = "dl_unknown"
-        mdp.active_downloads[download_id] = {
-            "status": "downloading",
-            "path": str(model_file),
-            "filename": "existing.safetensors",
-        }
+        _entry(download_id, path=str(model_file), filename="existing.safetensors")
 
         result = asyncio.run(
             mdp._prepare_download_path(download_id, str(model_file), remote_size=0)
@@ -209,6 +429,34 @@ class TestPrepareDownloadPath:
         assert result == full_path
         assert new_dir.is_dir()
 
+    def _prepare_with_free_space(self, full_path: str, remote_size: int, free: int):
+        usage = types.SimpleNamespace(total=free * 2, used=free, free=free)
+        _entry("dl_space", path=full_path)
+        with (
+            patch("shutil.disk_usage", return_value=usage),
+            patch.object(mdp, "MIN_FREE_SPACE", 1000),
+            patch.object(mdp, "send_download_update", new_callable=AsyncMock),
+        ):
+            return asyncio.run(mdp._prepare_download_path("dl_space", full_path, remote_size))
+
+    def test_rejects_download_that_does_not_fit(self, tmp_model_dir):
+        full_path = str(tmp_model_dir / "big.safetensors")
+
+        assert self._prepare_with_free_space(full_path, 5000, free=6000) == full_path
+        assert self._prepare_with_free_space(full_path, 5001, free=6000) is None
+        entry = mdp.active_downloads["dl_space"]
+        assert entry.status == "error"
+        assert entry.error.startswith("Not enough disk space")
+
+    def test_counts_space_other_downloads_still_need(self, tmp_model_dir):
+        _entry("dl_other", path=str(tmp_model_dir / "other.safetensors"), total_size=3000)
+
+        result = self._prepare_with_free_space(
+            str(tmp_model_dir / "big.safetensors"), 3000, free=6000
+        )
+
+        assert result is None
+
 
 # ---------------------------------------------------------------------------
 # Tests: _get_hf_token
@@ -332,43 +580,109 @@ class TestParseRequestData:
 
 
 # ---------------------------------------------------------------------------
-# Tests: _update_download_progress
+# Tests: download records and progress sampling
 # ---------------------------------------------------------------------------
 
 
-class TestUpdateDownloadProgress:
+class TestDownloadRecord:
     def test_updates_percent_and_speed(self):
-        mdp.active_downloads["dl_prog"] = {
-            "downloaded": 0,
-            "percent": 0,
-            "total_size": 1000,
-        }
-        start = mdp.time.time() - 1.0  # 1 second ago
+        download = _entry("dl_prog", total_size=1000)
 
-        mdp._update_download_progress("dl_prog", 500, 1000, start)
+        download.update_progress(500, 500, 1.0)
 
-        assert mdp.active_downloads["dl_prog"]["downloaded"] == 500
-        assert mdp.active_downloads["dl_prog"]["percent"] == 50
-        assert "speed" in mdp.active_downloads["dl_prog"]
-        assert "eta" in mdp.active_downloads["dl_prog"]
+        assert download.downloaded == 500
+        assert download.percent == 50
+        assert download.speed == round(500 / (1024 * 1024), 2)
+        assert download.eta == 1
+        assert {"speed", "eta"} <= download.as_dict().keys()
 
     def test_handles_zero_total_size(self):
-        mdp.active_downloads["dl_zero"] = {
-            "downloaded": 0,
-            "percent": 0,
-            "total_size": 0,
-        }
-        start = mdp.time.time() - 1.0
+        download = _entry("dl_zero")
 
-        mdp._update_download_progress("dl_zero", 500, 0, start)
+        download.update_progress(500, 500, 1.0)
 
-        assert mdp.active_downloads["dl_zero"]["downloaded"] == 500
-        # percent not set when total_size is 0
-        assert mdp.active_downloads["dl_zero"]["percent"] == 0
+        assert download.downloaded == 500
+        # percent and ETA not set when total_size is 0
+        assert download.percent == 0
+        assert download.eta is None
 
-    def test_ignores_missing_download_id(self):
-        # Should not raise
-        mdp._update_download_progress("nonexistent", 500, 1000, mdp.time.time())
+    def test_resumed_bytes_do_not_count_towards_speed(self):
+        download = _entry("dl_resumed", total_size=4 * 1024 * 1024)
+
+        download.update_progress(3 * 1024 * 1024, 1024 * 1024, 1.0)
+
+        assert download.percent == 75
+        assert download.speed == 1.0
+        assert download.eta == 1
+
+    def test_status_follows_transitions(self):
+        download = _entry("dl_states", "queued")
+        download.queue_position = 2
+        assert download.as_dict()["queue_position"] == 2
+
+        download.transition("downloading")
+        assert download.queue_position is None
+        assert "end_time" not in download.as_dict()
+        download.transition("error", "Download failed")
+
+        assert download.as_dict()["status"] == "error"
+        assert download.error == "Download failed"
+        assert download.end_time is not None
+        with pytest.raises(ValueError, match="cannot go from error to downloading"):
+            download.transition("downloading")
+
+    def test_as_dict_leaves_out_unknown_fields(self):
+        data = _entry("dl_json", "queued").as_dict()
+
+        assert data["status"] == "queued"
+        assert data["error"] is None
+        assert not {"speed", "eta", "sha256", "end_time"} & data.keys()
+        json.dumps(data)
+
+
+class TestTransferProgress:
+    def test_chunks_only_count_until_sampled(self):
+        download = _entry("dl_sample", total_size=1000)
+        progress = mdp._TransferProgress("dl_sample", 1000, host="example.com")
+        counted = mdp._bytes_downloaded.value(host="example.com")
+
+        progress.advance(300)
+        progress.advance(200)
+        assert download.downloaded == 0
+        assert mdp._bytes_downloaded.value(host="example.com") == counted
+
+        progress.sample()
+        assert download.downloaded == 500
+        assert download.percent == 50
+        assert mdp._bytes_downloaded.value(host="example.com") - counted == 500
+
+    def test_logs_each_tenth_once(self, caplog):
+        _entry("dl_log", total_size=100)
+        progress = mdp._TransferProgress("dl_log", 100)
+
+        with caplog.at_level(logging.INFO, logger="model_downloader"):
+            for _ in range(4):
+                progress.advance(12)
+                progress.sample()
+
+        logged = [r.getMessage() for r in caplog.records if "Download progress" in r.getMessage()]
+        assert [message.split(": ")[1].split()[0] for message in logged] == [
+            "12%",
+            "24%",
+            "36%",
+            "48%",
+        ]
+
+    def test_rewound_bytes_stay_counted_as_received(self):
+        progress = mdp._TransferProgress("dl_rewind", 1000, host="rewind.example")
+
+        progress.advance(400)
+        progress.rewind(400)
+        progress.advance(1000)
+        progress.sample()
+
+        assert progress.downloaded == 1000
+        assert mdp._bytes_downloaded.value(host="rewind.example") == 1400
 
 
 # ---------------------------------------------------------------------------
@@ -378,27 +692,21 @@ class TestUpdateDownloadProgress:
 
 class TestFinalizeDownload:
     def test_marks_completed(self, tmp_model_dir):
-        mdp.active_downloads["dl_fin"] = {
-            "start_time": mdp.time.time() - 10,
-            "status": "downloading",
-        }
+        _entry("dl_fin", start_time=mdp.time.time() - 10)
 
         mdp._finalize_download("dl_fin", 5000, 5000, str(tmp_model_dir / "model.st"))
 
-        assert mdp.active_downloads["dl_fin"]["status"] == "completed"
-        assert mdp.active_downloads["dl_fin"]["percent"] == 100
-        assert mdp.active_downloads["dl_fin"]["downloaded"] == 5000
-        assert "end_time" in mdp.active_downloads["dl_fin"]
+        assert mdp.active_downloads["dl_fin"].status == "completed"
+        assert mdp.active_downloads["dl_fin"].percent == 100
+        assert mdp.active_downloads["dl_fin"].downloaded == 5000
+        assert mdp.active_downloads["dl_fin"].end_time is not None
 
     def test_handles_zero_total_size(self):
-        mdp.active_downloads["dl_fin0"] = {
-            "start_time": mdp.time.time() - 1,
-            "status": "downloading",
-        }
+        _entry("dl_fin0", start_time=mdp.time.time() - 1)
 
         mdp._finalize_download("dl_fin0", 5000, 0, "/path/model.st")
 
-        assert mdp.active_downloads["dl_fin0"]["percent"] == 0
+        assert mdp.active_downloads["dl_fin0"].percent == 0
 
     def test_ignores_missing_download_id(self):
         mdp._finalize_download("nonexistent", 5000, 5000, "/path")
@@ -503,6 +811,982 @@ class TestDownloadFile:
 
         assert "secret-query-token" not in caplog.text
 
+    def test_unexpected_error_fails_the_download(self, tmp_model_dir):
+        origin = _FakeOrigin(os.urandom(1024))
+        origin.errors = [RuntimeError("bug")]
+        mdp._in_flight["checkpoints", "m.safetensors"] = "dl_bug"
+
+        entry = _run_download(origin, "dl_bug", tmp_model_dir / "m.safetensors")
+
+        assert entry.status == "error"
+        assert entry.error == "Download failed"
+        # A repeat request starts afresh instead of attaching to a dead download
+        assert mdp._active_download_for("checkpoints", "m.safetensors") is None
+
+
+class TestSharedSession:
+    def test_reuses_one_session_across_downloads(self):
+        session = MagicMock(closed=False)
+        with patch.object(mdp, "ClientSession", return_value=session) as factory:
+            assert mdp._get_session() is session
+            assert mdp._get_session() is session
+        factory.assert_called_once()
+
+    def test_recreates_session_after_close(self):
+        first = MagicMock(closed=False, close=AsyncMock())
+        second = MagicMock(closed=False)
+        with patch.object(mdp, "ClientSession", side_effect=[first, second]):
+            assert mdp._get_session() is first
+            asyncio.run(mdp.close_session())
+            first.close.assert_awaited_once()
+            assert mdp._get_session() is second
+
+    def test_close_without_session_is_noop(self):
+        asyncio.run(mdp.close_session())
+        assert mdp._session is None
+
+
+# ---------------------------------------------------------------------------
+# Tests: segmented downloads
+# ---------------------------------------------------------------------------
+
+
+class TestPlanSegments:
+    def test_covers_whole_file_without_gaps(self):
+        segments = mdp._plan_segments(1003, 4)
+        assert segments[0][0] == 0
+        assert segments[-1][1] == 1002
+        for (_, end), (start, _) in itertools.pairwise(segments):
+            assert start == end + 1
+
+    def test_never_plans_more_segments_than_bytes(self):
+        assert mdp._plan_segments(2, 4) == [(0, 0), (1, 1)]
+
+
+class TestShouldSegment:
+    def test_requires_range_support_and_size(self):
+        download = _entry("dl_seg", total_size=mdp.SEGMENTED_MIN_SIZE, accept_ranges=True)
+        assert mdp._should_segment("dl_seg") is True
+
+        download.accept_ranges = False
+        assert mdp._should_segment("dl_seg") is False
+
+    def test_small_files_use_single_stream(self):
+        _entry("dl_small", total_size=mdp.SEGMENTED_MIN_SIZE - 1, accept_ranges=True)
+        assert mdp._should_segment("dl_small") is False
+
+
+def _run_download(origin: _FakeOrigin, download_id: str, target, **fields: Any) -> mdp.Download:
+    """Run download_file end to end against *origin* and return its entry."""
+    entry = _entry(download_id, path=str(target), **fields)
+    with (
+        patch.object(mdp, "ClientSession", return_value=origin),
+        patch.object(mdp, "send_download_update", new_callable=AsyncMock),
+    ):
+        asyncio.run(mdp.download_file(download_id, "https://example.com/m", str(target)))
+    return entry
+
+
+class TestDownloadSegmented:
+    def test_writes_all_segments_at_their_offsets(self, tmp_model_dir):
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        origin = _FakeOrigin(data)
+        target = tmp_model_dir / "model.safetensors"
+
+        with patch.object(mdp, "SEGMENTED_MIN_SIZE", 1024):
+            entry = _run_download(origin, "dl_multi", target)
+
+        assert target.read_bytes() == data
+        ranged = [headers for headers in origin.requests if "Range" in headers]
+        assert len(ranged) == mdp.SEGMENT_COUNT
+        assert entry.status == "completed"
+        assert entry.downloaded == len(data)
+        assert entry.percent == 100
+
+    def test_falls_back_to_single_stream_when_range_ignored(self, tmp_model_dir):
+        data = os.urandom(256 * 1024)
+        origin = _FakeOrigin(data, ranges=False, advertise=True)
+        target = tmp_model_dir / "model.safetensors"
+
+        with patch.object(mdp, "SEGMENTED_MIN_SIZE", 1024):
+            _run_download(origin, "dl_fallback", target)
+
+        assert target.read_bytes() == data
+        # The 200 to the first request's bytes=0- already carried the whole file
+        assert len(origin.requests) == 1
+
+    def test_first_response_serves_first_segment(self, tmp_model_dir):
+        data = os.urandom(4 * 1024 * 1024)
+        origin = _FakeOrigin(data)
+        target = tmp_model_dir / "model.safetensors"
+
+        with patch.object(mdp, "SEGMENTED_MIN_SIZE", 1024):
+            _run_download(origin, "dl_first_segment", target)
+
+        assert target.read_bytes() == data
+        assert origin.heads == 0
+        assert origin.requests[0]["Range"] == "bytes=0-"
+        assert len(origin.requests) == mdp.SEGMENT_COUNT
+        assert origin.responses[0].closed
+
+    def test_existing_file_is_skipped_without_reading_body(self, tmp_model_dir):
+        data = os.urandom(64 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+        target.write_bytes(b"x" * len(data))
+        origin = _FakeOrigin(data)
+
+        entry = _run_download(origin, "dl_exists", target)
+
+        assert entry.status == "skipped"
+        assert origin.heads == 0
+        [response] = origin.responses
+        assert response.closed
+        assert not response.content.read
+
+
+# ---------------------------------------------------------------------------
+# Tests: resumable downloads
+# ---------------------------------------------------------------------------
+
+
+class TestResumableDownload:
+    def test_interrupted_download_resumes_with_range(self, tmp_model_dir, state_dir):
+        data = os.urandom(3 * 1024 * 1024)
+        origin = _FakeOrigin(data, etag='"abc"', fail_at=1024 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+
+        entry = _run_download(origin, "dl_resume", target)
+
+        assert entry.status == "error"
+        assert not target.exists()
+        assert (tmp_model_dir / "model.safetensors.part").exists()
+        journal = mdp.load_journal(str(state_dir / "journal"), str(target))
+        assert journal is not None
+        assert journal["segments"] == [[0, len(data) - 1, 1024 * 1024]]
+
+        _run_download(origin, "dl_resume2", target)
+
+        assert target.read_bytes() == data
+        assert origin.requests[-1]["Range"] == f"bytes={1024 * 1024}-{len(data) - 1}"
+        assert origin.requests[-1]["If-Range"] == '"abc"'
+        assert not (tmp_model_dir / "model.safetensors.part").exists()
+        assert mdp.load_journal(str(state_dir / "journal"), str(target)) is None
+
+    def test_shutdown_checkpoints_off_the_event_loop(self, tmp_model_dir, state_dir, monkeypatch):
+        monkeypatch.setattr(_FakeContent, "error", asyncio.CancelledError)
+        data = os.urandom(2 * 1024 * 1024)
+        origin = _FakeOrigin(data, etag='"abc"', fail_at=1024 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+        threads: list[threading.Thread] = []
+        close = mdp._ResumableTransfer.close
+
+        def record_thread(transfer: mdp._ResumableTransfer, state: str) -> None:
+            threads.append(threading.current_thread())
+            close(transfer, state)
+
+        with (
+            patch.object(mdp._ResumableTransfer, "close", record_thread),
+            pytest.raises(asyncio.CancelledError),
+        ):
+            _run_download(origin, "dl_shutdown", target)
+
+        assert len(threads) == 1
+        assert threads[0] is not threading.main_thread()
+        journal = mdp.load_journal(str(state_dir / "journal"), str(target))
+        assert journal is not None
+        assert journal["state"] == mdp.STATE_RUNNING
+
+    def test_changed_etag_restarts_from_zero(self, tmp_model_dir):
+        data = os.urandom(2 * 1024 * 1024)
+        origin = _FakeOrigin(data, etag='"v1"', fail_at=1024 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+        _run_download(origin, "dl_v1", target)
+
+        origin.etag = '"v2"'
+        _run_download(origin, "dl_v2", target)
+
+        assert target.read_bytes() == data
+        # The stale If-Range is answered with the whole new file
+        assert origin.requests[-1]["If-Range"] == '"v1"'
+        assert origin.responses[-1].status == 200
+
+    def test_weak_etag_is_checked_with_head_before_resuming(self, tmp_model_dir):
+        data = os.urandom(2 * 1024 * 1024)
+        origin = _FakeOrigin(data, etag='W/"v1"', fail_at=1024 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+        _run_download(origin, "dl_weak1", target)
+        assert origin.heads == 0
+
+        _run_download(origin, "dl_weak2", target)
+
+        assert target.read_bytes() == data
+        assert origin.heads == 1
+        assert origin.requests[-1]["Range"] == f"bytes={1024 * 1024}-{len(data) - 1}"
+        assert "If-Range" not in origin.requests[-1]
+
+    def test_segmented_download_resumes_each_segment(self, tmp_model_dir):
+        data = os.urandom(4 * 1024 * 1024)
+        origin = _FakeOrigin(data, etag='"abc"', fail_at=0)
+        target = tmp_model_dir / "model.safetensors"
+
+        with patch.object(mdp, "SEGMENTED_MIN_SIZE", 1024):
+            _run_download(origin, "dl_seg1", target)
+            _run_download(origin, "dl_seg2", target)
+
+        assert target.read_bytes() == data
+
+    def test_startup_resumes_running_journals(self, tmp_model_dir, state_dir):
+        target = str(tmp_model_dir / "model.safetensors")
+        mdp.save_journal(
+            str(state_dir / "journal"),
+            {
+                "download_id": "dl_restart",
+                "url": "https://example.com/m",
+                "folder": "checkpoints",
+                "filename": "model.safetensors",
+                "path": target,
+                "etag": None,
+                "total_size": 10,
+                "segments": [[0, 9, 4]],
+                "state": mdp.STATE_RUNNING,
+            },
+        )
+
+        def close_queued_coroutine(coroutine):
+            coroutine.close()
+
+        with patch.object(
+            _prompt_server_instance.loop,
+            "create_task",
+            MagicMock(side_effect=close_queued_coroutine),
+        ) as create_task:
+            asyncio.run(mdp._resume_interrupted_downloads())
+
+        create_task.assert_called_once()
+        assert mdp.active_downloads["dl_restart"].path == target
+        assert mdp.active_downloads["dl_restart"].status == "queued"
+
+    def test_startup_ignores_failed_journals(self, tmp_model_dir, state_dir):
+        mdp.save_journal(
+            str(state_dir / "journal"),
+            {
+                "download_id": "dl_failed",
+                "url": "https://example.com/m",
+                "path": str(tmp_model_dir / "model.safetensors"),
+                "segments": [[0, 9, 4]],
+                "state": mdp.STATE_FAILED,
+            },
+        )
+
+        asyncio.run(mdp._resume_interrupted_downloads())
+
+        assert "dl_failed" not in mdp.active_downloads
+
+
+class TestRetries:
+    @pytest.fixture(autouse=True)
+    def _quick_retries(self, monkeypatch):
+        monkeypatch.setattr(mdp, "_retry_policy", mdp.RetryPolicy(3, 0.01, 0.01))
+
+    def test_policy_backs_off_exponentially_with_jitter(self):
+        policy = mdp.RetryPolicy(4, 1.0, 5.0)
+        reset = ConnectionResetError()
+
+        for attempt, ceiling in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 5.0)]:
+            assert ceiling / 2 <= policy.delay(attempt, reset) <= ceiling
+        assert policy.delay(5, reset) is None
+
+    @pytest.mark.parametrize(
+        ("error", "delay"),
+        [
+            (mdp.HTTPStatusError(503, "Service Unavailable", retry_after=7.0), 7.0),
+            (mdp.HTTPStatusError(429, "Too Many Requests", retry_after=3600.0), None),
+            (mdp.HTTPStatusError(404, "Not Found"), None),
+            (OSError(errno.ENOSPC, "No space left on device"), None),
+            (mdp._ChecksumMismatchError("sha256 mismatch"), None),
+        ],
+    )
+    def test_policy_honours_retry_after_and_fails_fatal_errors(self, error, delay):
+        assert mdp.RetryPolicy().delay(1, error) == delay
+
+    def test_parses_retry_after(self):
+        assert mdp.parse_retry_after("120") == 120.0
+        assert mdp.parse_retry_after("Wed, 21 Oct 2015 07:28:30 GMT", now=1445412480.0) == 30.0
+        assert mdp.parse_retry_after("soon") is None
+        assert mdp.parse_retry_after(None) is None
+
+    def test_reconnects_mid_stream_with_range(self, tmp_model_dir, monkeypatch):
+        monkeypatch.setattr(_FakeContent, "error", ConnectionResetError)
+        data = os.urandom(3 * 1024 * 1024)
+        origin = _FakeOrigin(data, etag='"abc"', fail_at=1024 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+
+        entry = _run_download(origin, "dl_reconnect", target)
+
+        assert entry.status == "completed"
+        assert target.read_bytes() == data
+        assert origin.requests[-1]["Range"] == f"bytes={1024 * 1024}-{len(data) - 1}"
+        assert entry.retries == 1
+        assert entry.retry_at is None
+        assert mdp._download_retries.value(host="example.com", reason="connection") == 1
+
+    def test_retries_server_errors_before_the_first_byte(self, tmp_model_dir):
+        data = os.urandom(1024)
+        origin = _FakeOrigin(data)
+        origin.statuses = [503, 429]
+        origin.error_headers = {"retry-after": "0"}
+
+        entry = _run_download(origin, "dl_busy", tmp_model_dir / "model.safetensors")
+
+        assert entry.status == "completed"
+        assert entry.retries == 2
+        assert len(origin.requests) == 3
+
+    def test_fails_at_once_on_client_errors(self, tmp_model_dir):
+        origin = _FakeOrigin(os.urandom(1024))
+        origin.statuses = [404]
+
+        entry = _run_download(origin, "dl_missing", tmp_model_dir / "model.safetensors")
+
+        assert entry.status == "error"
+        assert entry.retries is None
+        assert len(origin.requests) == 1
+
+    def test_retries_dropped_connections(self, tmp_model_dir):
+        aiohttp = sys.modules["aiohttp"]
+        origin = _FakeOrigin(os.urandom(1024))
+        origin.errors = [aiohttp.ServerDisconnectedError(), aiohttp.ClientPayloadError()]
+
+        entry = _run_download(origin, "dl_flaky", tmp_model_dir / "model.safetensors")
+
+        assert entry.status == "completed"
+        assert entry.retries == 2
+        assert len(origin.requests) == 3
+
+    @pytest.mark.parametrize(
+        "make_error",
+        [
+            lambda aiohttp: aiohttp.InvalidURL("hxxp://example.com/model"),
+            lambda aiohttp: aiohttp.TooManyRedirects(MagicMock(), ()),
+        ],
+        ids=["invalid-url", "too-many-redirects"],
+    )
+    def test_fails_at_once_on_request_errors(self, tmp_model_dir, make_error):
+        origin = _FakeOrigin(os.urandom(1024))
+        origin.errors = [make_error(sys.modules["aiohttp"])]
+
+        entry = _run_download(origin, "dl_broken", tmp_model_dir / "model.safetensors")
+
+        assert entry.status == "error"
+        assert entry.retries is None
+        assert len(origin.requests) == 1
+
+    def test_gives_up_after_the_last_attempt(self, tmp_model_dir):
+        origin = _FakeOrigin(os.urandom(1024))
+        origin.statuses = [502] * 10
+
+        entry = _run_download(origin, "dl_down", tmp_model_dir / "model.safetensors")
+
+        assert entry.status == "error"
+        assert entry.retries == 3
+        assert len(origin.requests) == 4
+
+    def test_reconnects_after_real_connection_drop(self, tmp_model_dir):
+        aiohttp, web = _real_aiohttp()
+        data = os.urandom(512 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+        seen: list[str | None] = []
+
+        async def handle(request: Any) -> Any:
+            seen.append(request.headers.get("Range"))
+            start = int(request.headers.get("Range", "bytes=0-")[6:].partition("-")[0])
+            response = web.StreamResponse(
+                status=206,
+                headers={
+                    "Content-Length": str(len(data) - start),
+                    "Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}",
+                    "ETag": '"v1"',
+                },
+            )
+            await response.prepare(request)
+            if len(seen) == 1:
+                # Promise the whole file, then drop the connection half-way
+                await response.write(data[: len(data) // 2])
+                await asyncio.sleep(0.1)
+                request.transport.close()
+                return response
+            await response.write(data[start:])
+            return response
+
+        async def run() -> None:
+            app = web.Application()
+            app.router.add_get("/m", handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            url = f"http://127.0.0.1:{runner.addresses[0][1]}/m"
+            try:
+                async with aiohttp.ClientSession() as session:
+                    with (
+                        patch.object(mdp, "ClientError", aiohttp.ClientError),
+                        patch.object(mdp, "ClientConnectionError", aiohttp.ClientConnectionError),
+                        patch.object(mdp, "ClientPayloadError", aiohttp.ClientPayloadError),
+                        patch.object(mdp, "_get_session", return_value=session),
+                        patch.object(mdp, "send_download_update", new_callable=AsyncMock),
+                    ):
+                        await mdp.download_file("dl_drop", url, str(target))
+            finally:
+                await runner.cleanup()
+
+        entry = _entry("dl_drop", path=str(target))
+        asyncio.run(run())
+
+        assert entry.status == "completed"
+        assert target.read_bytes() == data
+        assert len(seen) == 2
+        assert seen[1] is not None
+        assert int(seen[1].removeprefix("bytes=").partition("-")[0]) > 0
+
+    def test_progress_event_shows_backoff(self):
+        _entry("dl_wait", retries=2, retry_at=1234.5, retry_reason="HTTP 503")
+
+        payload = mdp._progress_payload("dl_wait")
+        assert payload is not None
+        assert (payload["retries"], payload["retry_at"], payload["retry_reason"]) == (
+            2,
+            1234.5,
+            "HTTP 503",
+        )
+
+
+class TestPreallocation:
+    def test_reserves_the_whole_part_file(self, tmp_model_dir):
+        data = os.urandom(256 * 1024)
+        with patch.object(os, "posix_fallocate", wraps=os.posix_fallocate) as fallocate:
+            entry = _run_download(_FakeOrigin(data), "dl_alloc", tmp_model_dir / "m.safetensors")
+
+        assert entry.status == "completed"
+        fallocate.assert_called_once()
+        assert fallocate.call_args.args[1:] == (0, len(data))
+
+    def test_unsupported_filesystem_gets_a_sparse_file(self, tmp_model_dir):
+        data = os.urandom(256 * 1024)
+        target = tmp_model_dir / "m.safetensors"
+        unsupported = OSError(errno.EOPNOTSUPP, "Operation not supported")
+        with patch.object(os, "posix_fallocate", side_effect=unsupported):
+            entry = _run_download(_FakeOrigin(data), "dl_sparse", target)
+
+        assert entry.status == "completed"
+        assert target.read_bytes() == data
+
+    def test_full_disk_fails_before_writing(self, tmp_model_dir, state_dir):
+        target = tmp_model_dir / "m.safetensors"
+        full = OSError(errno.ENOSPC, "No space left on device")
+        with patch.object(os, "posix_fallocate", side_effect=full):
+            entry = _run_download(_FakeOrigin(os.urandom(1024)), "dl_full", target)
+
+        assert entry.status == "error"
+        assert entry.error.startswith("Not enough disk space")
+        assert not (tmp_model_dir / "m.safetensors.part").exists()
+        assert mdp.load_journal(str(state_dir / "journal"), str(target)) is None
+
+
+# ---------------------------------------------------------------------------
+# Tests: chunk writer
+# ---------------------------------------------------------------------------
+
+
+class _GatedWrites:
+    """Record _pwrite_all calls; the first one blocks until released."""
+
+    def __init__(self, error: OSError | None = None) -> None:
+        self.calls: list[tuple[int, int, int]] = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.error = error
+
+    def __call__(self, fd: int, buffers: list[bytes], offset: int) -> None:
+        self.entered.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        self.calls.append((len(buffers), offset, sum(map(len, buffers))))
+        os.pwrite(fd, b"".join(buffers), offset)
+
+
+async def _wait_entered(gate: _GatedWrites) -> None:
+    await asyncio.to_thread(gate.entered.wait, 5)
+
+
+class TestChunkWriter:
+    def _open(self, tmp_path) -> int:
+        return os.open(tmp_path / "out.part", os.O_RDWR | os.O_CREAT, 0o644)
+
+    def test_coalesces_contiguous_chunks(self, tmp_path):
+        fd = self._open(tmp_path)
+        segment = mdp._Segment(0, 99)
+        gate = _GatedWrites()
+
+        async def run():
+            writer = mdp._ChunkWriter(fd, asyncio.get_running_loop())
+            for index in range(4):
+                await writer.write(segment, b"x" * 10)
+                segment.offset += 10
+                if index == 0:
+                    # Hold the thread in its first write while the rest queue up
+                    await _wait_entered(gate)
+            gate.release.set()
+            await writer.close()
+
+        with patch.object(mdp, "_pwrite_all", gate):
+            asyncio.run(run())
+        os.close(fd)
+
+        assert gate.calls == [(1, 0, 10), (3, 10, 30)]
+        assert segment.written == 40
+        assert (tmp_path / "out.part").read_bytes() == b"x" * 40
+
+    def test_write_blocks_while_queue_is_full(self, tmp_path):
+        fd = self._open(tmp_path)
+        segment = mdp._Segment(0, 99)
+        gate = _GatedWrites()
+
+        async def run():
+            writer = mdp._ChunkWriter(fd, asyncio.get_running_loop(), max_pending=10)
+            await writer.write(segment, b"a" * 10)
+            segment.offset += 10
+            await _wait_entered(gate)
+            blocked = asyncio.ensure_future(writer.write(segment, b"b" * 10))
+            await _settle()
+            assert not blocked.done()
+            gate.release.set()
+            await asyncio.wait_for(blocked, 5)
+            await writer.close()
+
+        with patch.object(mdp, "_pwrite_all", gate):
+            asyncio.run(run())
+        os.close(fd)
+
+        assert (tmp_path / "out.part").read_bytes() == b"a" * 10 + b"b" * 10
+
+    def test_write_error_reaches_the_download(self, tmp_path):
+        fd = self._open(tmp_path)
+        segment = mdp._Segment(0, 99)
+        gate = _GatedWrites(error=OSError(28, "No space left on device"))
+        gate.release.set()
+
+        async def run():
+            writer = mdp._ChunkWriter(fd, asyncio.get_running_loop())
+            await writer.write(segment, b"x" * 10)
+            with pytest.raises(OSError, match="No space"):
+                await writer.close()
+            with pytest.raises(OSError, match="No space"):
+                await writer.write(segment, b"y")
+
+        with patch.object(mdp, "_pwrite_all", gate):
+            asyncio.run(run())
+        os.close(fd)
+
+        assert segment.written == 0
+
+    def test_any_error_stopping_the_thread_reaches_the_download(self, tmp_path):
+        fd = self._open(tmp_path)
+        segment = mdp._Segment(0, 99)
+        hasher = mdp._StreamHasher([segment])
+
+        async def run():
+            writer = mdp._ChunkWriter(fd, asyncio.get_running_loop(), hasher, max_pending=10)
+            await writer.write(segment, b"x" * 10)
+            segment.offset += 10
+            # The queue stays full: the dead thread never releases its bytes
+            with pytest.raises(ValueError, match="hasher bug"):
+                await asyncio.wait_for(writer.write(segment, b"y" * 10), 5)
+            with pytest.raises(ValueError, match="hasher bug"):
+                await writer.close()
+
+        with patch.object(hasher, "update", side_effect=ValueError("hasher bug")):
+            asyncio.run(run())
+        os.close(fd)
+
+    def test_writer_failure_does_not_commit_the_file(self, tmp_model_dir):
+        target = tmp_model_dir / "model.safetensors"
+        with patch.object(mdp._StreamHasher, "update", side_effect=ValueError("hasher bug")):
+            entry = _run_download(_FakeOrigin(os.urandom(4096)), "dl_hasher", target)
+
+        assert entry.status == "error"
+        assert not target.exists()
+
+    def test_commit_refuses_unwritten_segments(self, tmp_model_dir, state_dir):
+        target = tmp_model_dir / "model.safetensors"
+        transfer = mdp._ResumableTransfer("dl_short", "https://example.com/m", str(target), 100)
+        transfer.open([mdp._Segment(0, 99)])
+        # Read to the end, but only half of it reached the file
+        transfer.segments[0].offset = 100
+        transfer.segments[0].written = 50
+
+        with pytest.raises(OSError, match="written only up to byte 50"):
+            transfer.commit()
+
+        assert not target.exists()
+        assert transfer.fd == -1
+        entry = mdp.load_journal(str(state_dir / "journal"), str(target))
+        assert entry is not None
+        assert entry["state"] == mdp.STATE_FAILED
+        assert entry["segments"] == [[0, 99, 50]]
+
+    def test_pwrite_all_writes_buffers_in_order(self, tmp_path):
+        fd = self._open(tmp_path)
+        mdp._pwrite_all(fd, [b"ab", b"cd", b"ef"], 4)
+        os.close(fd)
+
+        assert (tmp_path / "out.part").read_bytes() == b"\0" * 4 + b"abcdef"
+
+
+async def _collect(body) -> list[list[bytes]]:
+    return [[bytes(chunk) for chunk in batch] async for batch in body]
+
+
+class TestReadBody:
+    def test_batches_chunks_without_joining_them(self):
+        data = os.urandom(5 * _FakeContent.chunk_size)
+
+        batches = asyncio.run(_collect(mdp._read_body(_FakeContent(data))))
+
+        assert b"".join(itertools.chain.from_iterable(batches)) == data
+        assert all(len(chunk) <= _FakeContent.chunk_size for batch in batches for chunk in batch)
+
+    def test_stops_at_limit(self):
+        data = os.urandom(3 * _FakeContent.chunk_size)
+        limit = _FakeContent.chunk_size + 10
+
+        batches = asyncio.run(_collect(mdp._read_body(_FakeContent(data), limit)))
+
+        assert b"".join(itertools.chain.from_iterable(batches)) == data[:limit]
+
+    def test_yields_received_data_before_connection_error(self):
+        data = os.urandom(4 * _FakeContent.chunk_size)
+        received: list[bytes] = []
+
+        async def run():
+            async for batch in mdp._read_body(
+                _FakeContent(data, fail_at=2 * _FakeContent.chunk_size)
+            ):
+                received.extend(batch)
+
+        with (
+            patch.object(mdp, "READ_MIN_BYTES", 4 * _FakeContent.chunk_size),
+            pytest.raises(OSError, match="reset"),
+        ):
+            asyncio.run(run())
+
+        assert b"".join(received) == data[: 2 * _FakeContent.chunk_size]
+
+    def test_batch_size_follows_throughput(self):
+        sizer = mdp._ReadSizer()
+        assert sizer.size == mdp.READ_MIN_BYTES
+
+        sizer.update(mdp.READ_MIN_BYTES, 10.0)
+        assert sizer.size == mdp.READ_MIN_BYTES
+
+        for _ in range(8):
+            sizer.update(sizer.size, 0.001)
+        assert sizer.size == mdp.READ_MAX_BYTES
+
+
+# ---------------------------------------------------------------------------
+# Tests: sha256 verification
+# ---------------------------------------------------------------------------
+
+
+class TestSha256Verification:
+    def test_records_digest_of_streamed_download(self, tmp_model_dir, state_dir):
+        data = os.urandom(3 * 1024 * 1024 + 5)
+        target = tmp_model_dir / "model.safetensors"
+
+        entry = _run_download(_FakeOrigin(data), "dl_hash", target)
+
+        assert entry.status == "completed"
+        assert entry.sha256 == hashlib.sha256(data).hexdigest()
+        assert mdp.lookup_digest(str(state_dir), str(target)) == entry.sha256
+
+    def test_segmented_and_resumed_downloads_hash_whole_file(self, tmp_model_dir):
+        data = os.urandom(8 * 1024 * 1024)
+        origin = _FakeOrigin(data, etag='"abc"', fail_at=1024 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+
+        with patch.object(mdp, "SEGMENTED_MIN_SIZE", 1024):
+            assert _run_download(origin, "dl_hash1", target).status == "error"
+            entry = _run_download(origin, "dl_hash2", target)
+
+        assert entry.status == "completed"
+        assert entry.sha256 == hashlib.sha256(data).hexdigest()
+
+    def test_mismatch_fails_and_deletes_data(self, tmp_model_dir, state_dir):
+        target = tmp_model_dir / "model.safetensors"
+
+        entry = _run_download(_FakeOrigin(b"tampered"), "dl_bad", target, expected_sha256="0" * 64)
+
+        assert entry.status == "error"
+        assert "sha256 mismatch" in entry.error
+        assert not target.exists()
+        assert not (tmp_model_dir / "model.safetensors.part").exists()
+        assert mdp.load_journal(str(state_dir / "journal"), str(target)) is None
+
+    def test_matching_recorded_digest_skips_without_rehashing(self, tmp_model_dir):
+        data = b"model weights"
+        target = tmp_model_dir / "model.safetensors"
+        _run_download(_FakeOrigin(data), "dl_first", target)
+
+        with patch.object(mdp, "file_sha256") as file_sha256:
+            entry = _run_download(
+                _FakeOrigin(data),
+                "dl_again",
+                target,
+                expected_sha256=hashlib.sha256(data).hexdigest(),
+            )
+
+        assert entry.status == "skipped"
+        file_sha256.assert_not_called()
+
+    def test_same_size_with_wrong_digest_is_downloaded_again(self, tmp_model_dir):
+        target = tmp_model_dir / "model.safetensors"
+        target.write_bytes(b"old weights")
+        data = b"new weights"
+
+        entry = _run_download(
+            _FakeOrigin(data), "dl_new", target, expected_sha256=hashlib.sha256(data).hexdigest()
+        )
+
+        assert entry.status == "completed"
+        assert entry.path != str(target)
+        assert target.read_bytes() == b"old weights"
+
+    def test_changed_file_invalidates_recorded_digest(self, tmp_model_dir, state_dir):
+        target = tmp_model_dir / "model.safetensors"
+        _run_download(_FakeOrigin(b"abc"), "dl_small", target)
+
+        target.write_bytes(b"abcd")
+
+        assert mdp.lookup_digest(str(state_dir), str(target)) is None
+
+
+# ---------------------------------------------------------------------------
+# Tests: download scheduler
+# ---------------------------------------------------------------------------
+
+
+async def _settle() -> None:
+    """Let scheduled tasks run until they block."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestDownloadScheduler:
+    def _scenario(self, max_active: int, default_host_limit: int, jobs: list[tuple[str, str, int]]):
+        """Submit blocking *jobs* (key, url, priority); return helpers to drive them."""
+        loop = asyncio.get_running_loop()
+        gates = {key: asyncio.Event() for key, _, _ in jobs}
+        started: list[str] = []
+
+        def make_job(key: str):
+            async def run() -> None:
+                started.append(key)
+                await gates[key].wait()
+
+            return run
+
+        scheduler = mdp.DownloadScheduler(
+            max_active=max_active,
+            host_limits={},
+            default_host_limit=default_host_limit,
+            spawn=loop.create_task,
+        )
+        for key, url, priority in jobs:
+            scheduler.submit(key, url, priority, make_job(key))
+        return scheduler, gates, started
+
+    def test_global_cap_queues_excess_downloads(self):
+        async def scenario():
+            scheduler, gates, started = self._scenario(
+                2,
+                5,
+                [(key, f"https://{key}.example/m", mdp.PRIORITY_NORMAL) for key in "abc"],
+            )
+            await _settle()
+            assert started == ["a", "b"]
+            assert scheduler.positions() == {"c": 1}
+
+            gates["a"].set()
+            await _settle()
+            assert started == ["a", "b", "c"]
+            assert scheduler.active_count == 2
+
+        asyncio.run(scenario())
+
+    def test_high_priority_skips_ahead(self):
+        async def scenario():
+            scheduler, gates, started = self._scenario(
+                1,
+                5,
+                [
+                    ("ckpt1", "https://a.example/1", mdp.PRIORITY_NORMAL),
+                    ("ckpt2", "https://a.example/2", mdp.PRIORITY_NORMAL),
+                    ("vae", "https://a.example/3", mdp.PRIORITY_HIGH),
+                ],
+            )
+            await _settle()
+            assert scheduler.positions() == {"vae": 1, "ckpt2": 2}
+
+            gates["ckpt1"].set()
+            await _settle()
+            assert started == ["ckpt1", "vae"]
+
+        asyncio.run(scenario())
+
+    def test_host_cap_does_not_block_other_hosts(self):
+        async def scenario():
+            scheduler, _, started = self._scenario(
+                3,
+                1,
+                [
+                    ("a", "https://one.example/a", mdp.PRIORITY_NORMAL),
+                    ("b", "https://one.example/b", mdp.PRIORITY_NORMAL),
+                    ("c", "https://two.example/c", mdp.PRIORITY_NORMAL),
+                ],
+            )
+            await _settle()
+            assert started == ["a", "c"]
+            assert scheduler.positions() == {"b": 1}
+
+        asyncio.run(scenario())
+
+    def test_host_key_groups_subdomains(self):
+        scheduler = mdp.DownloadScheduler(
+            max_active=1,
+            host_limits={"huggingface.co": 3},
+            default_host_limit=1,
+            spawn=MagicMock(),
+        )
+        assert scheduler.host_key("https://cdn-lfs.huggingface.co/x") == "huggingface.co"
+        assert scheduler.host_limit("huggingface.co") == 3
+        assert scheduler.host_key("https://civitai.com/x") == "civitai.com"
+        assert scheduler.host_limit("civitai.com") == 1
+
+    def test_parse_host_limits(self):
+        limits = mdp.parse_host_limits("HuggingFace.co=4, civitai.com=1,bad=x,,noequals")
+        assert limits == {"huggingface.co": 4, "civitai.com": 1}
+
+
+class TestDownloadModelQueueing:
+    def _request(self, **data: Any) -> MagicMock:
+        request = MagicMock()
+        request.headers = {"Content-Type": "application/json"}
+        request.json = AsyncMock(
+            return_value={"url": "https://example.com/m.st", "filename": "m.st", **data}
+        )
+        return request
+
+    def _post(self, tmp_model_dir, **data: Any) -> dict[str, Any]:
+        with (
+            patch.object(_folder_paths_mock, "get_folder_paths", return_value=[str(tmp_model_dir)]),
+            patch.object(
+                _prompt_server_instance.loop,
+                "create_task",
+                MagicMock(side_effect=lambda coroutine: coroutine.close()),
+            ),
+        ):
+            response = asyncio.run(mdp.download_model(self._request(**data)))
+        return json.loads(response.body)  # type: ignore[arg-type]
+
+    def test_rejects_malformed_sha256(self, tmp_model_dir):
+        body = self._post(tmp_model_dir, folder="checkpoints", sha256="not-a-digest")
+        assert body == {"success": False, "error": "Invalid sha256"}
+
+    def test_small_model_folders_get_high_priority(self, tmp_model_dir):
+        body = self._post(tmp_model_dir, folder="loras")
+        assert body["priority"] == "high"
+        body = self._post(tmp_model_dir, folder="checkpoints")
+        assert body["priority"] == "normal"
+
+    def test_explicit_priority_overrides_default(self, tmp_model_dir):
+        body = self._post(tmp_model_dir, folder="loras", priority="low")
+        assert body["priority"] == "low"
+
+    def test_rejects_unknown_priority(self, tmp_model_dir):
+        body = self._post(tmp_model_dir, folder="loras", priority="urgent")
+        assert body["success"] is False
+        assert "Invalid priority" in body["error"]
+
+    def test_reports_queue_position_when_at_capacity(self, tmp_model_dir):
+        for index in range(mdp._scheduler.max_active):
+            body = self._post(
+                tmp_model_dir,
+                url=f"https://host{index}.example/m.st",
+                folder="checkpoints",
+                filename=f"m{index}.st",
+            )
+            assert body["queue_position"] == 0
+
+        body = self._post(tmp_model_dir, folder="checkpoints", filename="late.st")
+
+        assert body["status"] == "queued"
+        assert body["queue_position"] == 1
+        assert mdp.active_downloads[body["download_id"]].queue_position == 1
+
+    def test_subscribed_tab_gets_its_download_queued_event(self, tmp_model_dir):
+        for index in range(mdp._scheduler.max_active):
+            self._post(
+                tmp_model_dir,
+                url=f"https://host{index}.example/m.st",
+                folder="checkpoints",
+                filename=f"m{index}.st",
+            )
+        mdp._broadcaster.subscribe("tab1", [])
+        _prompt_server_instance.send_sync.reset_mock()
+
+        with patch.object(_prompt_server_instance, "sockets", ["tab1"], create=True):
+            body = self._post(
+                tmp_model_dir, folder="checkpoints", filename="late.st", client_id="tab1"
+            )
+
+        assert body["status"] == "queued"
+        sent = [
+            (call.args[1]["download_id"], call.args[1]["status"], call.args[2])
+            for call in _prompt_server_instance.send_sync.call_args_list
+            if call.args[0] == "model_download_progress"
+        ]
+        assert sent == [(body["download_id"], "queued", "tab1")]
+
+    def test_repeat_request_attaches_to_running_download(self, tmp_model_dir):
+        first = self._post(tmp_model_dir, folder="checkpoints")
+        second = self._post(tmp_model_dir, folder="checkpoints", sha256="AB" * 32)
+
+        assert second["success"] is True
+        assert second["attached"] is True
+        assert second["download_id"] == first["download_id"]
+        assert list(mdp.active_downloads) == [first["download_id"]]
+        assert mdp._scheduler.active_count == 1
+        # The running download adopts the digest to verify against
+        assert mdp.active_downloads[first["download_id"]].expected_sha256 == "ab" * 32
+
+    def test_refuses_same_file_from_another_url(self, tmp_model_dir):
+        self._post(tmp_model_dir, folder="checkpoints")
+        body = self._post(tmp_model_dir, folder="checkpoints", url="https://mirror.example/m.st")
+
+        assert body["success"] is False
+        assert "another URL" in body["error"]
+        assert len(mdp.active_downloads) == 1
+
+    def test_download_ids_do_not_collide(self, tmp_model_dir):
+        with patch.object(mdp.time, "time", return_value=1_700_000_000.0):
+            first = self._post(tmp_model_dir, folder="checkpoints")
+            _advance(mdp.active_downloads[first["download_id"]], "completed")
+            second = self._post(tmp_model_dir, folder="checkpoints")
+
+        assert second.get("attached") is None
+        assert second["download_id"] != first["download_id"]
+        assert len(mdp.active_downloads) == 2
+
 
 # ---------------------------------------------------------------------------
 # Tests: send_download_update
@@ -511,16 +1795,9 @@ class TestDownloadFile:
 
 class TestSendDownloadUpdate:
     def test_sends_skipped_status(self):
-        mdp.active_downloads["dl_ws"] = {
-            "status": "skipped",
-            "filename": "model.st",
-            "percent": 100,
-            "downloaded": 5000,
-            "total_size": 5000,
-            "speed": 0,
-            "eta": 0,
-            "error": None,
-        }
+        _entry(
+            "dl_ws", "skipped", filename="model.st", percent=100, downloaded=5000, total_size=5000
+        )
 
         asyncio.run(mdp.send_download_update("dl_ws"))
 
@@ -534,6 +1811,615 @@ class TestSendDownloadUpdate:
         asyncio.run(mdp.send_download_update("nonexistent"))
 
 
+class TestProgressBroadcaster:
+    def _broadcaster(self, clients=()):
+        sent: list[tuple[str, Any, str | None]] = []
+        downloads: dict[str, dict[str, Any]] = {}
+        broadcaster = mdp.ProgressBroadcaster(
+            lambda event, data, sid: sent.append((event, data, sid)),
+            lambda: list(clients),
+            downloads.get,
+            interval=0.01,
+        )
+        return broadcaster, downloads, sent
+
+    @staticmethod
+    def _update(broadcaster, downloads, download_id: str, status: str, percent: int = 0):
+        downloads[download_id] = {"download_id": download_id, "status": status, "percent": percent}
+        broadcaster.publish(download_id, status)
+
+    def test_batches_progress_of_changed_downloads_per_tick(self):
+        broadcaster, downloads, sent = self._broadcaster()
+
+        async def scenario():
+            for download_id in ("a", "b", "c"):
+                self._update(broadcaster, downloads, download_id, "downloading")
+            for percent in (10, 20, 30):
+                self._update(broadcaster, downloads, "a", "downloading", percent)
+            self._update(broadcaster, downloads, "b", "downloading", 5)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+
+        assert [event for event, _, _ in sent] == ["model_download_progress"] * 3 + [
+            "model_download_progress_batch"
+        ]
+        _, batch, sid = sent[-1]
+        assert sid is None
+        assert batch == {
+            "downloads": [
+                {"download_id": "a", "status": "downloading", "percent": 30},
+                {"download_id": "b", "status": "downloading", "percent": 5},
+            ]
+        }
+
+    def test_status_change_is_sent_immediately(self):
+        broadcaster, downloads, sent = self._broadcaster()
+
+        async def scenario():
+            self._update(broadcaster, downloads, "a", "downloading")
+            self._update(broadcaster, downloads, "a", "downloading", 50)
+            self._update(broadcaster, downloads, "a", "completed", 100)
+            assert sent[-1] == (
+                "model_download_progress",
+                {"download_id": "a", "status": "completed", "percent": 100},
+                None,
+            )
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+
+        # The pending progress was superseded by the completion event
+        assert len(sent) == 2
+
+    def test_subscribed_clients_only_get_their_downloads(self):
+        broadcaster, downloads, sent = self._broadcaster(clients=["tab1", "tab2", "tab3"])
+        broadcaster.subscribe("tab1", ["a"])
+        broadcaster.subscribe("tab2", [])
+
+        async def scenario():
+            self._update(broadcaster, downloads, "a", "downloading")
+            self._update(broadcaster, downloads, "b", "downloading")
+            sent.clear()
+            self._update(broadcaster, downloads, "a", "downloading", 10)
+            self._update(broadcaster, downloads, "b", "downloading", 20)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+
+        received = {sid: [d["download_id"] for d in data["downloads"]] for _, data, sid in sent}
+        assert received == {"tab1": ["a"], "tab3": ["a", "b"]}
+
+    def test_watch_adds_new_download_to_subscription(self):
+        broadcaster, downloads, sent = self._broadcaster(clients=["tab1", "tab2"])
+        broadcaster.subscribe("tab1", [])
+        broadcaster.subscribe("tab2", [])
+        broadcaster.watch("tab1", "a")
+
+        async def scenario():
+            self._update(broadcaster, downloads, "a", "queued")
+
+        asyncio.run(scenario())
+
+        assert [sid for _, _, sid in sent] == ["tab1"]
+
+    def test_disconnected_subscribers_are_forgotten(self):
+        clients = ["tab1", "tab2"]
+        broadcaster, downloads, sent = self._broadcaster(clients=clients)
+        broadcaster.subscribe("tab1", ["a"])
+
+        async def scenario():
+            self._update(broadcaster, downloads, "a", "queued")
+            clients.remove("tab1")
+            self._update(broadcaster, downloads, "a", "downloading")
+
+        asyncio.run(scenario())
+
+        # Once every subscriber has left, events are broadcast again
+        assert [sid for _, _, sid in sent] == ["tab1", "tab2", None]
+
+    def test_subscribe_endpoint(self):
+        def post(body: Any) -> dict[str, Any]:
+            request = MagicMock()
+            request.json = AsyncMock(return_value=body)
+            return json.loads(asyncio.run(mdp.subscribe_progress(request)).body)  # type: ignore[arg-type]
+
+        assert post({"client_id": "tab1", "download_ids": ["a"]})["success"] is True
+        assert mdp._broadcaster._subscriptions == {"tab1": {"a"}}
+        assert post({"client_id": "tab1", "download_ids": None})["success"] is True
+        assert mdp._broadcaster._subscriptions == {}
+        assert post({"download_ids": []})["success"] is False
+        assert post({"client_id": "tab1", "download_ids": "a"})["success"] is False
+
+
+# ---------------------------------------------------------------------------
+# Tests: list_downloads
+# ---------------------------------------------------------------------------
+
+
+class TestChangeTracker:
+    def test_reports_changes_and_removals_after_version(self):
+        tracker = mdp.ChangeTracker()
+        tracker.touch("a")
+        tracker.touch("b")
+        since = tracker.version
+        tracker.touch("c")
+        tracker.touch("a")
+        tracker.remove("b")
+
+        assert tracker.changes_since(since) == (["c", "a"], ["b"])
+        assert tracker.changes_since(tracker.version) == ([], [])
+
+    def test_unknown_versions_need_full_listing(self):
+        tracker = mdp.ChangeTracker(max_tombstones=2)
+        start = tracker.version
+        for key in "abc":
+            tracker.touch(key)
+            tracker.remove(key)
+
+        # The removal of "a" was forgotten, so a client at *start* missed it
+        assert tracker.changes_since(start) is None
+        assert tracker.changes_since(tracker.version + 1) is None
+        assert tracker.changes_since(tracker.version - 2) == ([], ["c"])
+
+
+class TestListDownloads:
+    @staticmethod
+    def _get(query: dict[str, str] | None = None, headers: dict[str, str] | None = None):
+        request = MagicMock()
+        request.query = query or {}
+        request.headers = headers or {}
+        return asyncio.run(mdp.list_downloads(request))
+
+    @staticmethod
+    def _add(download_id: str, status: str = "downloading") -> None:
+        _entry(download_id, status)
+        mdp._changes.touch(download_id)
+
+    def test_delta_since_version(self):
+        self._add("a")
+        self._add("b")
+        first = json.loads(self._get().body)
+        assert first["full"] is True
+        assert set(first["downloads"]) == {"a", "b"}
+
+        self._add("c")
+        mdp._forget_download("a")
+        delta = json.loads(self._get({"since": str(first["version"])}).body)
+
+        assert delta["full"] is False
+        assert list(delta["downloads"]) == ["c"]
+        assert delta["removed"] == ["a"]
+        assert delta["version"] > first["version"]
+
+    def test_not_modified_for_current_etag(self):
+        self._add("a")
+        etag = self._get().headers["ETag"]
+
+        assert self._get(headers={"If-None-Match": etag}).status == HTTPStatus.NOT_MODIFIED
+        self._add("b")
+        assert self._get(headers={"If-None-Match": etag}).status == HTTPStatus.OK
+
+    def test_attached_digest_changes_the_listing(self):
+        self._add("a", "queued")
+        etag = self._get().headers["ETag"]
+
+        mdp._attach_to_download(mdp.active_downloads["a"], "https://example.com/m", "AB" * 32)
+
+        response = self._get(headers={"If-None-Match": etag})
+        assert response.status == HTTPStatus.OK
+        assert json.loads(response.body)["downloads"]["a"]["expected_sha256"] == "ab" * 32
+
+    def test_finished_backoff_changes_the_listing(self, monkeypatch):
+        monkeypatch.setattr(mdp, "_retry_policy", mdp.RetryPolicy(3, 0.2, 0.2))
+        self._add("a", "queued")
+
+        async def scenario():
+            request = MagicMock()
+            request.query = {}
+            request.headers = {}
+            backoff = asyncio.create_task(
+                mdp._retry_or_raise("a", "https://example.com/m", ConnectionResetError(), 1)
+            )
+            await asyncio.sleep(0.01)
+            waiting = await mdp.list_downloads(request)
+            await backoff
+            request.headers = {"If-None-Match": waiting.headers["ETag"]}
+            return waiting, await mdp.list_downloads(request)
+
+        waiting, retrying = asyncio.run(scenario())
+
+        assert json.loads(waiting.body)["downloads"]["a"]["retry_reason"] == "connection"
+        assert retrying.status == HTTPStatus.OK
+        assert "retry_reason" not in json.loads(retrying.body)["downloads"]["a"]
+
+    def test_encodes_each_version_once(self):
+        self._add("a")
+        with patch.object(mdp.json, "dumps", wraps=json.dumps) as dumps:
+            bodies = {self._get().body for _ in range(3)}
+        assert len(bodies) == 1
+        dumps.assert_called_once()
+
+    def test_long_poll_returns_on_change(self):
+        self._add("a")
+        version = mdp._changes.version
+
+        async def scenario():
+            request = MagicMock()
+            request.query = {"since": str(version), "wait": "5"}
+            request.headers = {}
+            poll = asyncio.create_task(mdp.list_downloads(request))
+            await asyncio.sleep(0.01)
+            assert not poll.done()
+            self._add("b")
+            return await asyncio.wait_for(poll, 1)
+
+        response = asyncio.run(scenario())
+        assert list(json.loads(response.body)["downloads"]) == ["b"]
+
+    def test_long_poll_times_out_unchanged(self, monkeypatch):
+        monkeypatch.setattr(mdp, "MAX_POLL_WAIT", 0.01)
+        self._add("a")
+        version = mdp._changes.version
+
+        delta = json.loads(self._get({"since": str(version), "wait": "5"}).body)
+        assert delta["downloads"] == {}
+        assert delta["version"] == version
+
+
+# ---------------------------------------------------------------------------
+# Tests: retention and history
+# ---------------------------------------------------------------------------
+
+
+class TestRetentionQueue:
+    def test_evicts_in_order_with_one_timer(self):
+        evicted: list[str] = []
+
+        async def scenario():
+            queue = mdp.RetentionQueue(0.05, evicted.append)
+            loop = asyncio.get_running_loop()
+
+            def timers() -> int:
+                return sum(call.args[1] == queue._sweep for call in call_at.call_args_list)
+
+            with patch.object(loop, "call_at", wraps=loop.call_at) as call_at:
+                for n in range(100):
+                    queue.add(f"early{n}")
+                assert timers() == 1
+                await asyncio.sleep(0.03)
+                queue.add("late")
+                await asyncio.sleep(0.04)
+                assert evicted == [f"early{n}" for n in range(100)]
+                assert len(queue) == 1
+                await asyncio.sleep(0.05)
+                return timers()
+
+        assert asyncio.run(scenario()) == 2
+        assert evicted[-1] == "late"
+
+    def test_failed_download_is_forgotten_and_recorded(self, monkeypatch, state_dir):
+        monkeypatch.setattr(mdp, "_retention", mdp.RetentionQueue(0.01, mdp._forget_download))
+        _entry("dl_fail", url="https://example.com/m?token=secret")
+
+        async def scenario():
+            await mdp._fail_download("dl_fail", "boom")
+            assert "dl_fail" in mdp.active_downloads
+            await mdp._history_writer
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+
+        assert "dl_fail" not in mdp.active_downloads
+        [row] = mdp.list_history(str(state_dir), limit=10)
+        assert row["status"] == "error"
+        assert row["error"] == "boom"
+        assert "secret" not in row["url"]
+        assert row["throughput"] is None
+
+
+def _history_rows(count: int, status: str = "completed") -> list[dict[str, Any]]:
+    return [{"download_id": f"dl{n}", "status": status, "downloaded": n} for n in range(count)]
+
+
+class TestDownloadHistory:
+    @staticmethod
+    def _get(query: dict[str, str]) -> dict[str, Any]:
+        request = MagicMock()
+        request.query = query
+        return json.loads(asyncio.run(mdp.get_download_history(request)).body)
+
+    def test_lists_newest_first_by_status(self, state_dir):
+        mdp.record_history(str(state_dir), _history_rows(3))
+        mdp.record_history(str(state_dir), _history_rows(1, "error"))
+
+        rows = mdp.list_history(str(state_dir), limit=10)
+        assert [row["status"] for row in rows] == ["error", "completed", "completed", "completed"]
+        completed = mdp.list_history(str(state_dir), limit=10, status="completed")
+        assert [row["download_id"] for row in completed] == ["dl2", "dl1", "dl0"]
+
+    def test_keeps_newest_entries(self, state_dir, monkeypatch):
+        monkeypatch.setattr(sys.modules["model_downloader_history"], "MAX_HISTORY_ENTRIES", 3)
+        mdp.record_history(str(state_dir), _history_rows(5))
+
+        rows = mdp.list_history(str(state_dir), limit=10)
+        assert [row["download_id"] for row in rows] == ["dl4", "dl3", "dl2"]
+
+    def test_endpoint_pages_with_before(self, state_dir):
+        assert self._get({}) == {"success": True, "downloads": [], "next": None}
+        mdp.record_history(str(state_dir), _history_rows(5))
+
+        first = self._get({"limit": "3"})
+        assert [row["download_id"] for row in first["downloads"]] == ["dl4", "dl3", "dl2"]
+        second = self._get({"limit": "3", "before": str(first["next"])})
+        assert [row["download_id"] for row in second["downloads"]] == ["dl1", "dl0"]
+        assert second["next"] is None
+
+    @pytest.mark.parametrize(
+        "query", [{"limit": "0"}, {"limit": "x"}, {"limit": "501"}, {"status": "queued"}]
+    )
+    def test_endpoint_rejects_bad_query(self, query):
+        assert self._get(query)["success"] is False
+
+    def test_row_has_duration_and_throughput(self):
+        download = _entry("dl_done", "completed", downloaded=4000, url="https://example.com/m")
+        download.start_time, download.end_time = 100.0, 102.0
+
+        row = mdp._history_row(download)
+        assert row["duration"] == 2.0
+        assert row["throughput"] == 2000
+
+
+# ---------------------------------------------------------------------------
+# Tests: metrics
+# ---------------------------------------------------------------------------
+
+
+class TestMetrics:
+    def test_renders_prometheus_text_format(self):
+        registry = mdp.Registry()
+        counter = registry.counter("dl_bytes_total", "Bytes.", ("host",))
+        histogram = registry.histogram("dl_seconds", "Latency.", buckets=(0.1, 1.0))
+        registry.gauge("dl_active", "Active.", lambda: 2)
+
+        counter.inc(5, host="a.example")
+        counter.inc(3, host='b"x')
+        histogram.observe(0.1)
+        histogram.observe(0.5)
+        histogram.observe(7.25)
+
+        assert registry.render() == (
+            "# HELP dl_bytes_total Bytes.\n"
+            "# TYPE dl_bytes_total counter\n"
+            'dl_bytes_total{host="a.example"} 5\n'
+            'dl_bytes_total{host="b\\"x"} 3\n'
+            "# HELP dl_seconds Latency.\n"
+            "# TYPE dl_seconds histogram\n"
+            'dl_seconds_bucket{le="0.1"} 1\n'
+            'dl_seconds_bucket{le="1"} 2\n'
+            'dl_seconds_bucket{le="+Inf"} 3\n'
+            "dl_seconds_sum 7.85\n"
+            "dl_seconds_count 3\n"
+            "# HELP dl_active Active.\n"
+            "# TYPE dl_active gauge\n"
+            "dl_active 2\n"
+        )
+
+    def test_rejects_wrong_labels(self):
+        counter = mdp.Registry().counter("c_total", "C.", ("host",))
+        with pytest.raises(ValueError, match="takes labels"):
+            counter.inc(result="error")
+
+    def test_download_updates_metrics(self, tmp_model_dir):
+        data = os.urandom(256 * 1024)
+        host = "example.com"
+        downloaded = mdp._bytes_downloaded.value(host=host)
+        completed = mdp._download_results.value(result="completed")
+        first_bytes = mdp._time_to_first_byte.count(host=host)
+        heads = mdp._head_latency.count(host=host)
+        writes = mdp._write_latency.count()
+
+        _run_download(_FakeOrigin(data), "dl_metrics", tmp_model_dir / "m.safetensors")
+
+        assert mdp._bytes_downloaded.value(host=host) - downloaded == len(data)
+        assert mdp._download_results.value(result="completed") - completed == 1
+        assert mdp._time_to_first_byte.count(host=host) - first_bytes == 1
+        assert mdp._head_latency.count(host=host) - heads == 0
+        assert mdp._write_latency.count() > writes
+
+        response = asyncio.run(mdp.get_metrics(MagicMock()))
+        text = response.body.decode()
+        assert "# TYPE model_downloader_downloaded_bytes_total counter" in text
+        assert "model_downloader_active_downloads 0" in text
+
+
+# ---------------------------------------------------------------------------
+# Tests: event-loop monitor
+# ---------------------------------------------------------------------------
+
+
+def _block_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+async def _monitor_around(monitor, blocker) -> None:
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.15)
+    blocker()
+    await asyncio.sleep(0.15)
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+class TestLoopMonitor:
+    def test_credits_stall_to_monitored_function(self):
+        stalls = []
+        monitor = mdp.LoopMonitor(
+            (os.path.dirname(__file__),), interval=0.02, threshold=0.1, on_stall=stalls.append
+        )
+
+        asyncio.run(_monitor_around(monitor, lambda: _block_loop(0.4)))
+
+        assert [stall.location for stall in stalls] == ["test_model_downloader._block_loop"]
+        assert stalls[0].duration >= 0.35
+        snapshot = monitor.snapshot()
+        assert snapshot["running"] is False
+        assert snapshot["stalls"]["count"] == 1
+        assert snapshot["stalls"]["locations"][0]["location"] == "test_model_downloader._block_loop"
+        assert snapshot["lag"]["max"] >= 0.35
+
+    def test_stall_outside_roots_is_other(self, tmp_path):
+        monitor = mdp.LoopMonitor((str(tmp_path),), interval=0.02, threshold=0.1)
+
+        asyncio.run(_monitor_around(monitor, lambda: _block_loop(0.3)))
+
+        (stall,) = monitor.snapshot()["stalls"]["recent"]
+        assert stall["location"] == "other"
+        assert "_block_loop" in stall["frame"]
+
+    def test_summary_logs_worst_locations(self, caplog):
+        monitor = mdp.LoopMonitor((), threshold=0.1)
+        monitor.record(0.05)
+        monitor.log_summary(60)
+        assert not caplog.records
+
+        monitor.record(0.2)
+        monitor.record(0.3)
+        with caplog.at_level(logging.WARNING, logger="model_downloader"):
+            monitor.log_summary(60)
+        assert "stalled 2 times (0.50s) in the last 60s: other 2x 0.50s" in caplog.text
+        assert monitor.snapshot()["lag"]["samples"] == 3
+
+    def test_endpoint_reports_snapshot(self):
+        mdp._loop_monitor.record(0.0)
+        response = asyncio.run(mdp.get_loop_lag(MagicMock()))
+        data = json.loads(response.body)  # type: ignore[arg-type]
+        assert data["success"] is True
+        assert data["threshold"] == mdp.LOOP_STALL_THRESHOLD
+        assert {"p50", "p99", "max"} <= data["lag"].keys()
+
+
+# ---------------------------------------------------------------------------
+# Tests: bandwidth limits
+# ---------------------------------------------------------------------------
+
+
+class TestBandwidthLimiter:
+    @pytest.fixture
+    def no_burst(self, monkeypatch):
+        monkeypatch.setattr(sys.modules["model_downloader_ratelimit"], "BURST_SECONDS", 0)
+
+    def test_parses_rates(self):
+        assert mdp.parse_rate("20M") == 20 * 1024 * 1024
+        assert mdp.parse_rate("500kb/s") == 500 * 1024
+        assert mdp.parse_rate(1000) == 1000
+        assert mdp.parse_rate(0) is None
+        assert mdp.parse_rate(None) is None
+        for invalid in ("fast", "-1", True):
+            with pytest.raises(ValueError, match="Invalid rate"):
+                mdp.parse_rate(invalid)
+        assert mdp.parse_host_rates("HuggingFace.co=10M, bad=x,civitai.com=0") == {
+            "huggingface.co": 10 * 1024 * 1024
+        }
+
+    def test_bucket_paces_into_debt(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(
+            sys.modules["model_downloader_ratelimit"],
+            "time",
+            types.SimpleNamespace(monotonic=lambda: now[0]),
+        )
+        bucket = sys.modules["model_downloader_ratelimit"].TokenBucket(1000)  # 250 bytes of burst
+
+        assert bucket.reserve(250) == 0
+        assert bucket.reserve(500) == pytest.approx(0.5)
+        now[0] += 0.5
+        assert bucket.reserve(100) == pytest.approx(0.1)
+        now[0] += 10
+        # Idle time only refills up to the burst size
+        assert bucket.reserve(300) == pytest.approx(0.05)
+
+    @pytest.mark.usefixtures("no_burst")
+    def test_per_download_cap(self):
+        limiter = mdp.BandwidthLimiter(download_rate=400 * 1024)
+
+        async def scenario():
+            started = asyncio.get_running_loop().time()
+            for _ in range(5):
+                await limiter.throttle("a", "example.com", 8 * 1024)
+            await limiter.throttle("b", "example.com", 8 * 1024)
+            return asyncio.get_running_loop().time() - started
+
+        # 40 KiB at 400 KiB/s for "a"; "b" has a bucket of its own
+        assert 0.09 <= asyncio.run(scenario()) < 0.2
+
+    @pytest.mark.usefixtures("no_burst")
+    def test_global_cap_is_shared_per_download_not_per_connection(self):
+        limiter = mdp.BandwidthLimiter(global_rate=4 * 1024 * 1024)
+        granted = {"segmented": 0, "single": 0}
+
+        async def connection(download_id: str, chunks: int) -> None:
+            for _ in range(chunks):
+                await limiter.throttle(download_id, "example.com", 16 * 1024)
+                granted[download_id] += 1
+
+        async def scenario():
+            segments = [asyncio.create_task(connection("segmented", 100)) for _ in range(4)]
+            await connection("single", 16)
+            seen = dict(granted)
+            for task in segments:
+                task.cancel()
+            await asyncio.gather(*segments, return_exceptions=True)
+            return seen
+
+        seen = asyncio.run(scenario())
+        assert 14 <= seen["segmented"] <= 18
+
+    def test_limits_change_at_runtime(self):
+        _entry("dl_bw")
+
+        def post(body: Any) -> dict[str, Any]:
+            request = MagicMock()
+            request.json = AsyncMock(return_value=body)
+            return json.loads(asyncio.run(mdp.set_bandwidth_limits(request)).body)  # type: ignore[arg-type]
+
+        result = post(
+            {
+                "global": "50M",
+                "hosts": {"HuggingFace.co": 10485760},
+                "downloads": {"dl_bw": "1M"},
+            }
+        )
+        assert result["success"] is True
+        assert result["limits"] == {
+            "global": 50 * 1024 * 1024,
+            "per_download": None,
+            "hosts": {"huggingface.co": 10 * 1024 * 1024},
+            "downloads": {"dl_bw": 1024 * 1024},
+        }
+
+        # An invalid request changes nothing
+        assert post({"global": None, "downloads": {"missing": "1M"}})["success"] is False
+        assert post({"per_download": "fast"})["success"] is False
+        assert mdp._limiter.limits() == result["limits"]
+
+        assert post({"global": None, "hosts": {"huggingface.co": 0}})["success"] is True
+        limits = mdp._limiter.limits()
+        assert limits["global"] is None
+        assert limits["hosts"] == {}
+
+    def test_download_reads_pass_through_limiter(self, tmp_model_dir):
+        data = os.urandom(256 * 1024)
+        with patch.object(mdp._limiter, "throttle", new_callable=AsyncMock) as throttle:
+            _run_download(_FakeOrigin(data), "dl_throttled", tmp_model_dir / "m.safetensors")
+
+        assert sum(call.args[2] for call in throttle.await_args_list) == len(data)
+        assert {call.args[:2] for call in throttle.await_args_list} == {
+            ("dl_throttled", "example.com")
+        }
+
+
 # ---------------------------------------------------------------------------
 # Tests: list_folders
 # ---------------------------------------------------------------------------
@@ -551,3 +2437,668 @@ class TestListFolders:
         data = json.loads(response.body)  # type: ignore[arg-type]
         assert data["success"] is True
         assert data["folders"] == ["checkpoints", "latent_upscale_models", "loras"]
+
+
+# ---------------------------------------------------------------------------
+# Tests: filename index / resolve_folder
+# ---------------------------------------------------------------------------
+
+
+def _age(*paths) -> None:
+    """Backdate mtimes so directories are not re-listed as recently modified."""
+    for path in paths:
+        os.utime(path, (1_000_000_000, 1_000_000_000))
+
+
+class TestFilenameIndex:
+    @pytest.fixture
+    def roots(self, tmp_path):
+        loras = tmp_path / "loras"
+        (loras / "sdxl").mkdir(parents=True)
+        (loras / "sdxl" / "detail.safetensors").write_bytes(b"x")
+        checkpoints = tmp_path / "checkpoints"
+        checkpoints.mkdir()
+        (checkpoints / "model.safetensors").write_bytes(b"x")
+        (checkpoints / "detail.safetensors").write_bytes(b"x")
+        extra = tmp_path / "extra_checkpoints"
+        extra.mkdir()
+        (extra / "model.safetensors").write_bytes(b"x")
+        _age(loras, loras / "sdxl", checkpoints, extra)
+        return [
+            ("loras", [str(loras)]),
+            ("checkpoints", [str(checkpoints), str(extra)]),
+        ]
+
+    def test_lookup_finds_first_folder_in_order(self, roots):
+        index = mdp.FilenameIndex(lambda: roots)
+        index.refresh()
+
+        assert index.ready
+        assert index.lookup("model.safetensors") == "checkpoints"
+        assert index.lookup("sdxl/detail.safetensors") == "loras"
+        assert index.lookup("detail.safetensors") == "checkpoints"
+        assert index.lookup("missing.safetensors") is None
+
+    def test_refresh_relists_only_changed_directories(self, roots):
+        index = mdp.FilenameIndex(lambda: roots)
+        assert index.refresh() == 4
+        assert index.refresh() == 0
+
+        loras = roots[0][1][0]
+        os.remove(os.path.join(loras, "sdxl", "detail.safetensors"))
+        os.utime(os.path.join(loras, "sdxl"), (1_000_000_100, 1_000_000_100))
+
+        assert index.refresh() == 1
+        assert index.lookup("sdxl/detail.safetensors") is None
+
+    def test_recently_modified_directory_is_listed_again(self, roots):
+        index = mdp.FilenameIndex(lambda: roots)
+        index.refresh()
+        checkpoints = roots[1][1][0]
+        os.utime(checkpoints)
+
+        assert index.refresh() == 1
+        assert index.refresh() == 1
+
+    def test_added_download_is_found_before_next_refresh(self, roots):
+        index = mdp.FilenameIndex(lambda: roots)
+        index.refresh()
+        target = os.path.join(roots[1][1][1], "new.safetensors")
+        with open(target, "wb"):
+            pass
+
+        index.add(target)
+
+        assert index.lookup("new.safetensors") == "checkpoints"
+
+    def test_rejects_paths_outside_folders(self, roots):
+        index = mdp.FilenameIndex(lambda: roots)
+        index.refresh()
+
+        assert index.lookup("../checkpoints/model.safetensors") is None
+        assert index.lookup("/etc/passwd") is None
+
+    def test_resolve_folder_uses_index_without_disk_access(self, roots, monkeypatch):
+        index = mdp.FilenameIndex(lambda: roots)
+        index.refresh()
+        monkeypatch.setattr(mdp, "_filename_index", index)
+        request = MagicMock()
+        request.match_info = {"filename": "sdxl/detail.safetensors"}
+
+        with patch.object(mdp.os.path, "isfile", side_effect=AssertionError):
+            response = asyncio.run(mdp.resolve_folder(request))
+
+        assert json.loads(response.body) == {"success": True, "folder": "loras"}  # type: ignore[arg-type]
+
+
+class TestResolveFolders:
+    def _post(self, body: Any) -> dict[str, Any]:
+        request = MagicMock()
+        request.json = AsyncMock(return_value=body)
+        response = asyncio.run(mdp.resolve_folders(request))
+        return json.loads(response.body)  # type: ignore[arg-type]
+
+    def test_describes_every_file_in_request_order(self, tmp_path, monkeypatch):
+        loras = tmp_path / "loras"
+        loras.mkdir()
+        (loras / "a.safetensors").write_bytes(b"12345")
+        monkeypatch.setattr(
+            mdp, "_filename_index", mdp.FilenameIndex(lambda: [("loras", [str(loras)])])
+        )
+
+        body = self._post({"filenames": ["missing.pt", "a.safetensors", "missing.pt"]})
+
+        assert body["success"] is True
+        assert body["files"] == [
+            {"filename": "missing.pt", "exists": False, "folder": None, "path": None, "size": None},
+            {
+                "filename": "a.safetensors",
+                "exists": True,
+                "folder": "loras",
+                "path": str(loras / "a.safetensors"),
+                "size": 5,
+            },
+            {"filename": "missing.pt", "exists": False, "folder": None, "path": None, "size": None},
+        ]
+
+    def test_builds_index_once_for_the_batch(self, tmp_path, monkeypatch):
+        index = mdp.FilenameIndex(lambda: [("loras", [str(tmp_path)])])
+        monkeypatch.setattr(mdp, "_filename_index", index)
+
+        with patch.object(index, "refresh", wraps=index.refresh) as refresh:
+            self._post({"filenames": [f"{i}.safetensors" for i in range(50)]})
+
+        refresh.assert_called_once()
+
+    def test_rejects_invalid_batches(self, monkeypatch):
+        monkeypatch.setattr(mdp, "MAX_RESOLVE_BATCH", 2)
+
+        assert self._post({"filenames": "a.pt"})["success"] is False
+        assert self._post({"filenames": ["a.pt", 3]})["success"] is False
+        assert self._post({"filenames": ["a", "b", "c"]})["success"] is False
+
+
+# ---------------------------------------------------------------------------
+# Tests: workflow prefetch
+# ---------------------------------------------------------------------------
+
+_LORA_URL = "https://huggingface.co/x/resolve/main/detail.safetensors"
+
+
+def _workflow() -> dict[str, Any]:
+    return {
+        "nodes": [
+            {"type": "CheckpointLoaderSimple", "widgets_values": ["sdxl\\base.safetensors"]},
+            {"type": "LoraLoader", "widgets_values": ["detail.safetensors", 1.0, 1.0]},
+            {"type": "Note", "widgets_values": ["just text"]},
+        ],
+        "models": [
+            {
+                "name": "detail.safetensors",
+                "url": _LORA_URL,
+                "directory": "loras",
+                "hash": "AB" * 32,
+                "hash_type": "SHA256",
+            }
+        ],
+        "definitions": {
+            "subgraphs": [{"nodes": [{"type": "VAELoader", "widgets_values": ["vae.safetensors"]}]}]
+        },
+    }
+
+
+class TestExtractModelReferences:
+    def test_ui_workflow_merges_metadata_and_widget_values(self):
+        references = {ref.name: ref for ref in mdp.extract_model_references(_workflow())}
+
+        assert sorted(references) == [
+            "detail.safetensors",
+            "sdxl/base.safetensors",
+            "vae.safetensors",
+        ]
+        lora = references["detail.safetensors"]
+        assert (lora.directory, lora.url, lora.sha256) == ("loras", _LORA_URL, "ab" * 32)
+        assert references["vae.safetensors"].url is None
+
+    def test_api_prompt_and_prompt_request_body(self):
+        prompt = {
+            "1": {"class_type": "UNETLoader", "inputs": {"unet_name": "flux.gguf", "dtype": "x"}},
+            "2": {"class_type": "KSampler", "inputs": {"seed": 1, "model": ["1", 0]}},
+        }
+
+        assert [r.name for r in mdp.extract_model_references(prompt)] == ["flux.gguf"]
+
+        body = {"prompt": prompt, "extra_data": {"extra_pnginfo": {"workflow": _workflow()}}}
+        names = {r.name for r in mdp.extract_model_references(body)}
+        assert "flux.gguf" in names
+        assert "detail.safetensors" in names
+
+    def test_ignores_paths_escaping_the_model_folder(self):
+        prompt = {"1": {"inputs": {"ckpt_name": "../../etc/x.safetensors"}}}
+
+        assert mdp.extract_model_references(prompt) == []
+
+
+class TestPrefetchWorkflow:
+    @pytest.fixture
+    def folders(self, tmp_path, monkeypatch):
+        checkpoints = tmp_path / "checkpoints"
+        (checkpoints / "sdxl").mkdir(parents=True)
+        (checkpoints / "sdxl" / "base.safetensors").write_bytes(b"12345678")
+        loras = tmp_path / "loras"
+        loras.mkdir()
+        paths = {"checkpoints": [str(checkpoints)], "loras": [str(loras)]}
+        monkeypatch.setattr(mdp, "_filename_index", mdp.FilenameIndex(lambda: list(paths.items())))
+        monkeypatch.setattr(_folder_paths_mock, "get_folder_paths", lambda name: paths[name])
+        return paths
+
+    def _post(
+        self,
+        payload: Any,
+        query: dict[str, str] | None = None,
+        *,
+        origin: _FakeOrigin | None = None,
+    ) -> dict[str, Any]:
+        request = MagicMock()
+        request.json = AsyncMock(return_value=payload)
+        request.query = query or {}
+        origin = origin or _FakeOrigin(b"x" * 2048)
+        with (
+            patch.object(mdp, "_get_session", return_value=origin),
+            patch.object(
+                _prompt_server_instance.loop,
+                "create_task",
+                MagicMock(side_effect=lambda coroutine: coroutine.close()),
+            ),
+        ):
+            response = asyncio.run(mdp.prefetch_workflow(request))
+        return json.loads(response.body)  # type: ignore[arg-type]
+
+    def test_plans_and_queues_missing_models(self, folders):
+        plan = self._post(_workflow())
+
+        assert [item["name"] for item in plan["existing"]] == ["sdxl/base.safetensors"]
+        assert plan["existing"][0]["size"] == 8
+        [download] = plan["downloads"]
+        assert download["name"] == "detail.safetensors"
+        assert download["status"] == "queued"
+        assert download["size"] == 2048
+        assert plan["unavailable"] == [
+            {"name": "vae.safetensors", "folder": None, "reason": "No download URL in workflow"}
+        ]
+        assert plan["total_bytes"] == 2048
+        entry = mdp.active_downloads[download["download_id"]]
+        assert entry.path == os.path.join(folders["loras"][0], "detail.safetensors")
+        assert entry.expected_sha256 == "ab" * 32
+
+    @pytest.mark.usefixtures("folders")
+    def test_dry_run_queues_nothing(self):
+        plan = self._post(_workflow(), {"dry_run": "1"})
+
+        assert plan["dry_run"] is True
+        assert plan["downloads"][0]["status"] == "missing"
+        assert "download_id" not in plan["downloads"][0]
+        assert mdp._scheduler.active_count == 0
+
+    @pytest.mark.usefixtures("folders")
+    def test_does_not_queue_a_model_twice(self):
+        first = self._post(_workflow())["downloads"][0]
+        second = self._post(_workflow())["downloads"][0]
+
+        assert second["download_id"] == first["download_id"]
+        assert mdp._scheduler.active_count == 1
+
+    @pytest.mark.usefixtures("folders")
+    def test_a_failing_probe_leaves_the_size_unknown(self):
+        workflow = _workflow()
+        workflow["nodes"].append({"type": "LoraLoader", "widgets_values": ["style.safetensors"]})
+        workflow["models"].append(
+            {"name": "style.safetensors", "url": _LORA_URL + "?loop", "directory": "loras"}
+        )
+        origin = _FakeOrigin(b"x" * 2048)
+        head = origin.head
+
+        def redirect_loop(url: str, **kwargs: Any) -> _FakeResponse:
+            if url.endswith("?loop"):
+                raise sys.modules["aiohttp"].TooManyRedirects(MagicMock(), ())
+            return head(url, **kwargs)
+
+        origin.head = redirect_loop  # type: ignore[method-assign]
+        plan = self._post(workflow, origin=origin)
+
+        sizes = {item["name"]: item["size"] for item in plan["downloads"]}
+        assert sizes == {"detail.safetensors": 2048, "style.safetensors": None}
+        assert {item["status"] for item in plan["downloads"]} == {"queued"}
+        assert plan["total_bytes"] == 2048
+        assert plan["unknown_sizes"] == 1
+
+    @pytest.mark.usefixtures("folders")
+    def test_estimates_time_from_recent_speeds(self, monkeypatch):
+        monkeypatch.setattr(mdp, "_recent_speeds", mdp.deque([1.0, 2.0, 100.0]))
+
+        assert mdp._estimate_seconds(4 * 1024 * 1024) == 2
+        assert self._post(_workflow())["estimated_seconds"] == 0
+
+
+# ---------------------------------------------------------------------------
+# Tests: remote metadata probes
+# ---------------------------------------------------------------------------
+
+
+class TestProbeUrls:
+    def _post(self, origin: _FakeOrigin, payload: Any) -> dict[str, Any]:
+        request = MagicMock()
+        request.json = AsyncMock(return_value=payload)
+        with patch.object(mdp, "_get_session", return_value=origin):
+            response = asyncio.run(mdp.probe_urls(request))
+        return json.loads(response.body)  # type: ignore[arg-type]
+
+    def test_reports_metadata_and_serves_repeats_from_cache(self):
+        origin = _FakeOrigin(b"x" * 2048, etag='"abc"')
+        origin.final_url = "https://cdn.example.com/m?X-Amz-Signature=secret"
+        urls = ["https://example.com/m", "https://example.com/m"]
+
+        first = self._post(origin, {"urls": urls})
+        second = self._post(origin, {"urls": urls})
+
+        [result, duplicate] = first["results"]
+        assert result == duplicate
+        assert result["size"] == 2048
+        assert result["etag"] == '"abc"'
+        assert result["accept_ranges"] is True
+        assert result["final_url"] == "https://cdn.example.com/m"
+        assert result["auth_required"] is False
+        assert result["cached"] is False
+        assert origin.heads == 1
+        assert second["results"][0]["cached"] is True
+
+        self._post(origin, {"urls": urls[:1], "refresh": True})
+        assert origin.heads == 2
+
+    def test_fresh_entries_are_served_offline(self):
+        self._post(_FakeOrigin(b"x" * 10), {"urls": ["https://example.com/m"]})
+        offline = _FakeOrigin(b"")
+        offline.head = MagicMock(side_effect=OSError("Network is unreachable"))
+
+        results = self._post(offline, {"urls": ["https://example.com/m", "https://example.com/n"]})
+
+        [cached, unreachable] = results["results"]
+        assert cached["size"] == 10
+        assert cached["cached"] is True
+        assert unreachable["error"] == "Request failed"
+        assert "size" not in unreachable
+
+    def test_a_failing_url_does_not_fail_the_batch(self):
+        origin = _FakeOrigin(b"x" * 10)
+        head = origin.head
+
+        def redirect_loop(url: str, **kwargs: Any) -> _FakeResponse:
+            if url.endswith("/loop"):
+                raise sys.modules["aiohttp"].TooManyRedirects(MagicMock(), ())
+            return head(url, **kwargs)
+
+        origin.head = redirect_loop  # type: ignore[method-assign]
+        urls = ["https://example.com/m", "https://example.com/loop"]
+
+        response = self._post(origin, {"urls": urls})
+
+        [found, failed] = response["results"]
+        assert response["success"] is True
+        assert found["size"] == 10
+        assert failed == {
+            "url": "https://example.com/loop",
+            "error": "Request failed",
+            "cached": False,
+        }
+
+    def test_gated_file_requires_auth(self):
+        origin = _FakeOrigin(b"")
+        origin.head_status = 401
+
+        [result] = self._post(origin, {"urls": ["https://example.com/gated"]})["results"]
+
+        assert result["auth_required"] is True
+        assert result["size"] is None
+
+    def test_expired_or_differently_authenticated_entries_are_ignored(self, state_dir):
+        record = {"status": 200, "size": 1, "authenticated": False}
+        mdp.record_metadata(str(state_dir), {"https://a/": record}, 3600, 0)
+        mdp.record_metadata(str(state_dir), {"https://b/": {**record, "status": 404}}, 3600, 0)
+
+        found = mdp.lookup_metadata(str(state_dir), {"https://a/": True, "https://b/": False})
+
+        assert found == {}
+
+    def test_rejects_bad_requests(self):
+        origin = _FakeOrigin(b"")
+        assert self._post(origin, {"urls": ["file:///etc/passwd"]})["success"] is False
+        too_many = ["https://example.com/m"] * (mdp.MAX_PROBE_BATCH + 1)
+        assert self._post(origin, {"urls": too_many})["success"] is False
+        assert origin.heads == 0
+
+    def test_download_skip_check_uses_cached_size(self, tmp_model_dir):
+        data = os.urandom(4096)
+        target = tmp_model_dir / "model.safetensors"
+        _run_download(_FakeOrigin(data), "dl_cached1", target)
+        origin = _FakeOrigin(data)
+
+        entry = _run_download(origin, "dl_cached2", target)
+
+        assert entry.status == "skipped"
+        assert origin.requests == []
+        assert origin.heads == 0
+
+
+# ---------------------------------------------------------------------------
+# Tests: mirrors and URL rewrites
+# ---------------------------------------------------------------------------
+
+
+def _real_aiohttp() -> tuple[Any, Any]:
+    """The installed aiohttp and aiohttp.web, even while the mocks are in place."""
+    if getattr(sys.modules["aiohttp"], "__file__", None):
+        return sys.modules["aiohttp"], sys.modules["aiohttp.web"]
+    mocks = {name: sys.modules.pop(name) for name in ("aiohttp", "aiohttp.web")}
+    try:
+        aiohttp = pytest.importorskip("aiohttp")
+        web = importlib.import_module("aiohttp.web")
+    finally:
+        sys.modules.update(mocks)
+    return aiohttp, web
+
+
+class _LiveServer:
+    """A local aiohttp server answering GETs from a path -> body mapping.
+
+    Seen request headers are kept in ``requests``. With ``chunk_delay`` set,
+    bodies are sent 16 KiB at a time with that many seconds in between.
+    """
+
+    def __init__(self, web: Any, files: dict[str, bytes], chunk_delay: float = 0.0) -> None:
+        self.web = web
+        self.files = files
+        self.chunk_delay = chunk_delay
+        self.requests: list[dict[str, str]] = []
+        self.url = ""
+        self._runner: Any = None
+
+    async def __aenter__(self) -> _LiveServer:
+        app = self.web.Application()
+        app.router.add_get("/{path:.*}", self._handle)
+        self._runner = self.web.AppRunner(app)
+        await self._runner.setup()
+        await self.web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        self.url = f"http://127.0.0.1:{self._runner.addresses[0][1]}"
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self._runner.cleanup()
+
+    async def _handle(self, request: Any) -> Any:
+        self.requests.append(dict(request.headers))
+        data = self.files.get(request.path)
+        if data is None:
+            return self.web.Response(status=404)
+        if not self.chunk_delay:
+            return self.web.Response(body=data)
+        response = self.web.StreamResponse(headers={"Content-Length": str(len(data))})
+        await response.prepare(request)
+        for i in range(0, len(data), 16 * 1024):
+            await response.write(data[i : i + 16 * 1024])
+            await asyncio.sleep(self.chunk_delay)
+        return response
+
+
+class TestMirrors:
+    def test_sources_try_rewrites_then_mirrors_then_origin(self):
+        mirrors = mdp.MirrorList(
+            mirrors=mdp.parse_mirrors("http://cache.lan:8080/, ftp://bad"),
+            rewrites=mdp.parse_rewrites("https://huggingface.co/=http://hf.lan/"),
+        )
+        url = "https://huggingface.co/org/m/resolve/main/m.st?download=1"
+
+        assert mirrors.sources(url) == [
+            "http://hf.lan/org/m/resolve/main/m.st?download=1",
+            "http://cache.lan:8080/huggingface.co/org/m/resolve/main/m.st?download=1",
+            url,
+        ]
+        assert mdp.MirrorList().sources(url) == [url]
+
+    def test_mirror_urls_drop_origin_userinfo(self):
+        mirrors = mdp.MirrorList(mirrors=["http://cache.lan"])
+        url = "https://user:pw@example.com:8443/m.st"
+
+        assert mirrors.sources(url)[0] == "http://cache.lan/example.com:8443/m.st"
+
+    def test_origin_credentials_only_go_to_trusted_mirrors(self, monkeypatch):
+        monkeypatch.setattr(
+            mdp,
+            "_mirrors",
+            mdp.MirrorList(mirrors=["https://proxy.lan"], auth_hosts={"proxy.lan"}),
+        )
+        url = "https://huggingface.co/m.st"
+        with patch.object(
+            mdp,
+            "_auth_headers_for_url",
+            side_effect=lambda u: {"Authorization": "t"} if u == url else {},
+        ):
+            assert mdp._source_headers(url, url) == {"Authorization": "t"}
+            trusted = mdp._source_headers(url, "https://proxy.lan/huggingface.co/m.st")
+            assert trusted == {"Authorization": "t"}
+            assert mdp._source_headers(url, "http://proxy.lan/huggingface.co/m.st") == {}
+            assert mdp._source_headers(url, "https://other.lan/huggingface.co/m.st") == {}
+
+    def test_min_rate_allows_for_bandwidth_caps(self, monkeypatch):
+        monkeypatch.setattr(mdp, "_limiter", mdp.BandwidthLimiter(host_rates={"cache.lan": 1024}))
+        assert mdp._mirror_min_rate("dl", "http://cache.lan/m") == 512
+        assert mdp._mirror_min_rate("dl", "http://other.lan/m") == mdp.MIRROR_MIN_RATE
+
+    def _download(
+        self, data: bytes, target, *, mirrored: bool, chunk_delay: float = 0.0
+    ) -> tuple[mdp.Download, _LiveServer, _LiveServer]:
+        """Download *data* from a live origin with a live mirror in front of it."""
+        aiohttp, web = _real_aiohttp()
+        origin = _LiveServer(web, {"/org/model.safetensors": data})
+        mirror = _LiveServer(web, {}, chunk_delay)
+        entry = _entry("dl_mirror", path=str(target))
+
+        async def run() -> None:
+            async with origin, mirror, aiohttp.ClientSession() as session:
+                url = f"{origin.url}/org/model.safetensors"
+                if mirrored:
+                    # Mirrors serve <base>/<origin host:port>/<path>
+                    mirror.files[url.removeprefix("http:/")] = data
+                token = {"Authorization": "Bearer t"}
+                with (
+                    patch.object(mdp, "_mirrors", mdp.MirrorList(mirrors=[mirror.url])),
+                    patch.object(
+                        mdp,
+                        "_auth_headers_for_url",
+                        side_effect=lambda u: token if u == url else {},
+                    ),
+                    patch.object(mdp, "_get_session", return_value=session),
+                    patch.object(mdp, "send_download_update", new_callable=AsyncMock),
+                ):
+                    await mdp.download_file("dl_mirror", url, str(target))
+
+        asyncio.run(run())
+        return entry, origin, mirror
+
+    def test_mirror_serves_download_without_origin_credentials(self, tmp_model_dir):
+        data = os.urandom(256 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+
+        entry, origin, mirror = self._download(data, target, mirrored=True)
+
+        assert entry.status == "completed"
+        assert target.read_bytes() == data
+        assert origin.requests == []
+        assert "Authorization" not in mirror.requests[0]
+
+    def test_mirror_miss_falls_back_to_origin(self, tmp_model_dir):
+        data = os.urandom(256 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+
+        entry, origin, mirror = self._download(data, target, mirrored=False)
+
+        assert entry.status == "completed"
+        assert target.read_bytes() == data
+        assert "Authorization" not in mirror.requests[0]
+        assert origin.requests[0]["Authorization"] == "Bearer t"
+
+    def test_slow_mirror_falls_back_to_origin(self, tmp_model_dir, monkeypatch):
+        monkeypatch.setattr(mdp, "MIRROR_GRACE_PERIOD", 0.0)
+        monkeypatch.setattr(mdp, "MIRROR_CHECK_INTERVAL", 0.2)
+        monkeypatch.setattr(mdp, "PROGRESS_INTERVAL", 0.05)
+        monkeypatch.setattr(mdp, "MIRROR_MIN_RATE", 10 * 1024 * 1024)
+        data = os.urandom(1024 * 1024)
+        target = tmp_model_dir / "model.safetensors"
+
+        entry, origin, mirror = self._download(data, target, mirrored=True, chunk_delay=0.05)
+
+        assert entry.status == "completed"
+        assert target.read_bytes() == data
+        assert len(mirror.requests) == 1
+        assert len(origin.requests) == 1
+
+
+# ---------------------------------------------------------------------------
+# Tests: node import
+# ---------------------------------------------------------------------------
+
+# Most the node's import may take at ComfyUI startup, in milliseconds
+IMPORT_BUDGET_MS = 50
+
+# Imports the node as ComfyUI does, in a fresh interpreter with minimal
+# stand-ins for server and folder_paths, and reports what the import did.
+# With "run" as argument the server's loop then runs briefly.
+_NODE_IMPORT_SCRIPT = """
+import asyncio, json, os, sys, time, types
+
+class Router:
+    def __init__(self):
+        self.paths = []
+    def routes(self):
+        return []
+    def add_get(self, path, handler):
+        self.paths.append(path)
+    add_post = add_get
+
+app = types.SimpleNamespace(router=Router(), on_cleanup=[])
+loop = asyncio.new_event_loop()
+server = types.ModuleType("server")
+server.PromptServer = types.SimpleNamespace(instance=types.SimpleNamespace(app=app, loop=loop))
+folder_paths = types.ModuleType("folder_paths")
+folder_paths.folder_names_and_paths = {}
+sys.modules.update(server=server, folder_paths=folder_paths)
+sys.path.insert(0, os.path.dirname(os.getcwd()))
+
+started = time.perf_counter()
+import model_downloader
+elapsed = time.perf_counter() - started
+if sys.argv[1:] == ["run"]:
+    loop.run_until_complete(asyncio.sleep(0.1))
+print(json.dumps({
+    "ms": elapsed * 1000,
+    "routes": app.router.paths,
+    "cleanup": len(app.on_cleanup),
+    "loaded": sorted(name for name in ("aiohttp", "model_downloader_patch") if name in sys.modules),
+}))
+"""
+
+
+def _import_node(*args: str) -> dict[str, Any]:
+    result = subprocess.run(
+        [sys.executable, "-c", _NODE_IMPORT_SCRIPT, *args],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=60,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+class TestNodeImport:
+    def test_registers_routes_without_loading_the_downloader(self):
+        report = _import_node()
+
+        assert "/model-downloader/download" in report["routes"]
+        assert report["cleanup"] == 1
+        assert report["loaded"] == []
+        assert report["ms"] < IMPORT_BUDGET_MS
+
+    def test_loads_the_downloader_at_startup_to_resume_downloads(self, state_dir):
+        _real_aiohttp()  # skips without aiohttp
+        mdp.save_journal(str(state_dir / "journal"), {"path": "/m", "state": mdp.STATE_RUNNING})
+
+        report = _import_node("run")
+
+        assert report["loaded"] == ["aiohttp", "model_downloader_patch"]
+
+    def test_failed_downloads_do_not_load_the_downloader(self, state_dir):
+        mdp.save_journal(str(state_dir / "journal"), {"path": "/m", "state": mdp.STATE_FAILED})
+
+        report = _import_node("run")
+
+        assert report["loaded"] == []